@@ -1,4 +1,4 @@
-import os, json, time, uuid, asyncio, threading, math
+import os, re, json, time, uuid, asyncio, threading, math, logging
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple, Callable
 from contextlib import asynccontextmanager
@@ -22,8 +22,9 @@ from services.config import (
     API_COSTS, MODEL_TO_ENDPOINT, SESSION_COST, PRICING_LOADED,
     RENDER_SEMAPHORE, VIDEO_SEMAPHORE, EXPORT_STATUS,
     require_key, fal_headers, now_iso, clamp, safe_float,
-    retry_on_502, track_cost, fetch_live_pricing, log_llm_call,
+    retry_on_502, track_cost, add_state_cost, fetch_live_pricing, log_llm_call,
     locked_render_models, locked_editor_key, locked_model_key,
+    get_logger, FAL_SESSION, OPENAI_SESSION, OPENAI_TRANSCRIPTIONS,
 )
 from services.project_service import (
     sanitize_filename,
@@ -33,6 +34,8 @@ from services.project_service import (
     download_image_locally,
     validate_against_schema, validate_shot, validate_sequence, validate_project_state,
     project_path, load_project, recover_orphaned_renders, save_project, new_project,
+    snapshot_project, write_project_snapshot, strip_transient_keys,
+    append_project_patches, replay_project_patches, shot_render_patch, costs_patch,
     list_projects, delete_project,
     normalize_structure_type,
     migrate_project_to_location,  # v1.8.5: Project migration
@@ -40,31 +43,34 @@ from services.project_service import (
 from services.audio_service import (
     get_audio_duration_librosa, get_audio_duration_mutagen, get_audio_duration,
     get_audio_bpm_librosa, build_beat_grid, snap_to_grid,
-    normalize_audio_understanding,
+    normalize_audio_understanding, warmup_audio_analysis, loads_fal_response,
+    hash_audio_file, audio_dna_cache_key, load_cached_audio_dna, store_cached_audio_dna,
+    analyze_local_audio,
 )
 from services.cast_service import (
     find_cast, cast_ref_urls, get_cast_refs_for_shot, get_lead_cast_ref,
     create_cast_visual_dna, update_cast_properties, update_cast_lora,
     delete_cast_from_state, set_character_refs, get_character_refs,
     get_scene_by_id, get_scene_for_shot, get_scene_decor_refs, get_scene_wardrobe,
-    get_identity_url, build_sorted_cast_info,
+    get_identity_url, build_sorted_cast_info, get_cast_index, set_cast_reference_images,
+    invalidate_cast_index, build_shot_plan, public_cast,
 )
 from services.render_service import (
     model_to_endpoint, call_txt2img, call_img2img_editor,
     resolve_render_path, build_shot_prompt, get_shot_ref_images,
     update_shot_render, get_pending_shots, get_render_stats,
     t2i_endpoint_and_payload, call_t2i_with_retry, energy_tokens, build_prompt,
-    save_fal_debug, prewarm_fal_upload_cache,
+    save_fal_debug, prewarm_fal_upload_cache, upload_file_to_fal,
 )
 from services.storyboard_service import (
     target_sequences_and_shots,
     create_sequence, find_sequence, update_sequence,
-    create_shot, find_shot, update_shot, delete_shot, get_shots_for_sequence,
+    create_shot, find_shot, get_shot_index, update_shot, delete_shot, get_shots_for_sequence,
     repair_timeline, validate_shots_coverage, get_cast_coverage,
 )
 from services.export_service import (
     update_export_status, get_export_status,
-    check_ffmpeg, export_video, export_video_with_img2vid,
+    check_ffmpeg, export_video, export_video_with_img2vid, FFMPEG_BIN, X264_PRESET,
 )
 from services.video_service import (
     call_img2vid_with_retry, generate_shot_video, generate_videos_for_shots,
@@ -110,6 +116,8 @@ PROJECT_STATES: Dict[str, Dict[str, Any]] = {}
 async def lifespan(app: FastAPI):
     # Startup: Fetch live pricing
     fetch_live_pricing()
+    # v1.8.8: JIT librosa's beat tracker in the background, off the request path
+    threading.Thread(target=warmup_audio_analysis, daemon=True).start()
     yield
     # Shutdown: cleanup if needed (currently none)
 
@@ -324,7 +332,7 @@ def _generate_wardrobe_ref_internal(project_id: str, scene_id: str, state: Dict,
     if ref_a.startswith("/renders/") or ref_a.startswith("/files/"):
         local_file = resolve_render_path(ref_a, state)
         if local_file.exists():
-            ref_url = fal_client.upload_file(str(local_file))
+            ref_url = upload_file_to_fal(local_file)
     
     # Build prompt: character in wardrobe with scene decor context
     style = state["project"]["style_preset"]
@@ -514,8 +522,8 @@ def api_create_project(payload: Dict[str,Any]):
 def api_get_project(project_id: str):
     # v1.8.5: Check in-memory first, then disk
     if project_id in PROJECT_STATES:
-        return PROJECT_STATES[project_id]
-    return get_project(project_id)
+        return strip_transient_keys(PROJECT_STATES[project_id])
+    return strip_transient_keys(get_project(project_id))
 
 @app.get("/api/project/{project_id}/validate")
 def api_validate_project(project_id: str):
@@ -873,6 +881,9 @@ def api_import_project(payload: Dict[str,Any]):
     # v1.6.5: Update version to current so saves aren't blocked
     payload["project"]["created_version"] = VERSION
 
+    # v1.8.8: Imported project.json may predate renders still in the patch log
+    replay_project_patches(payload)
+
     # v1.8.5: Store in memory for file serving from project_location
     project_id = payload["project"]["id"]
     PROJECT_STATES[project_id] = payload
@@ -945,6 +956,18 @@ async def api_audio(project_id: str, file: UploadFile = File(...), prompt: str =
     tmp_path = audio_dir / f"{original_name}{ext}"
     tmp_path.write_bytes(await file.read())
 
+    # v1.8.8: Same file + prompt + STT model analyzed before (any project) -> reuse the result
+    audio_digest = await asyncio.to_thread(hash_audio_file, tmp_path)
+    audio_expert = bool(state.get("project", {}).get("audio_expert"))
+    audio_cache_key = audio_dna_cache_key(audio_digest, prompt, "openai_expert" if audio_expert else "openai")
+    cached = load_cached_audio_dna(audio_cache_key)
+    if cached:
+        print(f"[INFO] Audio DNA cache hit ({audio_digest[:12]}), skipping analysis")
+        state["audio_dna"] = cached["audio_dna"]
+        state["audio_file_path"] = str(tmp_path)
+        save_project(state)
+        return cached
+
     # ---- OpenAI upload size guard (OpenAI STT hard limit ~25MB) ----
     def _ensure_openai_uploadable(_p: Path) -> Path:
         max_bytes = 25 * 1024 * 1024  # 25MB hard cap (safety: we stay under)
@@ -956,13 +979,13 @@ async def api_audio(project_id: str, file: UploadFile = File(...), prompt: str =
             return _p
         if size <= limit:
             return _p
-        import shutil as _shutil, subprocess as _subprocess
-        if _shutil.which("ffmpeg") is None:
+        import subprocess as _subprocess
+        if not check_ffmpeg():
             raise HTTPException(status_code=500, detail=f"OpenAI STT requires upload <=25MB but file is {size} bytes and ffmpeg is not available to transcode.")
         out_mp3 = _p.with_suffix(".openai.mp3")
         # Try a couple of bitrates until we're safely under the limit
         for br in ("128k", "96k", "64k"):
-            cmd = ["ffmpeg", "-y", "-i", str(_p), "-ac", "1", "-ar", "16000", "-b:a", br, str(out_mp3)]
+            cmd = [FFMPEG_BIN, "-y", "-i", str(_p), "-ac", "1", "-ar", "16000", "-b:a", br, str(out_mp3)]
             proc = _subprocess.run(cmd, capture_output=True, text=True)
             if proc.returncode != 0:
                 continue
@@ -975,63 +998,24 @@ async def api_audio(project_id: str, file: UploadFile = File(...), prompt: str =
         # If we still exceed the limit, give a clear error.
         raise HTTPException(status_code=413, detail=f"Audio file too large for OpenAI STT even after transcoding. Original={size} bytes, transcoded={out_mp3.stat().st_size if out_mp3.exists() else 'n/a'} bytes.")
 
-    openai_audio_path = _ensure_openai_uploadable(tmp_path)
-
-
-    # v1.4: Get accurate duration using librosa/mutagen BEFORE fal.ai call
-    local_duration = get_audio_duration(str(tmp_path))
-    print(f"[INFO] Local audio duration: {local_duration}s")
-    
-    # v1.5.8: Get accurate BPM using librosa beat tracking
-    local_bpm = get_audio_bpm_librosa(str(tmp_path))
-    if local_bpm:
-        print(f"[INFO] Local BPM detection (librosa): {local_bpm}")
-    else:
-        print(f"[WARN] Local BPM detection failed, will use FAL")
+    openai_audio_path = await asyncio.to_thread(_ensure_openai_uploadable, tmp_path)
 
     fal_upload_path = tmp_path
     if openai_audio_path != tmp_path:
         fal_upload_path = openai_audio_path
         print(f"[INFO] Using transcoded audio for FAL AU upload: {fal_upload_path.name}")
 
-    try:
-        audio_url = fal_client.upload_file(str(fal_upload_path))
-    except Exception as e:
-        return JSONResponse({"error":"fal upload_file failed","detail":str(e)}, status_code=502)
-
-    audio_payload = {"audio_url":audio_url, "prompt":prompt}
-    try:
-        r = requests.post(FAL_AUDIO, headers=fal_headers(), json=audio_payload, timeout=300)
-    except requests.exceptions.RequestException as e:
-        error_msg = f"Audio understanding network error: {type(e).__name__}: {str(e)[:200]}"
-        print(f"[ERROR] {error_msg}")
-        return JSONResponse({"error": error_msg}, status_code=502)
-    
-    # v1.5.1: Track cost based on duration ($0.01 per 5 seconds)
-    duration_for_cost = local_duration or 180  # Fallback to 3 min estimate
-    audio_cost_units = max(1, int(duration_for_cost / 5))  # 5-second units
-    track_cost("fal-ai/audio-understanding", audio_cost_units, state=state)
-    
-    if r.status_code >= 300:
-        return JSONResponse({"error":"fal audio-understanding failed","status":r.status_code,"body":r.text}, status_code=502)
-
-    raw = r.json()
-    # Log audio understanding call
-    save_fal_debug("audio_understanding", FAL_AUDIO, audio_payload, raw, project_id)
-    audio_dna = normalize_audio_understanding(raw)
-
     # ===== Lyrics: OpenAI Speech-to-Text (2-pass: transcript + timestamps) =====
     # Pass 1 (quality text): gpt-4o-mini-transcribe by default, gpt-4o-transcribe in Audio Expert mode
     # Pass 2 (timestamps): whisper-1 verbose_json segments
     require_key("OPENAI_KEY", OPENAI_KEY)
-    stt_text_model = "gpt-4o-transcribe" if state.get("project", {}).get("audio_expert") else "gpt-4o-mini-transcribe"
+    stt_text_model = "gpt-4o-transcribe" if audio_expert else "gpt-4o-mini-transcribe"
     stt_ts_model = "whisper-1"
+    stt_result: Dict[str, Any] = {}
+    stt_passes: List[str] = []
+    stt_stop = threading.Event()
 
-    # Cost units for OpenAI STT are tracked in minutes (rounded up)
-    duration_for_stt = local_duration or (audio_dna.get("duration_sec") or 180)
-    stt_minutes = max(1, int(math.ceil(float(duration_for_stt) / 60.0)))
-
-    try:
+    def _transcribe_lyrics() -> None:
         # ---- Pass 1: full transcript (no timestamps supported on 4o-transcribe models) ----
         with open(openai_audio_path, "rb") as _f:
             _headers = {"Authorization": f"Bearer {OPENAI_KEY}"}
@@ -1042,15 +1026,17 @@ async def api_audio(project_id: str, file: UploadFile = File(...), prompt: str =
                 "prompt": "This is sung song lyrics. Transcribe ALL words, including repeated choruses. Do not omit lines.",
             }
             _files = {"file": _f}
-            _stt1 = requests.post("https://api.openai.com/v1/audio/transcriptions", headers=_headers, data=_data, files=_files, timeout=300)
+            _stt1 = OPENAI_SESSION.post(OPENAI_TRANSCRIPTIONS, headers=_headers, data=_data, files=_files, timeout=300)
 
         if _stt1.status_code >= 300:
             raise Exception(f"OpenAI STT (pass1) failed: {_stt1.status_code} - {_stt1.text[:200]}")
         _stt1_json = _stt1.json() if _stt1.headers.get("content-type","").startswith("application/json") else {"text": _stt1.text}
         _full_text = (_stt1_json.get("text") or "").strip()
-        audio_dna["lyrics_full_text"] = _full_text
-        audio_dna["lyrics_full_text_source"] = stt_text_model
-        track_cost(stt_text_model, stt_minutes, state=state, note="lyrics_full_text")
+        stt_result["lyrics_full_text"] = _full_text
+        stt_result["lyrics_full_text_source"] = stt_text_model
+        stt_passes.append("pass1")
+        if stt_stop.is_set():
+            return  # Request already failed - don't start (and pay for) pass 2
 
         # ---- Pass 2: timestamps via whisper-1 verbose_json segments ----
         with open(openai_audio_path, "rb") as _f:
@@ -1063,27 +1049,97 @@ async def api_audio(project_id: str, file: UploadFile = File(...), prompt: str =
                 "timestamp_granularities[]": ["segment"],
             }
             _files = {"file": _f}
-            _stt2 = requests.post("https://api.openai.com/v1/audio/transcriptions", headers=_headers, data=_data, files=_files, timeout=300)
+            _stt2 = OPENAI_SESSION.post(OPENAI_TRANSCRIPTIONS, headers=_headers, data=_data, files=_files, timeout=300)
 
         if _stt2.status_code >= 300:
             raise Exception(f"OpenAI STT (pass2) failed: {_stt2.status_code} - {_stt2.text[:200]}")
         _stt2_json = _stt2.json()
         _segments = _stt2_json.get("segments") or []
-        audio_dna["lyrics"] = [
+        stt_result["lyrics"] = [
             {"start": safe_float(s.get("start"), None), "end": safe_float(s.get("end"), None), "text": (s.get("text") or "").strip()}
             for s in _segments
             if (s.get("text") or "").strip()
         ]
-        audio_dna["lyrics_source"] = stt_ts_model
-        audio_dna["openai_stt"] = {
+        stt_result["lyrics_source"] = stt_ts_model
+        stt_result["openai_stt"] = {
             "pass1_model": stt_text_model,
             "pass2_model": stt_ts_model,
             "pass1_has_text": bool(_full_text),
-            "pass2_segments": len(audio_dna["lyrics"]),
+            "pass2_segments": len(stt_result["lyrics"]),
         }
-        track_cost(stt_ts_model, stt_minutes, state=state, note="lyrics_timestamps")
-    except Exception as e:
-        print(f"[WARN] OpenAI STT error: {e}")
+        stt_passes.append("pass2")
+
+    # v1.8.8: Local duration/BPM (CPU) and STT (network) run while FAL upload + understanding is in flight
+    local_task = asyncio.create_task(asyncio.to_thread(analyze_local_audio, str(tmp_path)))
+    stt_task = asyncio.create_task(asyncio.to_thread(_transcribe_lyrics))
+    stt_settled = False
+
+    async def _settle_stt(duration_sec: float) -> None:
+        """Wait for STT and track the cost of every pass that ran (once)."""
+        nonlocal stt_settled
+        try:
+            await stt_task
+        except Exception as e:
+            print(f"[WARN] OpenAI STT error: {e}")
+        if stt_settled:
+            return
+        stt_settled = True
+        # Cost units for OpenAI STT are tracked in minutes (rounded up)
+        stt_minutes = max(1, int(math.ceil(float(duration_sec) / 60.0)))
+        if "pass1" in stt_passes:
+            track_cost(stt_text_model, stt_minutes, state=state, note="lyrics_full_text")
+        if "pass2" in stt_passes:
+            track_cost(stt_ts_model, stt_minutes, state=state, note="lyrics_timestamps")
+
+    try:
+        try:
+            audio_url = await asyncio.to_thread(upload_file_to_fal, fal_upload_path)
+        except Exception as e:
+            return JSONResponse({"error":"fal upload_file failed","detail":str(e)}, status_code=502)
+
+        audio_payload = {"audio_url":audio_url, "prompt":prompt}
+        try:
+            r = await asyncio.to_thread(FAL_SESSION.post, FAL_AUDIO, headers=fal_headers(), json=audio_payload, timeout=300)
+        except requests.exceptions.RequestException as e:
+            error_msg = f"Audio understanding network error: {type(e).__name__}: {str(e)[:200]}"
+            print(f"[ERROR] {error_msg}")
+            return JSONResponse({"error": error_msg}, status_code=502)
+
+        local_duration, local_bpm = await local_task
+        print(f"[INFO] Local audio duration: {local_duration}s")
+        if local_bpm:
+            print(f"[INFO] Local BPM detection (librosa): {local_bpm}")
+        else:
+            print(f"[WARN] Local BPM detection failed, will use FAL")
+        
+        # v1.5.1: Track cost based on duration ($0.01 per 5 seconds)
+        duration_for_cost = local_duration or 180  # Fallback to 3 min estimate
+        audio_cost_units = max(1, int(duration_for_cost / 5))  # 5-second units
+        track_cost("fal-ai/audio-understanding", audio_cost_units, state=state)
+        
+        if r.status_code >= 300:
+            return JSONResponse({"error":"fal audio-understanding failed","status":r.status_code,"body":r.text}, status_code=502)
+
+        raw = loads_fal_response(r)
+        # Log audio understanding call
+        save_fal_debug("audio_understanding", FAL_AUDIO, audio_payload, raw, project_id)
+        audio_dna = normalize_audio_understanding(raw, keep_raw=False)
+
+        await _settle_stt(local_duration or (audio_dna.get("duration_sec") or 180))
+    finally:
+        # v1.8.8: On any early return/error, stop STT before pass 2, collect both
+        # background tasks (no orphaned threads or unretrieved exceptions) and
+        # still record the STT passes that were billed
+        if not stt_settled:
+            stt_stop.set()
+            local = (await asyncio.gather(local_task, return_exceptions=True))[0]
+            duration_for_stt = (local[0] if isinstance(local, tuple) else None) or 180
+            await _settle_stt(duration_for_stt)
+            if stt_passes:
+                save_project(state)
+
+    audio_dna.update(stt_result)
+    if "pass2" not in stt_passes:
         # Keep whatever lyrics FAL provided
         audio_dna.setdefault("lyrics", [])
         audio_dna["lyrics_source"] = "openai_failed_fallback_fal"
@@ -1123,7 +1179,10 @@ async def api_audio(project_id: str, file: UploadFile = File(...), prompt: str =
     state["audio_dna"] = audio_dna
     state["audio_file_path"] = str(tmp_path)  # v1.4: Store local path
     save_project(state)
-    return {"audio_url": audio_url, "audio_dna": audio_dna, "local_duration": local_duration}
+    result = {"audio_url": audio_url, "audio_dna": audio_dna, "local_duration": local_duration}
+    if "pass2" in stt_passes:  # Don't pin an STT fallback in the cache
+        store_cached_audio_dna(audio_cache_key, result)
+    return result
 
 # v1.5.8: Update BPM manually
 @app.patch("/api/project/{project_id}/audio/bpm")
@@ -1213,7 +1272,7 @@ async def api_cast(project_id: str, file: UploadFile = File(...), role: str = Fo
     tmp_path.write_bytes(file_bytes)
 
     try:
-        fal_url = fal_client.upload_file(str(tmp_path))
+        fal_url = upload_file_to_fal(tmp_path)
         # Clean up temp file
         tmp_path.unlink(missing_ok=True)
     except Exception as e:
@@ -1231,8 +1290,9 @@ async def api_cast(project_id: str, file: UploadFile = File(...), role: str = Fo
         },
     }
     state["cast"].append(visual_dna)
+    invalidate_cast_index(state)
     save_project(state)
-    return {"cast_added": visual_dna}
+    return {"cast_added": public_cast(visual_dna)}
 
 @app.post("/api/project/{project_id}/cast/{cast_id}/ref")
 async def api_cast_add_ref(project_id: str, cast_id: str, file: UploadFile = File(...)):
@@ -1251,14 +1311,14 @@ async def api_cast_add_ref(project_id: str, cast_id: str, file: UploadFile = Fil
     tmp_path.write_bytes(await file.read())
 
     try:
-        img_url = fal_client.upload_file(str(tmp_path))
+        img_url = upload_file_to_fal(tmp_path)
     except Exception as e:
         return JSONResponse({"error":"fal upload_file failed","detail":str(e)}, status_code=502)
 
     refs.append({"url": img_url, "role": "ref", "notes": ""})
-    cast["reference_images"] = refs
+    set_cast_reference_images(cast, refs)
     save_project(state)
-    return {"cast_updated": cast}
+    return {"cast_updated": public_cast(cast)}
 
 @app.post("/api/project/{project_id}/cast/{cast_id}/lora")
 def api_cast_set_lora(project_id: str, cast_id: str, payload: Dict[str,Any]):
@@ -1279,7 +1339,7 @@ def api_cast_set_lora(project_id: str, cast_id: str, payload: Dict[str,Any]):
     cast["conditioning"] = cond
 
     save_project(state)
-    return {"cast_updated": cast}
+    return {"cast_updated": public_cast(cast)}
 
 @app.patch("/api/project/{project_id}/cast/{cast_id}")
 def api_cast_update(project_id: str, cast_id: str, payload: Dict[str,Any]):
@@ -1300,7 +1360,7 @@ def api_cast_update(project_id: str, cast_id: str, payload: Dict[str,Any]):
         cast["prompt_extra"] = str(payload["prompt_extra"]).strip()
 
     save_project(state)
-    return {"cast_updated": cast}
+    return {"cast_updated": public_cast(cast)}
 
 @app.post("/api/project/{project_id}/cast/{cast_id}/image")
 async def api_cast_update_image(project_id: str, cast_id: str, file: UploadFile = File(...)):
@@ -1330,7 +1390,7 @@ async def api_cast_update_image(project_id: str, cast_id: str, file: UploadFile
     tmp_path.write_bytes(file_bytes)
 
     try:
-        fal_url = fal_client.upload_file(str(tmp_path))
+        fal_url = upload_file_to_fal(tmp_path)
         tmp_path.unlink(missing_ok=True)
     except Exception as e:
         return JSONResponse({"error": "fal upload_file failed", "detail": str(e)}, status_code=502)
@@ -1341,7 +1401,7 @@ async def api_cast_update_image(project_id: str, cast_id: str, file: UploadFile
         refs[0] = {"url": local_url, "fal_url": fal_url, "role": "primary_face", "notes": ""}
     else:
         refs.append({"url": local_url, "fal_url": fal_url, "role": "primary_face", "notes": ""})
-    cast["reference_images"] = refs
+    set_cast_reference_images(cast, refs)
     
     save_project(state)
     return {"cast_id": cast_id, "image_updated": local_url}
@@ -1352,18 +1412,9 @@ def api_cast_delete(project_id: str, cast_id: str):
     """Delete a cast member from the project."""
     state = get_project(project_id)
     
-    cast_list = state.get("cast", [])
-    original_len = len(cast_list)
-    state["cast"] = [c for c in cast_list if c.get("cast_id") != cast_id]
-    
-    if len(state["cast"]) == original_len:
+    if not delete_cast_from_state(state, cast_id):
         raise HTTPException(404, "Cast member not found")
     
-    # Also remove from character_refs
-    char_refs = state.get("cast_matrix", {}).get("character_refs", {})
-    if cast_id in char_refs:
-        del char_refs[cast_id]
-    
     save_project(state)
     return {"deleted": cast_id}
 
@@ -1561,7 +1612,7 @@ async def api_cast_upload_ref(project_id: str, cast_id: str, ref_type: str, file
         raise HTTPException(400, "ref_type must be 'a' or 'b'")
     
     state = get_project(project_id)
-    cast = next((c for c in state.get("cast", []) if c.get("cast_id") == cast_id), None)
+    cast = get_cast_index(state).get(cast_id)
     if not cast:
         raise HTTPException(404, "Cast member not found")
     
@@ -1898,7 +1949,7 @@ def api_castmatrix_edit_decor_alt(project_id: str, scene_id: str, payload: Dict[
     if current_image.startswith("/renders/") or current_image.startswith("/files/"):
         local_file = PATH_MANAGER.from_url(current_image, state)
         if local_file.exists():
-            uploaded_url = fal_client.upload_file(str(local_file))
+            uploaded_url = upload_file_to_fal(local_file)
         else:
             raise HTTPException(400, "Alt decor image file not found")
     else:
@@ -1911,7 +1962,7 @@ def api_castmatrix_edit_decor_alt(project_id: str, scene_id: str, payload: Dict[
         if ref_image.startswith("/renders/") or ref_image.startswith("/files/"):
             ref_file = PATH_MANAGER.from_url(ref_image, state)
             if ref_file.exists():
-                image_refs.append(fal_client.upload_file(str(ref_file)))
+                image_refs.append(upload_file_to_fal(ref_file))
         else:
             image_refs.append(ref_image)
     
@@ -1977,7 +2028,7 @@ def api_castmatrix_edit_scene(project_id: str, scene_id: str, payload: Dict[str,
     if current_image.startswith("/renders/") or current_image.startswith("/files/"):
         local_file = PATH_MANAGER.from_url(current_image, state)
         if local_file.exists():
-            uploaded_url = fal_client.upload_file(str(local_file))
+            uploaded_url = upload_file_to_fal(local_file)
         else:
             raise HTTPException(400, "Scene image file not found")
     else:
@@ -1990,7 +2041,7 @@ def api_castmatrix_edit_scene(project_id: str, scene_id: str, payload: Dict[str,
         if ref_image.startswith("/renders/") or ref_image.startswith("/files/"):
             ref_file = PATH_MANAGER.from_url(ref_image, state)
             if ref_file.exists():
-                image_refs.append(fal_client.upload_file(str(ref_file)))
+                image_refs.append(upload_file_to_fal(ref_file))
         else:
             image_refs.append(ref_image)
     
@@ -2155,7 +2206,7 @@ def api_castmatrix_edit_wardrobe(project_id: str, scene_id: str, payload: Dict[s
     if current_image.startswith("/renders/") or current_image.startswith("/files/"):
         local_file = PATH_MANAGER.from_url(current_image, state)
         if local_file.exists():
-            uploaded_url = fal_client.upload_file(str(local_file))
+            uploaded_url = upload_file_to_fal(local_file)
         else:
             raise HTTPException(400, "Wardrobe image file not found")
     else:
@@ -2168,7 +2219,7 @@ def api_castmatrix_edit_wardrobe(project_id: str, scene_id: str, payload: Dict[s
         if ref_image.startswith("/renders/") or ref_image.startswith("/files/"):
             ref_file = PATH_MANAGER.from_url(ref_image, state)
             if ref_file.exists():
-                image_refs.append(fal_client.upload_file(str(ref_file)))
+                image_refs.append(upload_file_to_fal(ref_file))
         else:
             image_refs.append(ref_image)
     
@@ -3028,6 +3079,14 @@ def api_prewarm_fal_cache(project_id: str):
     }
 
 # ========= API: Render shot =========
+# v1.8.8: Render/edit handlers log via "frepathe.render" (level from LOG_LEVEL env var)
+log = get_logger("frepathe.render")
+
+# v1.8.8: Close-up detection for ref_b selection (one case-insensitive scan)
+CLOSEUP_RE = re.compile(r"close[- ]?up|portrait|head ?shot|face|eyes", re.IGNORECASE)
+# v1.8.8: Local URL prefixes that must be uploaded to FAL (single str.startswith call)
+LOCAL_URL_PREFIXES = ("/renders/", "/files/")
+
 @app.post("/api/project/{project_id}/shot/{shot_id}/render")
 def api_render_shot(project_id: str, shot_id: str, payload: Dict[str, Any] = None):
     """v1.4: Render shot using img2img with scene decor + cast reference images (both A and B), save locally."""
@@ -3036,43 +3095,56 @@ def api_render_shot(project_id: str, shot_id: str, payload: Dict[str, Any] = Non
 
     # v1.8.2: Get optional MASTER prompt (appended in CAPS)
     payload = payload or {}
-    master_prompt = payload.get("master_prompt", "").strip()
+    master_prompt = payload.get("master_prompt", "")
 
-    shots = state.get("storyboard", {}).get("shots", [])
-    shot = next((s for s in shots if s.get("shot_id")==shot_id), None)
+    shot = get_shot_index(state).get(shot_id)
     if not shot:
         raise HTTPException(404, "Shot not found")
 
+    return render_shot_core(project_id, state, shot, build_shot_plan(state, [shot])[shot_id], master_prompt)
+
+
+def render_shot_core(
+    project_id: str,
+    state: Dict[str, Any],
+    shot: Dict[str, Any],
+    plan: Dict[str, Any],
+    master_prompt: str = ""
+) -> Dict[str, Any]:
+    """
+    v1.8.8: Render one shot from an already loaded project state.
+    plan is the shot's build_shot_plan() entry (scene, decor/wardrobe refs, ref_a/ref_b
+    per cast member), so a render batch resolves those once instead of per shot.
+    """
+    shot_id = shot["shot_id"]
+    master_prompt = (master_prompt or "").strip()
     prompt = build_prompt(state, shot)
     aspect = state["project"]["aspect"]
-    print(f"[INFO] Rendering shot {shot_id}: aspect={aspect}")
+    log.info("Rendering shot %s: aspect=%s", shot_id, aspect)
 
     # v1.8.2: Append MASTER prompt in UPPERCASE if provided
     if master_prompt:
         prompt = f"{prompt}, {master_prompt.upper()}"
-        print(f"[INFO] Using MASTER prompt: {master_prompt.upper()[:50]}...")
+        log.info("Using MASTER prompt: %.50s...", master_prompt.upper())
     
-    # v1.7.1: Wardrobe cascade: shot.wardrobe[cast_id] > scene.wardrobe > cast.prompt_extra
+    # v1.8.8: Scene and character refs come from the precomputed shot plan
     cast_ids = shot.get("cast") or []
-    cast_list = state.get("cast", [])
+    render_cast_ids = cast_ids[:2]
+    cast_by_id = get_cast_index(state)
+    cast_refs = plan["cast_refs"]
+    seq_idx = plan["seq_idx"]
+    scene = plan["scene"]
 
+    # v1.7.1: Wardrobe cascade: shot.wardrobe[cast_id] > scene.wardrobe > cast.prompt_extra
     # Get scene wardrobe (applies to all cast in scene unless overridden)
-    scene_wardrobe = None
-    seq_id = shot.get("sequence_id")
-    if seq_id:
-        sequences = state.get("storyboard", {}).get("sequences", [])
-        seq_idx = next((i for i, s in enumerate(sequences) if s.get("sequence_id") == seq_id), None)
-        if seq_idx is not None:
-            scenes = state.get("cast_matrix", {}).get("scenes", [])
-            if seq_idx < len(scenes):
-                scene_wardrobe = scenes[seq_idx].get("wardrobe", "").strip()
+    scene_wardrobe = plan["wardrobe"]
 
     # v1.7.1: Shot-level wardrobe per character (overrides scene wardrobe)
     shot_wardrobes = shot.get("wardrobe") or {}  # Dict of {cast_id: "wardrobe description"}
 
     # Apply wardrobe per cast member with cascade
-    for cast_id in cast_ids[:2]:
-        cast_member = next((c for c in cast_list if c.get("cast_id") == cast_id), None)
+    for cast_id in render_cast_ids:
+        cast_member = cast_by_id.get(cast_id)
         if not cast_member:
             continue
 
@@ -3080,99 +3152,88 @@ def api_render_shot(project_id: str, shot_id: str, payload: Dict[str, Any] = Non
         if shot_wardrobes.get(cast_id):
             wardrobe_text = shot_wardrobes[cast_id].strip()
             prompt = f"{prompt}, {cast_member.get('name', cast_id)}: {wardrobe_text}"
-            print(f"[INFO] Using shot wardrobe override for {cast_id}: {wardrobe_text[:40]}...")
+            log.info("Using shot wardrobe override for %s: %.40s...", cast_id, wardrobe_text)
         # Priority 2: Scene-wide wardrobe (applies to all cast in scene)
         elif scene_wardrobe:
             prompt = f"{prompt}, {cast_member.get('name', cast_id)}: {scene_wardrobe}"
-            print(f"[INFO] Using scene wardrobe for {cast_id}: {scene_wardrobe[:40]}...")
+            log.info("Using scene wardrobe for %s: %.40s...", cast_id, scene_wardrobe)
         # Priority 3: Fallback to cast default prompt_extra
         elif cast_member.get("prompt_extra"):
             prompt = f"{prompt}, {cast_member['prompt_extra']}"
-            print(f"[INFO] Using cast prompt_extra for {cast_id}")
+            log.info("Using cast prompt_extra for %s", cast_id)
     
     # Collect reference images (convert local paths to full URLs for fal.ai)
     ref_images = []
+    add_ref = ref_images.append  # v1.8.8: bound once for the ref loops below
     
     # v1.8.3: NO style lock - pure cast + scene refs only
     
     # 1. Get scene decor_refs for this shot's sequence
-    seq_id = shot.get("sequence_id")
-    seq_idx = None
-    if seq_id:
-        sequences = state.get("storyboard", {}).get("sequences", [])
-        seq_idx = next((i for i, s in enumerate(sequences) if s.get("sequence_id") == seq_id), None)
-
-    if seq_id and seq_idx is not None:
-        scenes = state.get("cast_matrix", {}).get("scenes", [])
-        if seq_idx < len(scenes):
-            scene = scenes[seq_idx]
-            # Add decor ref
-            decor_refs = scene.get("decor_refs") or []
-            for dref in decor_refs[:1]:  # Use first scene render
-                if dref and not dref.startswith("/renders/") and not dref.startswith("/files/"):
-                    ref_images.append(dref)
-                elif dref and (dref.startswith("/renders/") or dref.startswith("/files/")):
-                    local_file = resolve_render_path(dref, state)
-                    if local_file.exists():
-                        try:
-                            uploaded_url = fal_client.upload_file(str(local_file))
-                            ref_images.append(uploaded_url)
-                            print(f"[INFO] Added decor ref for scene {seq_idx}")
-                        except:
-                            pass
-            
-            # v1.7.0: Add wardrobe_ref for outfit consistency
-            wardrobe_ref = scene.get("wardrobe_ref")
-            if wardrobe_ref:
-                if not wardrobe_ref.startswith("/renders/") and not wardrobe_ref.startswith("/files/"):
-                    ref_images.append(wardrobe_ref)
-                    print(f"[INFO] Added wardrobe ref (external URL)")
-                else:
-                    local_file = resolve_render_path(wardrobe_ref, state)
-                    if local_file.exists():
-                        try:
-                            uploaded_url = fal_client.upload_file(str(local_file))
-                            ref_images.append(uploaded_url)
-                            print(f"[INFO] Added wardrobe ref for scene {seq_idx}")
-                        except Exception as e:
-                            print(f"[WARN] Failed to upload wardrobe ref: {e}")
-    
+    if scene is not None:
+        # Add decor ref
+        for dref in plan["decor_refs"][:1]:  # Use first scene render
+            if not dref:
+                continue
+            if not dref.startswith(LOCAL_URL_PREFIXES):
+                add_ref(dref)
+            else:
+                local_file = resolve_render_path(dref, state)
+                if local_file.exists():
+                    try:
+                        uploaded_url = upload_file_to_fal(local_file)
+                        add_ref(uploaded_url)
+                        log.info("Added decor ref for scene %s", seq_idx)
+                    except:
+                        pass
+
+        # v1.7.0: Add wardrobe_ref for outfit consistency
+        wardrobe_ref = plan["wardrobe_ref"]
+        if wardrobe_ref:
+            if not wardrobe_ref.startswith(LOCAL_URL_PREFIXES):
+                add_ref(wardrobe_ref)
+                log.info("Added wardrobe ref (external URL)")
+            else:
+                local_file = resolve_render_path(wardrobe_ref, state)
+                if local_file.exists():
+                    try:
+                        uploaded_url = upload_file_to_fal(local_file)
+                        add_ref(uploaded_url)
+                        log.info("Added wardrobe ref for scene %s", seq_idx)
+                    except Exception as e:
+                        log.warning("Failed to upload wardrobe ref: %s", e)
+
     # 2. v1.7.0: Select ref_a (full body) or ref_b (close-up) based on shot's camera_language
-    camera_lang = (shot.get("camera_language") or "").lower()
-    use_closeup = any(kw in camera_lang for kw in ["close-up", "closeup", "close up", "portrait", "head shot", "headshot", "face", "eyes"])
+    camera_lang = shot.get("camera_language") or ""
+    use_closeup = bool(CLOSEUP_RE.search(camera_lang))
     ref_key = "ref_b" if use_closeup else "ref_a"
-    print(f"[INFO] Shot {shot_id} cast={cast_ids}, camera='{camera_lang}' -> using {ref_key}")
+    log.info("Shot %s cast=%s, camera='%s' -> using %s", shot_id, cast_ids, camera_lang, ref_key)
     
-    char_refs = state.get("cast_matrix", {}).get("character_refs", {})
-    print(f"[DEBUG] Available char_refs: {list(char_refs.keys())}")
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("Shot cast_refs: %s", list(cast_refs))
     
-    for cast_id in cast_ids[:2]:
-        refs = char_refs.get(cast_id, {})
-        if not refs:
-            print(f"[WARN] No refs found for cast_id={cast_id}")
-            continue
-            
-        ref_url = refs.get(ref_key) or refs.get("ref_a")  # Fallback to ref_a if ref_b missing
+    for cast_id in render_cast_ids:
+        # Fallback to ref_a if ref_b missing
+        ref_url = (plan["closeup_refs"].get(cast_id) if use_closeup else None) or cast_refs.get(cast_id)
         if not ref_url:
-            print(f"[WARN] No {ref_key} or ref_a URL for cast_id={cast_id}")
+            log.warning("No %s or ref_a URL for cast_id=%s", ref_key, cast_id)
             continue
             
-        print(f"[DEBUG] Cast {cast_id} {ref_key} URL: {ref_url[:60]}...")
+        log.debug("Cast %s %s URL: %.60s...", cast_id, ref_key, ref_url)
         
-        if not ref_url.startswith("/renders/") and not ref_url.startswith("/files/"):
-            ref_images.append(ref_url)
-            print(f"[INFO] Using external URL for cast {cast_id}")
+        if not ref_url.startswith(LOCAL_URL_PREFIXES):
+            add_ref(ref_url)
+            log.info("Using external URL for cast %s", cast_id)
         else:
             local_file = resolve_render_path(ref_url, state)
             if local_file.exists():
                 try:
-                    uploaded_url = fal_client.upload_file(str(local_file))
-                    ref_images.append(uploaded_url)
-                    print(f"[INFO] Uploaded cast {ref_key} for {cast_id}: {uploaded_url[:60]}...")
+                    uploaded_url = upload_file_to_fal(local_file)
+                    add_ref(uploaded_url)
+                    log.info("Uploaded cast %s for %s: %.60s...", ref_key, cast_id, uploaded_url)
                 except Exception as e:
-                    print(f"[ERROR] Failed to upload cast {ref_key} for {cast_id}: {e}")
+                    log.error("Failed to upload cast %s for %s: %s", ref_key, cast_id, e)
             else:
-                print(f"[ERROR] Local file not found: {local_file}")
+                log.error("Local file not found: %s", local_file)
     
     img_url = None
     model_name = "unknown"
@@ -3186,7 +3247,7 @@ def api_render_shot(project_id: str, shot_id: str, payload: Dict[str, Any] = Non
             model_name = editor
             render_cost = API_COSTS.get(f"fal-ai/{editor}", 0.04)
         except Exception as e:
-            print(f"[WARN] img2img failed, falling back to t2i: {e}")
+            log.warning("img2img failed, falling back to t2i: %s", e)
             ref_images = []  # Clear to trigger t2i fallback
     
     if not img_url:
@@ -3195,19 +3256,17 @@ def api_render_shot(project_id: str, shot_id: str, payload: Dict[str, Any] = Non
         endpoint, payload, model_name = t2i_endpoint_and_payload(state, prompt, image_size)
         
         try:
-            r = requests.post(endpoint, headers=fal_headers(), json=payload, timeout=300)
+            r = FAL_SESSION.post(endpoint, headers=fal_headers(), json=payload, timeout=300)
         except requests.exceptions.RequestException as e:
             error_msg = f"T2I network error: {type(e).__name__}: {str(e)[:200]}"
-            print(f"[ERROR] {error_msg}")
-            shot["render"] = {"status":"error","image_url":None,"model":model_name,"error":error_msg}
-            save_project(state)
+            log.error(error_msg)
+            commit_shot_render(project_id, shot_id, {"status":"error","image_url":None,"model":model_name,"error":error_msg})
             return {"error": error_msg}
         
         render_cost = API_COSTS.get(f"fal-ai/{model_name}", 0.04)
         
         if r.status_code >= 300:
-            shot["render"] = {"status":"error","image_url":None,"model":model_name,"error":r.text}
-            save_project(state)
+            commit_shot_render(project_id, shot_id, {"status":"error","image_url":None,"model":model_name,"error":r.text})
             return {"error":"fal t2i failed","status":r.status_code,"body":r.text}
         
         out = r.json()
@@ -3236,11 +3295,29 @@ def api_render_shot(project_id: str, shot_id: str, payload: Dict[str, Any] = Non
         "error": None if img_url else "No image url found"
     }
 
-    # v1.7.1: Thread-safe save - reload state, update shot, persist costs, save atomically
+    cost_entry = None
+    if render_cost > 0:
+        note = "shot_render" if ref_images else "shot_render_t2i"
+        cost_entry = {"model": f"fal-ai/{model_name}", "cost": round(render_cost, 4), "ts": time.time(), "note": note}
+    commit_shot_render(project_id, shot_id, render_result, cost_entry)
+
+    return {"shot_id": shot_id, "prompt": prompt, "image_url": img_url, "ref_images_used": len(ref_images), "result": render_result}
+
+
+def commit_shot_render(
+    project_id: str,
+    shot_id: str,
+    render_result: Dict[str, Any],
+    cost_entry: Optional[Dict[str, Any]] = None
+) -> None:
+    """
+    v1.7.1: Thread-safe save - reload state, update shot, persist costs, save atomically.
+    v1.8.8: Used for error renders too, so concurrent shots never save unlocked.
+    """
     with get_project_lock(project_id):
         fresh_state = get_project(project_id)
-        fresh_shots = fresh_state.get("storyboard", {}).get("shots", [])
-        fresh_shot = next((s for s in fresh_shots if s.get("shot_id") == shot_id), None)
+        # v1.8.8: O(1) lookup; the index follows storyboard rebuilds made during the render
+        fresh_shot = get_shot_index(fresh_state).get(shot_id)
         if fresh_shot:
             # v1.8.1.3: Preserve existing edits if re-rendering
             existing_render = fresh_shot.get("render", {})
@@ -3249,17 +3326,84 @@ def api_render_shot(project_id: str, shot_id: str, payload: Dict[str, Any] = Non
                 render_result["selected_index"] = existing_render.get("selected_index", -1)
             fresh_shot["render"] = render_result
         
-        # v1.7.1: Persist costs to fresh_state
-        if render_cost > 0:
-            if "costs" not in fresh_state:
-                fresh_state["costs"] = {"total": 0.0, "calls": []}
-            note = "shot_render" if ref_images else "shot_render_t2i"
-            fresh_state["costs"]["calls"].append({"model": f"fal-ai/{model_name}", "cost": round(render_cost, 4), "ts": time.time(), "note": note})
-            fresh_state["costs"]["total"] = round(fresh_state["costs"].get("total", 0) + render_cost, 4)
-        
-        save_project(fresh_state)
+        # v1.8.8: Append render + costs to the patch log instead of rewriting project.json
+        patches = [shot_render_patch(shot_id, render_result)] if fresh_shot else []
+        if cost_entry:
+            patches.append(costs_patch(add_state_cost(fresh_state, cost_entry)))
+        needs_compaction = append_project_patches(fresh_state, patches)
+        if needs_compaction:
+            revision, snapshot = snapshot_project(fresh_state)
+    if needs_compaction:
+        write_project_snapshot(fresh_state, revision, snapshot)
 
-    return {"shot_id": shot_id, "prompt": prompt, "image_url": img_url, "ref_images_used": len(ref_images), "result": render_result}
+
+def _write_final_snapshot(project_id: str) -> None:
+    """v1.8.8: Snapshot the project under its lock, then write it (the write needs no lock)."""
+    with get_project_lock(project_id):
+        state = get_project(project_id)
+        revision, snapshot = snapshot_project(state)
+    write_project_snapshot(state, revision, snapshot)
+
+
+# v1.8.8: Render all pending shots in one request
+@app.post("/api/project/{project_id}/storyboard/render_all")
+async def api_render_all_shots(project_id: str, payload: Dict[str, Any] = None):
+    """
+    v1.8.8: Render every pending shot (or the given shot_ids) in parallel.
+    
+    The project is loaded and the shot plan (scenes + character refs) built once;
+    each shot then runs render_shot_core in a worker thread, bounded by
+    RENDER_SEMAPHORE. Shots commit through the patch log as they finish; one full
+    save folds everything into project.json at the end.
+    
+    Payload:
+        shot_ids: List[str] (optional) - Specific shots (None = all pending)
+        master_prompt: str (optional) - Appended to every shot prompt
+    """
+    require_key("FAL_KEY", FAL_KEY)
+    # Loading may hit disk; keep it off the event loop
+    state = await asyncio.to_thread(get_project, project_id)
+    
+    payload = payload or {}
+    shot_ids = payload.get("shot_ids") or [s.get("shot_id") for s in get_pending_shots(state)]
+    master_prompt = payload.get("master_prompt", "")
+    if not shot_ids:
+        return {"total": 0, "rendered": 0, "failed": 0, "results": []}
+    
+    log.info("Render all: %d shots for project %s", len(shot_ids), project_id)
+    
+    # v1.8.8: Scene/ref resolution for the whole batch in one pass
+    shot_index = get_shot_index(state)
+    plan = build_shot_plan(state, [shot_index[sid] for sid in shot_ids if sid in shot_index])
+    
+    async def render_one(sid: str) -> Dict[str, Any]:
+        shot = shot_index.get(sid)
+        if not shot:
+            return {"shot_id": sid, "image_url": None, "error": "Shot not found"}
+        async with RENDER_SEMAPHORE:
+            try:
+                result = await asyncio.to_thread(render_shot_core, project_id, state, shot, plan[sid], master_prompt)
+            except HTTPException as e:
+                return {"shot_id": sid, "image_url": None, "error": str(e.detail)}
+            except Exception as e:
+                return {"shot_id": sid, "image_url": None, "error": str(e)}
+        if result.get("error") or not result.get("image_url"):
+            return {"shot_id": sid, "image_url": None, "error": result.get("error") or "No image url found"}
+        return {"shot_id": sid, "image_url": result["image_url"], "error": None}
+    
+    results = await asyncio.gather(*(render_one(sid) for sid in shot_ids))
+    
+    # Fold the per-shot patches into a single project.json write
+    await asyncio.to_thread(_write_final_snapshot, project_id)
+    
+    rendered = sum(1 for r in results if r["image_url"])
+    log.info("Render all complete: %d/%d shots", rendered, len(results))
+    return {
+        "total": len(results),
+        "rendered": rendered,
+        "failed": len(results) - rendered,
+        "results": results,
+    }
 
 
 # v1.8.1.3: Edit a rendered shot with custom prompt and extra cast refs + version history
@@ -3269,8 +3413,7 @@ def api_edit_shot(project_id: str, shot_id: str, payload: Dict[str, Any]):
     state = get_project(project_id)
     require_key("FAL_KEY", FAL_KEY)
     
-    shots = state.get("storyboard", {}).get("shots", [])
-    shot = next((s for s in shots if s.get("shot_id") == shot_id), None)
+    shot = get_shot_index(state).get(shot_id)
     if not shot:
         raise HTTPException(404, "Shot not found")
     
@@ -3290,10 +3433,10 @@ def api_edit_shot(project_id: str, shot_id: str, payload: Dict[str, Any]):
     image_refs = []
     
     # 1. Upload current render as primary reference
-    if current_render_url.startswith("/renders/") or current_render_url.startswith("/files/"):
-        local_file = PATH_MANAGER.from_url(current_render_url, state)
+    if current_render_url.startswith(LOCAL_URL_PREFIXES):
+        local_file = resolve_render_path(current_render_url, state)
         if local_file.exists():
-            uploaded_url = fal_client.upload_file(str(local_file))
+            uploaded_url = upload_file_to_fal(local_file)
             image_refs.append(uploaded_url)
         else:
             raise HTTPException(400, "Current shot render file not found")
@@ -3302,10 +3445,10 @@ def api_edit_shot(project_id: str, shot_id: str, payload: Dict[str, Any]):
     
     # 2. Optional reference from + button (same as scenes)
     if ref_image:
-        if ref_image.startswith("/renders/") or ref_image.startswith("/files/"):
-            ref_file = PATH_MANAGER.from_url(ref_image, state)
+        if ref_image.startswith(LOCAL_URL_PREFIXES):
+            ref_file = resolve_render_path(ref_image, state)
             if ref_file.exists():
-                image_refs.append(fal_client.upload_file(str(ref_file)))
+                image_refs.append(upload_file_to_fal(ref_file))
         else:
             image_refs.append(ref_image)
     
@@ -3318,7 +3461,7 @@ def api_edit_shot(project_id: str, shot_id: str, payload: Dict[str, Any]):
     # v1.8.2: Append MASTER prompt in UPPERCASE if provided
     if master_prompt:
         full_prompt = f"{full_prompt}, {master_prompt.upper()}"
-        print(f"[INFO] Shot edit with MASTER prompt: {master_prompt.upper()[:50]}...")
+        log.info("Shot edit with MASTER prompt: %.50s...", master_prompt.upper())
     
     # Call img2img
     editor = locked_editor_key(state)
@@ -3344,14 +3487,14 @@ def api_edit_shot(project_id: str, shot_id: str, payload: Dict[str, Any]):
         "prompt": edit_prompt,
         "timestamp": time.time(),
         "model": editor,
-        "ref_images_used": len(ref_images)
+        "ref_images_used": len(image_refs)
     }
 
     # v1.8.1.3: Thread-safe save with version history
     with get_project_lock(project_id):
         fresh_state = get_project(project_id)
-        fresh_shots = fresh_state.get("storyboard", {}).get("shots", [])
-        fresh_shot = next((s for s in fresh_shots if s.get("shot_id") == shot_id), None)
+        # v1.8.8: O(1) lookup; the index follows storyboard rebuilds made during the render
+        fresh_shot = get_shot_index(fresh_state).get(shot_id)
         if fresh_shot:
             render_obj = fresh_shot.get("render", {})
             
@@ -3379,17 +3522,26 @@ def api_edit_shot(project_id: str, shot_id: str, payload: Dict[str, Any]):
         fresh_state["costs"]["calls"].append({"model": f"fal-ai/{editor}", "cost": round(editor_cost, 4), "ts": time.time(), "note": "shot_edit"})
         fresh_state["costs"]["total"] = round(fresh_state["costs"].get("total", 0) + editor_cost, 4)
         
-        save_project(fresh_state)
-    
-    # v1.8.2: Return version info from fresh_shot (not old render_obj)
-    fresh_shot = next((s for s in fresh_state.get("storyboard", {}).get("shots", []) if s.get("shot_id") == shot_id), None)
-    fresh_render = fresh_shot.get("render", {}) if fresh_shot else {}
+        # v1.8.2: Return version info from fresh_shot (not old render_obj)
+        fresh_render = fresh_shot.get("render", {}) if fresh_shot else {}
+        edit_count = len(fresh_render.get("edits", []))
+        selected_index = fresh_render.get("selected_index", -1)
+        
+        # v1.8.8: Append render + costs to the patch log instead of rewriting project.json
+        patches = [costs_patch(fresh_state["costs"])]
+        if fresh_shot:
+            patches.insert(0, shot_render_patch(shot_id, fresh_render))
+        needs_compaction = append_project_patches(fresh_state, patches)
+        if needs_compaction:
+            revision, snapshot = snapshot_project(fresh_state)
+    if needs_compaction:
+        write_project_snapshot(fresh_state, revision, snapshot)
     
     return {
         "shot_id": shot_id,
         "image_url": img_url,
-        "edit_count": len(fresh_render.get("edits", [])),
-        "selected_index": fresh_render.get("selected_index", -1)
+        "edit_count": edit_count,
+        "selected_index": selected_index
     }
 
 
@@ -3399,8 +3551,7 @@ def api_select_shot_version(project_id: str, shot_id: str, payload: Dict[str, An
     """Select which version (original or edit) to use as active."""
     state = get_project(project_id)
     
-    shots = state.get("storyboard", {}).get("shots", [])
-    shot = next((s for s in shots if s.get("shot_id") == shot_id), None)
+    shot = get_shot_index(state).get(shot_id)
     if not shot:
         raise HTTPException(404, "Shot not found")
     
@@ -3435,256 +3586,38 @@ def api_select_shot_version(project_id: str, shot_id: str, payload: Dict[str, An
 
 
 # ========= API: Video Export =========
-def update_export_status(project_id: str, status: str, current: int = 0, total: int = 0, message: str = ""):
-    """v1.5.9.1: Update export status for polling."""
-    EXPORT_STATUS[project_id] = {
-        "status": status,  # "idle", "processing", "done", "error"
-        "current": current,
-        "total": total,
-        "message": message,
-        "updated_at": time.time()
-    }
+# v1.8.8: Status tracking lives in services.export_service (update_export_status / get_export_status)
 
 @app.get("/api/project/{project_id}/export/status")
 def api_export_status(project_id: str):
     """v1.5.9.1: Get export status for polling."""
-    status = EXPORT_STATUS.get(project_id, {"status": "idle", "current": 0, "total": 0, "message": ""})
-    return status
+    return get_export_status(project_id)
 
 @app.post("/api/project/{project_id}/video/export")
 def api_export_video(project_id: str, payload: Dict[str, Any] = {}):
-    """v1.5.3: Export storyboard as video with FFmpeg xfade at scene transitions."""
-    import subprocess
-    import shutil
+    """
+    v1.8.8: Export storyboard as video with FFmpeg.
     
-    # Check FFmpeg
-    if not shutil.which("ffmpeg"):
-        raise HTTPException(500, "FFmpeg not found. Install FFmpeg and add to PATH.")
+    Delegates to services.export_service.export_video: each still is encoded once
+    (x264 veryfast by default, see preset) and the concat step stream-copies the video.
     
+    Payload:
+        fps: int (optional) - Frames per second (default: 30)
+        resolution: str (optional) - Output resolution (default: "1920x1080")
+        preset: str (optional) - libx264 preset (default: "veryfast"; "medium"/"slow" for delivery)
+    """
     state = get_project(project_id)
-    shots = state.get("storyboard", {}).get("shots", [])
-    sequences = state.get("storyboard", {}).get("sequences", [])
-    
-    if not shots:
-        raise HTTPException(400, "No shots to export")
-    
-    # Get rendered shots only
-    rendered_shots = [s for s in shots if s.get("render", {}).get("image_url")]
-    if not rendered_shots:
-        raise HTTPException(400, "No rendered shots. Render shots first.")
     
-    # Sort by start time
-    rendered_shots.sort(key=lambda s: float(s.get("start", 0)))
-    
-    # Get audio file
-    audio_path = state.get("audio_file_path")
-    if not audio_path or not Path(audio_path).exists():
-        raise HTTPException(400, "Audio file not found")
-    
-    # Settings
     fps = int(payload.get("fps", 30))
     resolution = payload.get("resolution", "1920x1080")
     
-    # Build sequence lookup
-    seq_ids = [seq.get("sequence_id") for seq in sequences]
-    
-    # v1.5.9.1: Use project folder for temp and output
-    video_dir = get_project_video_dir(state)
-    temp_dir = video_dir / "temp"
-    temp_dir.mkdir(exist_ok=True)
-    
-    # Output path in project video folder
-    project_title = sanitize_filename(state.get("project", {}).get("title", "video"), 30)
-    output_path = video_dir / f"{project_title}_export.mp4"
-    
-    try:
-        # Step 1: Create video clip for each shot
-        clip_paths = []
-        skipped = []
-        total_shots = len(rendered_shots)
-        print(f"[INFO] Processing {total_shots} rendered shots...")
-        update_export_status(project_id, "processing", 0, total_shots, f"Starting export of {total_shots} shots...")
-        
-        for i, shot in enumerate(rendered_shots):
-            img_url = shot["render"]["image_url"]
-            # v1.8.5: Use PATH_MANAGER.from_url() with state for migrated projects
-            if img_url.startswith("/files/") or img_url.startswith("/renders/"):
-                img_path = PATH_MANAGER.from_url(img_url, state)
-            else:
-                # Handle absolute paths or relative paths
-                img_path = Path(img_url) if Path(img_url).is_absolute() else PATH_MANAGER.workspace_root / img_url
-            
-            if not img_path.exists():
-                print(f"[ERROR] Shot {shot.get('shot_id')} image not found: {img_path}")
-                print(f"[DEBUG] Original URL: {img_url}")
-                print(f"[DEBUG] Resolved path: {img_path}")
-                skipped.append(shot.get('shot_id', f'idx_{i}'))
-                continue
-
-            duration = float(shot.get("end", 0)) - float(shot.get("start", 0))
-            if duration <= 0:
-                print(f"[WARN] Shot {shot.get('shot_id')} has invalid duration: {duration}")
-                skipped.append(shot.get('shot_id', f'idx_{i}'))
-                continue
-            
-            clip_path = temp_dir / f"clip_{i:03d}.mp4"
-            
-            # Check if clip already exists - reuse if possible
-            if clip_path.exists():
-                print(f"[INFO] Reusing existing clip {i+1}/{total_shots}: {shot.get('shot_id')} ({duration:.1f}s)")
-                clip_paths.append({
-                    "path": clip_path,
-                    "shot": shot,
-                    "duration": duration,
-                    "seq_id": shot.get("sequence_id", "")
-                })
-                update_export_status(project_id, "processing", i+1, total_shots, f"Reused clip {i+1}/{total_shots}: {shot.get('shot_id')}")
-                continue
-            
-            # Parse resolution (e.g., "1920x1080" -> width=1920, height=1080)
-            res_parts = resolution.split("x")
-            width = res_parts[0]
-            height = res_parts[1] if len(res_parts) > 1 else res_parts[0]
-            
-            # Create video from image with duration
-            cmd = [
-                "ffmpeg", "-y",
-                "-loop", "1",
-                "-i", str(img_path),
-                "-t", str(duration),
-                "-vf", f"scale={width}:{height}:force_original_aspect_ratio=decrease,pad={width}:{height}:(ow-iw)/2:(oh-ih)/2:black",
-                "-c:v", "libx264",
-                "-pix_fmt", "yuv420p",
-                "-r", str(fps),
-                str(clip_path)
-            ]
-            
-            try:
-                result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-                clip_paths.append({
-                    "path": clip_path,
-                    "shot": shot,
-                    "duration": duration,
-                    "seq_id": shot.get("sequence_id", "")
-                })
-                print(f"[INFO] Created clip {i+1}/{total_shots}: {shot.get('shot_id')} ({duration:.1f}s)")
-                update_export_status(project_id, "processing", i+1, total_shots, f"Created clip {i+1}/{total_shots}: {shot.get('shot_id')}")
-            except subprocess.CalledProcessError as e:
-                print(f"[ERROR] Failed to create clip for {shot.get('shot_id')}: {e.stderr[:200] if e.stderr else str(e)}")
-                skipped.append(shot.get('shot_id', f'idx_{i}'))
-
-        print(f"[INFO] Created {len(clip_paths)} clips, skipped {len(skipped)}: {skipped[:5]}{'...' if len(skipped) > 5 else ''}")
-        
-        if not clip_paths:
-            update_export_status(project_id, "error", 0, 0, "No clips created")
-            raise HTTPException(500, "No clips created")
-        
-        # Calculate expected total duration
-        expected_duration = sum(c["duration"] for c in clip_paths)
-        print(f"[INFO] Expected video duration: {expected_duration:.1f}s from {len(clip_paths)} clips")
-        update_export_status(project_id, "processing", total_shots, total_shots, f"Concatenating {len(clip_paths)} clips...")
-        
-        # Step 2: Use concat demuxer (simpler and more reliable)
-        # Create concat file
-        concat_file = temp_dir / "concat.txt"
-        print(f"[DEBUG] Creating concat file: {concat_file}")
-        with open(concat_file, "w", encoding="utf-8") as f:
-            for clip in clip_paths:
-                # FFmpeg concat format - use forward slashes and verify file exists
-                if not clip["path"].exists():
-                    print(f"[ERROR] Clip file missing: {clip['path']}")
-                    continue
-                clip_path_str = str(clip["path"]).replace("\\", "/")
-                f.write(f"file '{clip_path_str}'\n")
-                print(f"[DEBUG] Added to concat: {clip_path_str}")
-        
-        # Verify concat file was created and has content
-        if not concat_file.exists():
-            raise HTTPException(500, "Failed to create concat file")
-        
-        with open(concat_file, "r", encoding="utf-8") as f:
-            concat_content = f.read()
-            print(f"[DEBUG] Concat file content ({len(concat_content)} chars):")
-            print(concat_content[:500] + "..." if len(concat_content) > 500 else concat_content)
-        
-        print(f"[INFO] Concat file created with {len(clip_paths)} entries")
-        
-        # Step 3: Concatenate clips with audio
-        final_cmd = [
-            "ffmpeg", "-y",
-            "-f", "concat",
-            "-safe", "0",
-            "-i", str(concat_file),
-            "-i", str(audio_path),
-            "-c:v", "libx264",
-            "-preset", "medium",
-            "-crf", "23",
-            "-c:a", "aac",
-            "-b:a", "192k",
-            "-map", "0:v",
-            "-map", "1:a",
-            "-shortest",
-            str(output_path)
-        ]
-        
-        print(f"[INFO] Running final export...")
-        print(f"[DEBUG] FFmpeg full command:")
-        for i, arg in enumerate(final_cmd):
-            print(f"  [{i}] {arg}")
-        print(f"[DEBUG] Concat file exists: {concat_file.exists()}")
-        print(f"[DEBUG] Audio file exists: {Path(audio_path).exists()}")
-        print(f"[DEBUG] Output dir exists: {output_path.parent.exists()}")
-        print(f"[DEBUG] Working directory: {Path.cwd()}")
-        
-        result = subprocess.run(final_cmd, capture_output=True, text=True)
-        
-        if result.returncode != 0:
-            # Extract actual error from stderr (skip version info)
-            stderr_lines = result.stderr.split('\n')
-            error_lines = [l for l in stderr_lines if 'error' in l.lower() or 'invalid' in l.lower() or 'no such' in l.lower() or 'failed' in l.lower()]
-            error_msg = '\n'.join(error_lines) if error_lines else result.stderr[-500:]
-            
-            print(f"[ERROR] FFmpeg command failed:")
-            print(f"[ERROR] Return code: {result.returncode}")
-            print(f"[ERROR] Command: {' '.join(str(x) for x in final_cmd[:15])}...")
-            print(f"[ERROR] Full stderr: {result.stderr}")
-            print(f"[DEBUG] Clips created: {len(clip_paths)}")
-            print(f"[DEBUG] Audio path exists: {Path(audio_path).exists()}")
-            
-            update_export_status(project_id, "error", 0, 0, f"FFmpeg failed: {error_msg[:100]}")
-            raise HTTPException(500, f"Export failed: {error_msg}")
-        
-        # Calculate scene transitions for info
-        scene_transitions = sum(1 for i in range(1, len(clip_paths)) if clip_paths[i-1]["seq_id"] != clip_paths[i]["seq_id"])
-        
-        # Calculate total duration
-        total_duration = sum(c["duration"] for c in clip_paths)
-        
-        # Keep temp files for reuse - don't cleanup
-        print(f"[INFO] Temp files kept in: {temp_dir}")
-        print(f"[INFO] Clips: {len(clip_paths)} files")
-        print(f"[INFO] Concat file: {concat_file}")
-        
-        # Return video URL
-        # v1.5.9.1: Return path relative to DATA for serve_render
-        rel_path = output_path.relative_to(DATA)
-        video_url = f"/renders/{rel_path.as_posix()}"
-        
-        update_export_status(project_id, "done", total_shots, total_shots, f"Export complete: {len(clip_paths)} clips, {total_duration:.1f}s")
-        
-        return {
-            "video_url": video_url,
-            "shots_exported": len(clip_paths),
-            "duration_sec": total_duration,
-            "scene_transitions": scene_transitions
-        }
-        
-    except subprocess.CalledProcessError as e:
-        update_export_status(project_id, "error", 0, 0, f"FFmpeg error: {str(e)[:100]}")
-        raise HTTPException(500, f"FFmpeg error: {e.stderr.decode() if e.stderr else str(e)}")
-    except Exception as e:
-        update_export_status(project_id, "error", 0, 0, f"Export failed: {str(e)[:100]}")
-        raise HTTPException(500, f"Export failed: {str(e)}")
+    return export_video(
+        state=state,
+        project_id=project_id,
+        fps=fps,
+        resolution=resolution,
+        preset=payload.get("preset") or X264_PRESET,
+    )
 
 
 # ========= v1.8.0: Img2Vid Endpoints =========
@@ -3717,7 +3650,7 @@ def api_generate_shot_video(project_id: str, payload: Dict[str, Any]):
         shots = state.get("storyboard", {}).get("shots", [])
         print(f"[API] Total shots in project: {len(shots)}")
         print(f"[API] Available shot IDs: {[s.get('shot_id') for s in shots[:5]]}")
-        shot = next((s for s in shots if s.get("shot_id") == shot_id), None)
+        shot = get_shot_index(state).get(shot_id)
         
         if not shot:
             raise HTTPException(404, f"Shot {shot_id} not found")
@@ -3799,6 +3732,7 @@ def api_export_video_img2vid(project_id: str, payload: Dict[str, Any] = {}):
         video_model: str (optional) - Video model to use
         fps: int (optional) - Frames per second for concat (default: 30)
         resolution: str (optional) - Output resolution (default: "1920x1080")
+        preset: str (optional) - libx264 preset for the final encode (default: "veryfast")
     """
     lock = get_project_lock(project_id)
     with lock:
@@ -3815,6 +3749,7 @@ def api_export_video_img2vid(project_id: str, payload: Dict[str, Any] = {}):
                 video_model=video_model,
                 fps=fps,
                 resolution=resolution,
+                preset=payload.get("preset") or X264_PRESET,
             )
             
             # Save state (shots now have video data)
@@ -2,13 +2,54 @@
 Fré Pathé v1.7 - Audio Service
 Handles audio DNA extraction, duration, BPM, lyrics transcription integration, and beat grid.
 """
+import asyncio
+import bisect
+import copy
+import hashlib
+import re
+from functools import lru_cache
+import numpy as np
 import requests
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
+
+# v1.8.8: Import once at module load - librosa's first import JITs numba kernels
+try:
+    import librosa
+except ImportError:
+    librosa = None
+
+try:
+    from mutagen import File as MutagenFile
+except ImportError:
+    MutagenFile = None
+
+# v1.8.8: Optional C tempo tracker (faster than librosa.beat for BPM-only use)
+try:
+    import aubio
+except ImportError:
+    aubio = None
+
+# v1.8.8: Optional blake3 for audio content hashing (sha256 fallback)
+try:
+    from blake3 import blake3
+except ImportError:
+    blake3 = None
+
+AUDIO_HASH_ALGO = "blake3" if blake3 is not None else "sha256"
+
+# v1.8.8: orjson (Rust) for large FAL payloads - stdlib json is the fallback
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 from .config import (
+    PATH_MANAGER,
     FAL_AUDIO,
+    FAL_SESSION,
     fal_headers,
+    safe_float,
     track_cost
 )
 
@@ -17,13 +58,12 @@ from .config import (
 
 def get_audio_duration_librosa(file_path: str) -> Optional[float]:
     """Get accurate audio duration using librosa."""
+    if librosa is None:
+        print("[WARN] librosa not installed, falling back to mutagen")
+        return None
     try:
-        import librosa
         duration = librosa.get_duration(path=file_path)
         return round(duration, 2)
-    except ImportError:
-        print("[WARN] librosa not installed, falling back to mutagen")
-        return None
     except Exception as e:
         print(f"[WARN] librosa failed: {e}")
         return None
@@ -31,8 +71,10 @@ def get_audio_duration_librosa(file_path: str) -> Optional[float]:
 
 def get_audio_duration_mutagen(file_path: str) -> Optional[float]:
     """Fallback: Get audio duration using mutagen."""
+    if MutagenFile is None:
+        print("[WARN] mutagen not installed")
+        return None
     try:
-        from mutagen import File as MutagenFile
         audio = MutagenFile(file_path)
         if audio and audio.info:
             return round(audio.info.length, 2)
@@ -56,12 +98,78 @@ def get_audio_duration(file_path: str) -> Optional[float]:
 
 # ========= BPM Detection =========
 
-def get_audio_bpm_librosa(file_path: str) -> Optional[float]:
-    """Detect BPM using librosa beat tracking - much more accurate than FAL."""
+BPM_SAMPLE_RATE = 22050  # Beat tracking is accurate at half CD rate
+BPM_MAX_SECONDS = 120.0  # Tempo is stable well within two minutes
+
+def load_audio_once(file_path: str) -> Optional[Tuple[np.ndarray, int]]:
+    """
+    v1.8.8: Decode the whole track once at BPM_SAMPLE_RATE mono so duration
+    and BPM share one decode (see analyze_local_audio).
+    """
+    if librosa is None:
+        return None
+    try:
+        return librosa.load(file_path, sr=BPM_SAMPLE_RATE, mono=True, res_type="soxr_lq")
+    except Exception as e:
+        print(f"[WARN] librosa load failed: {e}")
+        return None
+
+
+AUBIO_WIN_SIZE = 1024
+AUBIO_HOP_SIZE = 512
+
+def get_audio_bpm_aubio(y: np.ndarray, sr: int) -> Optional[float]:
+    """
+    v1.8.8: BPM via aubio's tempo tracker on an already decoded mono buffer.
+    Returns None when aubio is unavailable or finds too few beats.
+    """
+    if aubio is None or y is None or not sr:
+        return None
     try:
-        import librosa
-        # Load audio file
-        y, sr = librosa.load(file_path, sr=None)
+        tracker = aubio.tempo("default", AUBIO_WIN_SIZE, AUBIO_HOP_SIZE, int(sr))
+        samples = np.ascontiguousarray(y, dtype=np.float32)
+        beats = []
+        for start in range(0, len(samples) - AUBIO_HOP_SIZE + 1, AUBIO_HOP_SIZE):
+            if tracker(samples[start:start + AUBIO_HOP_SIZE])[0]:
+                beats.append(tracker.get_last_s())
+        if len(beats) < 4:
+            return None
+        bpm = float(np.median(60.0 / np.diff(beats)))
+        return round(bpm, 1) if bpm > 0 else None
+    except Exception as e:
+        print(f"[WARN] aubio BPM detection failed: {e}")
+        return None
+
+
+def get_audio_bpm_librosa(
+    file_path: str,
+    y: Optional[np.ndarray] = None,
+    sr: Optional[int] = None,
+) -> Optional[float]:
+    """
+    Detect BPM using librosa beat tracking - much more accurate than FAL.
+    v1.8.8: Pass an already decoded (y, sr) to skip loading the file again.
+    """
+    if librosa is None:
+        print("[WARN] librosa not installed for BPM detection")
+        return None
+    try:
+        if y is None or not sr:
+            # v1.8.8: Onset envelope only needs 22 kHz mono; cap long tracks to a steady excerpt
+            y, sr = librosa.load(
+                file_path,
+                sr=BPM_SAMPLE_RATE,
+                mono=True,
+                duration=BPM_MAX_SECONDS,
+                res_type="soxr_lq",
+            )
+        else:
+            y = y[:int(BPM_MAX_SECONDS * sr)]
+        # v1.8.8: Prefer aubio when installed; librosa beat tracking is the fallback
+        bpm = get_audio_bpm_aubio(y, sr)
+        if bpm:
+            print(f"[INFO] Aubio BPM detection: {bpm}")
+            return bpm
         # Use beat_track for tempo detection
         tempo, beat_frames = librosa.beat.beat_track(y=y, sr=sr)
         # tempo can be an array, get scalar
@@ -74,14 +182,39 @@ def get_audio_bpm_librosa(file_path: str) -> Optional[float]:
             print(f"[INFO] Librosa BPM detection: {bpm}")
             return bpm
         return None
-    except ImportError:
-        print("[WARN] librosa not installed for BPM detection")
-        return None
     except Exception as e:
         print(f"[WARN] librosa BPM detection failed: {e}")
         return None
 
 
+def analyze_local_audio(file_path: str) -> Tuple[Optional[float], Optional[float]]:
+    """
+    v1.8.8: Local duration + BPM from a single decode.
+    Falls back to header-based duration when the file can't be decoded.
+    """
+    loaded = load_audio_once(file_path)
+    if loaded is None:
+        return get_audio_duration(file_path), None
+    y, sr = loaded
+    duration = round(len(y) / sr, 2) if sr and len(y) else None
+    bpm = get_audio_bpm_librosa(file_path, y=y, sr=sr)
+    return duration or get_audio_duration_mutagen(file_path), bpm
+
+
+def warmup_audio_analysis() -> None:
+    """
+    v1.8.8: Run beat tracking once on silence so numba compiles its kernels
+    up front instead of on the first uploaded track.
+    """
+    if librosa is None:
+        return
+    try:
+        librosa.beat.beat_track(y=np.zeros(22050, dtype=np.float32), sr=22050)
+        print("[INFO] librosa beat tracking warmed up")
+    except Exception as e:
+        print(f"[WARN] librosa warmup failed: {e}")
+
+
 # ========= Beat Grid =========
 
 def build_beat_grid(duration_sec: float, bpm: float) -> Dict[str, Any]:
@@ -99,54 +232,144 @@ def build_beat_grid(duration_sec: float, bpm: float) -> Dict[str, Any]:
     if duration_sec <= 0 or bpm <= 0:
         return {"beats": [], "bars": [], "downbeats": [], "total_beats": 0, "total_bars": 0}
     
-    beat_duration = 60.0 / bpm  # Seconds per beat
-    beats_per_bar = 4  # Assume 4/4 time
-    
-    beats = []
-    bars = []
-    downbeats = []
-    
-    t = 0.0
-    beat_count = 0
-    while t < duration_sec:
-        beats.append(round(t, 3))
-        
-        # Is this a downbeat (first beat of a bar)?
-        if beat_count % beats_per_bar == 0:
-            bars.append(round(t, 3))
-            downbeats.append(round(t, 3))
-        
-        t += beat_duration
-        beat_count += 1
+    # v1.8.8: Memoized - BPM edits re-request the same few grids
+    beats, bars = _beat_grid_cached(round(duration_sec, 3), round(bpm, 3))
     
     return {
-        "beats": beats,
-        "bars": bars,
-        "downbeats": downbeats,
+        "beats": list(beats),
+        "bars": list(bars),
+        "downbeats": list(bars),
         "total_beats": len(beats),
         "total_bars": len(bars),
     }
 
 
+@lru_cache(maxsize=128)
+def _beat_grid_cached(duration_sec: float, bpm: float) -> Tuple[Tuple[float, ...], Tuple[float, ...]]:
+    """Immutable (beats, bars) for a validated duration/bpm pair."""
+    beat_duration = 60.0 / bpm  # Seconds per beat
+    beats_per_bar = 4  # Assume 4/4 time
+    
+    # v1.8.8: Vectorized grid - one arange/round instead of a per-beat Python loop
+    beats_arr = np.round(np.arange(0.0, duration_sec, beat_duration), 3)
+    bars_arr = beats_arr[::beats_per_bar]  # Downbeat = first beat of each bar
+    
+    return tuple(beats_arr.tolist()), tuple(bars_arr.tolist())
+
+
 def snap_to_grid(t: float, grid: List[float], tolerance: float = 0.5) -> float:
-    """Snap a time value to the nearest grid position."""
+    """
+    Snap a time value to the nearest grid position.
+    v1.8.8: Grid from build_beat_grid is ascending - binary search instead of a full scan.
+    """
     if not grid:
         return t
-    nearest = min(grid, key=lambda x: abs(x - t))
+    idx = bisect.bisect_left(grid, t)
+    candidates = grid[max(0, idx - 1):idx + 1]
+    nearest = min(candidates, key=lambda x: abs(x - t))
     if abs(nearest - t) <= tolerance:
         return nearest
     return t
 
 
+# ========= Audio DNA Cache =========
+# v1.8.8: Analysis results are content-addressed (file hash + prompt + STT model) and
+# persisted under workspace_root/cache/audio_dna, so re-uploading the same track in
+# any project skips librosa, the FAL upload/understanding call and STT.
+
+AUDIO_DNA_MEMORY_MAX = 64
+AUDIO_DNA_MEMORY: Dict[str, Dict[str, Any]] = {}
+
+
+def hash_audio_file(file_path: Path, chunk_size: int = 1024 * 1024) -> str:
+    """
+    Stream the file through the fastest available content hash.
+    blake3 (SIMD tree hash) when installed, else OpenSSL sha256 (SHA-NI on x86-64).
+    Digest is prefixed with the algorithm so caches never mix the two.
+    """
+    h = blake3() if blake3 is not None else hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            h.update(chunk)
+    return f"{AUDIO_HASH_ALGO}:{h.hexdigest()}"
+
+
+def audio_dna_cache_key(digest: str, prompt: str, variant: str = "") -> str:
+    """Cache key for an analysis of the file with this prompt/STT setup."""
+    signature = "|".join([digest, prompt or "", variant])
+    return hashlib.sha256(signature.encode("utf-8")).hexdigest()[:32]
+
+
+def audio_dna_cache_dir() -> Path:
+    """Global audio DNA cache: workspace_root/cache/audio_dna"""
+    cache = PATH_MANAGER.cache_dir / "audio_dna"
+    cache.mkdir(parents=True, exist_ok=True)
+    return cache
+
+
+def load_cached_audio_dna(cache_key: str) -> Optional[Dict[str, Any]]:
+    """Return a copy of a cached analysis result, or None on cache miss."""
+    cached = AUDIO_DNA_MEMORY.get(cache_key)
+    if cached is None:
+        path = audio_dna_cache_dir() / f"{cache_key}.json"
+        if not path.exists():
+            return None
+        try:
+            cached = loads_json(path.read_bytes())
+        except Exception as e:
+            print(f"[WARN] Audio DNA cache read failed ({cache_key[:8]}): {e}")
+            return None
+        _remember_audio_dna(cache_key, cached)
+    return copy.deepcopy(cached)
+
+
+def store_cached_audio_dna(cache_key: str, result: Dict[str, Any]) -> None:
+    """Persist an analysis result (audio_dna, local_duration, audio_url)."""
+    _remember_audio_dna(cache_key, copy.deepcopy(result))
+    try:
+        if orjson is not None:
+            payload = orjson.dumps(result)
+        else:
+            import json as json_module
+            payload = json_module.dumps(result).encode("utf-8")
+        (audio_dna_cache_dir() / f"{cache_key}.json").write_bytes(payload)
+    except Exception as e:
+        print(f"[WARN] Audio DNA cache store failed ({cache_key[:8]}): {e}")
+
+
+def _remember_audio_dna(cache_key: str, result: Dict[str, Any]) -> None:
+    AUDIO_DNA_MEMORY.pop(cache_key, None)
+    AUDIO_DNA_MEMORY[cache_key] = result
+    while len(AUDIO_DNA_MEMORY) > AUDIO_DNA_MEMORY_MAX:
+        AUDIO_DNA_MEMORY.pop(next(iter(AUDIO_DNA_MEMORY)))
+
+
 # ========= Audio DNA Extraction =========
 
+def loads_json(data: Any) -> Any:
+    """v1.8.8: Parse JSON text/bytes with orjson when available."""
+    if orjson is not None:
+        return orjson.loads(data)
+    import json as json_module
+    return json_module.loads(data)
+
+
+def loads_fal_response(r: requests.Response) -> Dict[str, Any]:
+    """v1.8.8: Decode a FAL response body straight from bytes (skips requests' str round-trip)."""
+    return loads_json(r.content)
+
+
+# v1.8.8: Markdown fence patterns compiled once
+_FENCE_OPEN_RE = re.compile(r'^```(?:json)?\s*\n?')
+_FENCE_CLOSE_RE = re.compile(r'\n?```\s*$')
+
+
 def _extract_json_from_fal_output(raw: Dict[str, Any]) -> Dict[str, Any]:
     """
     v1.7.0: FAL audio-understanding returns JSON inside an 'output' string
     with markdown code blocks. Extract the actual data.
     """
     import json as json_module
-    import re
     
     # If raw already has the expected keys, return as-is
     if raw.get("bpm") or raw.get("structure") or raw.get("lyrics"):
@@ -162,13 +385,13 @@ def _extract_json_from_fal_output(raw: Dict[str, Any]) -> Dict[str, Any]:
     cleaned = output.strip()
     if cleaned.startswith("```"):
         # Remove opening ```json or ```
-        cleaned = re.sub(r'^```(?:json)?\s*\n?', '', cleaned)
+        cleaned = _FENCE_OPEN_RE.sub('', cleaned, count=1)
         # Remove closing ```
-        cleaned = re.sub(r'\n?```\s*$', '', cleaned)
+        cleaned = _FENCE_CLOSE_RE.sub('', cleaned, count=1)
     
     # Try to parse as JSON
     try:
-        parsed = json_module.loads(cleaned)
+        parsed = loads_json(cleaned)
         if isinstance(parsed, dict):
             return parsed
     except json_module.JSONDecodeError as e:
@@ -177,19 +400,51 @@ def _extract_json_from_fal_output(raw: Dict[str, Any]) -> Dict[str, Any]:
     return raw
 
 
-def normalize_audio_understanding(raw: Dict[str, Any]) -> Dict[str, Any]:
+def _first_of(d: Dict[str, Any], keys: Tuple[str, ...], default: Any = None) -> Any:
+    """v1.8.8: First truthy value among keys (same semantics as a get() or-chain)."""
+    for k in keys:
+        v = d.get(k)
+        if v:
+            return v
+    return default
+
+
+def _weighted_energy(dynamics: List[Any]) -> Optional[float]:
+    """
+    v1.8.8: Mean energy weighted by window length; plain mean when windows
+    have no usable start/end (e.g. older FAL responses).
+    """
+    rows = np.array(
+        [
+            (safe_float(d.get("start"), "nan"), safe_float(d.get("end"), "nan"), d.get("energy", 0.5))
+            for d in dynamics if isinstance(d, dict)
+        ],
+        dtype=np.float64,
+    ).reshape(-1, 3)
+    if not rows.shape[0]:
+        return None
+    energies = rows[:, 2]
+    weights = rows[:, 1] - rows[:, 0]
+    if np.all(np.isfinite(weights)) and np.all(weights >= 0) and weights.sum() > 0:
+        return float(np.average(energies, weights=weights))
+    return float(energies.mean())
+
+
+def normalize_audio_understanding(raw: Dict[str, Any], keep_raw: bool = True) -> Dict[str, Any]:
     """
     Normalize FAL audio-understanding response into standardized audio DNA.
     v1.7.0: Handle FAL's output format (JSON inside markdown code block)
+    v1.8.8: keep_raw=False drops raw_response (a second full copy of the payload
+    in project state) when the caller already logged it via save_fal_debug.
     """
     # v1.7.0: Extract JSON from FAL's output string format
     data = _extract_json_from_fal_output(raw)
     
     # Extract basic metadata
     meta = {
-        "duration_sec": data.get("duration_sec") or data.get("duration"),
-        "bpm": data.get("bpm") or data.get("tempo") or 120,
-        "key": data.get("key") or data.get("musical_key") or "unknown",
+        "duration_sec": _first_of(data, ("duration_sec", "duration")),
+        "bpm": _first_of(data, ("bpm", "tempo"), 120),
+        "key": _first_of(data, ("key", "musical_key"), "unknown"),
         "energy": data.get("energy") or 0.5,
         "genre": data.get("genre") or "unknown",
     }
@@ -200,18 +455,18 @@ def normalize_audio_understanding(raw: Dict[str, Any]) -> Dict[str, Any]:
         style = ", ".join(style) if style else "unknown"
     
     # Extract mood/emotion
-    mood = data.get("mood") or data.get("emotion") or data.get("atmosphere") or "energetic"
+    mood = _first_of(data, ("mood", "emotion", "atmosphere"), "energetic")
     if isinstance(mood, list):
         mood = mood[0] if mood else "energetic"
     
     # v1.7.0: Extract structure sections (FAL format)
-    sections = data.get("structure") or data.get("sections") or []
+    sections = _first_of(data, ("structure", "sections"), [])
     # Normalize section format
     normalized_sections = []
     for sec in sections:
         if isinstance(sec, dict):
             normalized_sections.append({
-                "type": sec.get("type") or sec.get("label") or "verse",
+                "type": _first_of(sec, ("type", "label"), "verse"),
                 "start": sec.get("start") or 0,
                 "end": sec.get("end") or 0,
             })
@@ -221,9 +476,10 @@ def normalize_audio_understanding(raw: Dict[str, Any]) -> Dict[str, Any]:
     dynamics = data.get("dynamics") or []
     if dynamics and isinstance(dynamics, list):
         # Calculate average energy or get dominant dynamic
-        energies = [d.get("energy", 0.5) for d in dynamics if isinstance(d, dict)]
-        if energies:
-            meta["energy"] = sum(energies) / len(energies)
+        # v1.8.8: Duration-weighted mean over (start, end, energy) windows
+        meta_energy = _weighted_energy(dynamics)
+        if meta_energy is not None:
+            meta["energy"] = meta_energy
             meta["energy_curve"] = dynamics
     
     # v1.7.0: Extract vocal delivery
@@ -255,23 +511,20 @@ def normalize_audio_understanding(raw: Dict[str, Any]) -> Dict[str, Any]:
         lyrics = [{"text": l} for l in lines]
     elif isinstance(lyrics, list):
         # Normalize to have 'text' key
-        normalized_lyrics = []
-        for item in lyrics:
-            if isinstance(item, str):
-                normalized_lyrics.append({"text": item})
-            elif isinstance(item, dict):
-                normalized_lyrics.append({
-                    "text": item.get("text", ""),
-                    "start": item.get("start"),
-                })
-        lyrics = normalized_lyrics
+        # v1.8.8: One comprehension (no per-line append calls)
+        lyrics = [
+            {"text": item} if isinstance(item, str)
+            else {"text": item.get("text", ""), "start": item.get("start")}
+            for item in lyrics
+            if isinstance(item, (str, dict))
+        ]
     
     # Extract instruments
-    instruments = data.get("instruments") or data.get("instrumentation") or []
+    instruments = _first_of(data, ("instruments", "instrumentation"), [])
     if isinstance(instruments, str):
         instruments = [i.strip() for i in instruments.split(",")]
     
-    return {
+    audio_dna = {
         "meta": meta,
         "mood": mood,
         "style": style,
@@ -281,8 +534,10 @@ def normalize_audio_understanding(raw: Dict[str, Any]) -> Dict[str, Any]:
         "story": story_str,
         "lyrics": lyrics,
         "instruments": instruments,
-        "raw_response": raw,  # Keep original for debugging
     }
+    if keep_raw:
+        audio_dna["raw_response"] = raw  # Keep original for debugging
+    return audio_dna
 
 
 async def analyze_audio(
@@ -295,24 +550,29 @@ async def analyze_audio(
     Analyze audio file using FAL audio-understanding and optionally Whisper.
     Returns normalized audio DNA with beat grid.
     """
-    # Get accurate duration using librosa/mutagen BEFORE fal.ai call
-    local_duration = get_audio_duration(str(file_path))
+    digest = await asyncio.to_thread(hash_audio_file, file_path)
+    cache_key = audio_dna_cache_key(digest, prompt, "fal")
+    cached = load_cached_audio_dna(cache_key)
+    if cached:
+        print(f"[INFO] Audio DNA cache hit ({digest[:12]})")
+        return cached
+
+    # v1.8.8: Local duration/BPM (CPU) overlap with the FAL request (network)
+    (local_duration, local_bpm), r = await asyncio.gather(
+        asyncio.to_thread(analyze_local_audio, str(file_path)),
+        asyncio.to_thread(
+            FAL_SESSION.post,
+            FAL_AUDIO,
+            headers=fal_headers(),
+            json={"audio_url": audio_url, "prompt": prompt},
+            timeout=300,
+        ),
+    )
     print(f"[INFO] Local audio duration: {local_duration}s")
-    
-    # Get accurate BPM using librosa beat tracking
-    local_bpm = get_audio_bpm_librosa(str(file_path))
     if local_bpm:
         print(f"[INFO] Local BPM detection (librosa): {local_bpm}")
     else:
         print(f"[WARN] Local BPM detection failed, will use FAL")
-
-    # Call FAL audio-understanding
-    r = requests.post(
-        FAL_AUDIO,
-        headers=fal_headers(),
-        json={"audio_url": audio_url, "prompt": prompt},
-        timeout=300
-    )
     
     # Track cost based on duration ($0.01 per 5 seconds)
     duration_for_cost = local_duration or 180  # Fallback to 3 min estimate
@@ -322,7 +582,7 @@ async def analyze_audio(
     if r.status_code >= 300:
         raise Exception(f"FAL audio-understanding failed: {r.status_code} - {r.text}")
     
-    raw = r.json()
+    raw = loads_fal_response(r)
     audio_dna = normalize_audio_understanding(raw)
 
     # Calculate beat grid for shot timing sync
@@ -332,10 +592,12 @@ async def analyze_audio(
     audio_dna["beat_grid"] = beat_grid
     print(f"[INFO] Beat grid: {beat_grid.get('total_bars', 0)} bars, {beat_grid.get('total_beats', 0)} beats @ {bpm} BPM")
     
-    return {
+    result = {
         "audio_dna": audio_dna,
         "local_duration": local_duration,
-            }
+    }
+    store_cached_audio_dna(cache_key, result)
+    return result
 
 
 def update_bpm(state: Dict[str, Any], new_bpm: int) -> Dict[str, Any]:
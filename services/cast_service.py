@@ -2,73 +2,82 @@
 Fré Pathé v1.8.8 - Cast Service
 Handles cast member CRUD, character refs, and wardrobe generation.
 """
+import sys
+from operator import itemgetter
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional, Tuple
 
 from .config import clamp
 
 
 # ========= Cast Impact/Usage =========
 
-def get_cast_usage_string(role: str, impact: float, is_primary_lead: bool = False) -> str:
+# v1.8.8: Usage templates keyed by (role, bucket) - see _usage_key
+_USAGE_TEMPLATES_SHOTS: Dict[Tuple[str, int], str] = {
+    ("extra", 1): "LOW PRESENCE ({pct}%) - background/functional role, 5-6 shots, must have PURPOSE (bartender, taxi driver, etc.)",
+    ("extra", 0): "MINIMAL PRESENCE ({pct}%) - background only, 1-2 shots MAX, must have PURPOSE",
+    ("supporting", 1): "MEDIUM PRESENCE ({pct}%) - appears in ~half the shots, interacts with lead",
+    ("supporting", 0): "LOW PRESENCE ({pct}%) - occasional appearances, supports the narrative",
+    ("lead", 3): "PRIMARY PROTAGONIST ({pct}%) - THE main character, appears in 80%+ of shots",
+    ("lead", 2): "CO-LEAD ({pct}%) - major character, appears in most shots (60%+)",
+    ("lead", 0): "SECONDARY LEAD ({pct}%) - important but not primary focus",
+}
+
+_USAGE_TEMPLATES_SEQUENCES: Dict[Tuple[str, int], str] = {
+    ("extra", 1): "BACKGROUND ({pct}%) - appears in 2-3 sequences, functional role with PURPOSE",
+    ("extra", 0): "MINIMAL ({pct}%) - appears in 1 sequence only, must have narrative PURPOSE",
+    ("supporting", 1): "RECURRING ({pct}%) - appears in ~half the sequences, supports lead",
+    ("supporting", 0): "OCCASIONAL ({pct}%) - few key appearances, supports narrative",
+    ("lead", 3): "PROTAGONIST ({pct}%) - THE main character, story follows them",
+    ("lead", 2): "CO-PROTAGONIST ({pct}%) - major character arc, most sequences",
+    ("lead", 0): "SECONDARY LEAD ({pct}%) - important but not the primary focus",
+}
+
+
+# v1.8.8: Roles are canonicalized (stripped, lowercased, interned) on write in
+# update_cast_properties, so readers only need .lower() for legacy data
+_CANON_ROLES = frozenset(("lead", "supporting", "extra"))
+
+
+def _canon_role(role: str) -> str:
+    """Return the canonical lowercase role, skipping .lower() for already-canonical values."""
+    return role if role in _CANON_ROLES else role.lower()
+
+
+def _usage_key(role: str, impact: float, is_primary_lead: bool) -> Tuple[str, int]:
     """
-    v1.8.9: Convert role + impact to LLM usage instruction.
     Role CONSTRAINS maximum presence, impact fine-tunes within that.
     
-    - LEAD: can be HIGH (70%+) or MEDIUM (40-69%)
-    - SUPPORTING: can be MEDIUM (40%+) or LOW (<40%)
-    - EXTRA: always LOW regardless of impact slider
+    - LEAD: primary (3), HIGH >= 70% (2), otherwise secondary (0)
+    - SUPPORTING: MEDIUM >= 50% (1) or LOW (0)
+    - EXTRA: always LOW tier, >= 50% (1) or minimal (0)
     """
-    role_lower = role.lower()
-    
-    if role_lower == "extra":
-        # Extras are ALWAYS low presence - but impact slider scales within that
-        if impact >= 0.5:
-            return f"LOW PRESENCE ({int(impact*100)}%) - background/functional role, 5-6 shots, must have PURPOSE (bartender, taxi driver, etc.)"
-        else:
-            return f"MINIMAL PRESENCE ({int(impact*100)}%) - background only, 1-2 shots MAX, must have PURPOSE"
-    
-    elif role_lower == "supporting":
-        # Supporting can be medium or low, never high
-        if impact >= 0.5:
-            return f"MEDIUM PRESENCE ({int(impact*100)}%) - appears in ~half the shots, interacts with lead"
-        else:
-            return f"LOW PRESENCE ({int(impact*100)}%) - occasional appearances, supports the narrative"
-    
-    else:  # lead
-        if is_primary_lead:
-            return f"PRIMARY PROTAGONIST ({int(impact*100)}%) - THE main character, appears in 80%+ of shots"
-        elif impact >= 0.7:
-            return f"CO-LEAD ({int(impact*100)}%) - major character, appears in most shots (60%+)"
-        else:
-            return f"SECONDARY LEAD ({int(impact*100)}%) - important but not primary focus"
+    role_lower = _canon_role(role)
+    if role_lower in ("extra", "supporting"):
+        return role_lower, 1 if impact >= 0.5 else 0
+    # Any other role is treated as lead
+    if is_primary_lead:
+        return "lead", 3
+    return "lead", 2 if impact >= 0.7 else 0
+
+
+def get_cast_usage_string(role: str, impact: float, is_primary_lead: bool = False) -> str:
+    """
+    v1.8.9: Convert role + impact to LLM usage instruction.
+    v1.8.8: Table lookup (see _usage_key) instead of per-call branching.
+    """
+    return _USAGE_TEMPLATES_SHOTS[_usage_key(role, impact, is_primary_lead)].format(pct=int(impact*100))
 
 
 def get_cast_usage_string_sequences(role: str, impact: float, is_primary_lead: bool = False) -> str:
     """
     v1.8.9: Usage string for sequence building. Same logic as shots but sequence-appropriate wording.
     """
-    role_lower = role.lower()
-    
-    if role_lower == "extra":
-        if impact >= 0.5:
-            return f"BACKGROUND ({int(impact*100)}%) - appears in 2-3 sequences, functional role with PURPOSE"
-        else:
-            return f"MINIMAL ({int(impact*100)}%) - appears in 1 sequence only, must have narrative PURPOSE"
-    
-    elif role_lower == "supporting":
-        if impact >= 0.5:
-            return f"RECURRING ({int(impact*100)}%) - appears in ~half the sequences, supports lead"
-        else:
-            return f"OCCASIONAL ({int(impact*100)}%) - few key appearances, supports narrative"
-    
-    else:  # lead
-        if is_primary_lead:
-            return f"PROTAGONIST ({int(impact*100)}%) - THE main character, story follows them"
-        elif impact >= 0.7:
-            return f"CO-PROTAGONIST ({int(impact*100)}%) - major character arc, most sequences"
-        else:
-            return f"SECONDARY LEAD ({int(impact*100)}%) - important but not the primary focus"
+    return _USAGE_TEMPLATES_SEQUENCES[_usage_key(role, impact, is_primary_lead)].format(pct=int(impact*100))
+
+
+_ROLE_PRIORITY = {"lead": 0, "supporting": 1, "extra": 2}
 
 
 def build_sorted_cast_info(state: Dict[str, Any], for_sequences: bool = False) -> List[Dict[str, Any]]:
@@ -84,37 +93,31 @@ def build_sorted_cast_info(state: Dict[str, Any], for_sequences: bool = False) -
     Returns:
         List of cast info dicts ready for LLM payload
     """
-    role_priority = {"lead": 0, "supporting": 1, "extra": 2}
-    cast_sorted = sorted(
-        state.get("cast", []),
-        key=lambda c: (role_priority.get(c.get("role", "extra").lower(), 2), -c.get("impact", 0.5))
-    )
-    
-    # Find the primary lead (first lead = highest impact lead after sorting)
-    primary_lead_id = None
-    for c in cast_sorted:
-        if c.get("role", "").lower() == "lead":
-            primary_lead_id = c["cast_id"]
-            break  # First lead in sorted list is primary
+    # v1.8.8: One normalize pass, one sort, one emit pass (primary lead detected inline)
+    # Sort keys are materialized once; itemgetter(0) returns the stored tuple as-is
+    rows = [
+        ((_ROLE_PRIORITY.get(_canon_role(c.get("role", "extra")), 2), -c.get("impact", 0.5)), c)
+        for c in state.get("cast", [])
+    ]
+    rows.sort(key=itemgetter(0))
     
+    usage_fn = get_cast_usage_string_sequences if for_sequences else get_cast_usage_string
+    primary_found = False
     cast_info = []
-    for c in cast_sorted:
+    for (priority, _), c in rows:
         role = c.get("role", "extra")
         impact = c.get("impact", 0.1 if role == "extra" else (0.5 if role == "supporting" else 0.7))
-        is_primary = (c["cast_id"] == primary_lead_id)
-        
-        if for_sequences:
-            usage = get_cast_usage_string_sequences(role, impact, is_primary)
-        else:
-            usage = get_cast_usage_string(role, impact, is_primary)
+        # First lead in sorted order (highest impact lead) is the primary lead
+        is_primary = priority == 0 and not primary_found
+        primary_found = primary_found or is_primary
         
         cast_info.append({
             "cast_id": c["cast_id"],
             "name": c.get("name", ""),
-            "role": role.upper() if not for_sequences else role,
+            "role": role if for_sequences else role.upper(),
             "impact": f"{int(impact*100)}%",
             "wardrobe": c.get("prompt_extra", ""),
-            "usage": usage,
+            "usage": usage_fn(role, impact, is_primary),
         })
     
     return cast_info
@@ -122,29 +125,82 @@ def build_sorted_cast_info(state: Dict[str, Any], for_sequences: bool = False) -
 
 # ========= Cast Lookup =========
 
+def get_cast_index(state: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    v1.8.8: {cast_id: cast} index, cached on the state under "_cast_index".
+    
+    Rebuilt when the cast list is replaced or changes length (add/delete);
+    in-place edits to cast members are visible through the index as-is.
+    Underscore keys are transient and stripped on save.
+    """
+    cast_list = state.get("cast", [])
+    cached = state.get("_cast_index")
+    if cached and cached[0] is cast_list and cached[1] == len(cast_list):
+        return cached[2]
+    index: Dict[str, Dict[str, Any]] = {}
+    for c in cast_list:
+        index.setdefault(c.get("cast_id"), c)  # First match wins, like a linear scan
+    state["_cast_index"] = (cast_list, len(cast_list), index)
+    return index
+
+
+def invalidate_cast_index(state: Dict[str, Any]) -> None:
+    """v1.8.8: Drop the cached cast_id index; call after adding/removing cast members."""
+    state.pop("_cast_index", None)
+
+
 def find_cast(state: Dict[str, Any], cast_id: str) -> Optional[Dict[str, Any]]:
     """Find a cast member by ID."""
-    for c in state.get("cast", []):
-        if c.get("cast_id") == cast_id:
-            return c
-    return None
+    return get_cast_index(state).get(cast_id)
+
+
+def _flatten_ref_urls(reference_images: List[Dict[str, Any]]) -> List[str]:
+    # Prefer fal_url (already uploaded), fallback to regular url
+    return [u for ref in reference_images if (u := ref.get("fal_url") or ref.get("url"))]
+
+
+def set_cast_reference_images(cast: Dict[str, Any], reference_images: List[Dict[str, Any]]) -> None:
+    """
+    v1.8.8: Assign reference_images and refresh the flattened "_ref_urls" cache.
+    Use this for in-place edits of existing entries too (e.g. filling in fal_url),
+    which the cache can't detect on its own.
+    """
+    cast["reference_images"] = reference_images
+    cast["_ref_urls"] = (reference_images, len(reference_images), _flatten_ref_urls(reference_images))
 
 
 def cast_ref_urls(cast: Dict[str, Any]) -> List[str]:
-    """Extract reference image URLs from a cast member."""
-    urls = []
-    for ref in cast.get("reference_images", []):
-        # Prefer fal_url (already uploaded), fallback to regular url
-        url = ref.get("fal_url") or ref.get("url")
-        if url:
-            urls.append(url)
-    return urls
+    """
+    Extract reference image URLs from a cast member.
+    v1.8.8: Served from the "_ref_urls" cache, rebuilt when reference_images is
+    replaced or changes length (same check as get_cast_index; stripped on save).
+    """
+    reference_images = cast.get("reference_images") or []
+    cached = cast.get("_ref_urls")
+    if not (cached and cached[0] is reference_images and cached[1] == len(reference_images)):
+        cached = (reference_images, len(reference_images), _flatten_ref_urls(reference_images))
+        cast["_ref_urls"] = cached
+    return list(cached[2])
+
+
+def public_cast(cast: Dict[str, Any]) -> Dict[str, Any]:
+    """v1.8.8: Copy of a cast member without transient "_" keys, for API responses."""
+    return {k: v for k, v in cast.items() if not k.startswith("_")}
+
+
+# v1.8.8: Read-only empty sentinel so lookups on projects without refs allocate nothing
+_NO_CHAR_REFS: Mapping[str, Dict[str, Any]] = MappingProxyType({})
+
+
+def _char_refs(state: Dict[str, Any]) -> Mapping[str, Dict[str, Any]]:
+    """v1.8.8: state["cast_matrix"]["character_refs"] if present, else a shared empty mapping."""
+    cm = state.get("cast_matrix")
+    return (cm.get("character_refs") if cm else None) or _NO_CHAR_REFS
 
 
 def get_identity_url(state: Dict[str, Any], cast_id: str) -> Optional[str]:
     """Prefer canonical styled ref_a from cast_matrix; fallback to first uploaded reference image."""
-    cm = state.get("cast_matrix") or {}
-    refs = (cm.get("character_refs") or {}).get(cast_id) or {}
+    refs = _char_refs(state).get(cast_id)
     if isinstance(refs, dict) and refs.get("ref_a"):
         return refs["ref_a"]
     c = find_cast(state, cast_id)
@@ -160,16 +216,9 @@ def get_cast_refs_for_shot(state: Dict[str, Any], shot: Dict[str, Any]) -> List[
     Returns ref_a URLs for each cast member in the shot.
     """
     cast_ids = shot.get("cast", [])
-    char_refs = state.get("cast_matrix", {}).get("character_refs", {})
-    refs = []
-    
-    for cid in cast_ids:
-        char = char_refs.get(cid, {})
-        ref_a = char.get("ref_a")
-        if ref_a:
-            refs.append(ref_a)
-    
-    return refs
+    # v1.8.8: Direct lookups, no {} defaults
+    char_refs = _char_refs(state)
+    return [a for cid in cast_ids if (ref := char_refs.get(cid)) and (a := ref.get("ref_a"))]
 
 
 def get_lead_cast_ref(state: Dict[str, Any], shot: Dict[str, Any]) -> Optional[str]:
@@ -178,13 +227,10 @@ def get_lead_cast_ref(state: Dict[str, Any], shot: Dict[str, Any]) -> Optional[s
     if not cast_ids:
         return None
     
-    lead_id = cast_ids[0]
-    char_refs = state.get("cast_matrix", {}).get("character_refs", {})
-    return char_refs.get(lead_id, {}).get("ref_a")
+    ref = _char_refs(state).get(cast_ids[0])
+    return ref.get("ref_a") if ref else None
 
 
-# ========= Cast Visual DNA =========
-
 def create_cast_visual_dna(
     cast_id: str,
     name: str,
@@ -193,7 +239,7 @@ def create_cast_visual_dna(
     fal_url: str
 ) -> Dict[str, Any]:
     """Create a new cast visual DNA entry."""
-    return {
+    cast = {
         "cast_id": cast_id,
         "name": name,
         "role": role,
@@ -213,6 +259,8 @@ def create_cast_visual_dna(
         "impact": 0.7,  # Default impact
         "prompt_extra": "",  # Extra prompt override
     }
+    set_cast_reference_images(cast, cast["reference_images"])
+    return cast
 
 
 def update_cast_properties(
@@ -226,7 +274,7 @@ def update_cast_properties(
     if name is not None:
         cast["name"] = str(name).strip()
     if role is not None:
-        cast["role"] = str(role).strip().lower()
+        cast["role"] = sys.intern(str(role).strip().lower())
     if impact is not None:
         cast["impact"] = clamp(float(impact), 0.0, 1.0)
     if prompt_extra is not None:
@@ -266,15 +314,18 @@ def delete_cast_from_state(state: Dict[str, Any], cast_id: str) -> bool:
     Remove a cast member from state.
     Returns True if found and deleted.
     """
-    cast_list = state.get("cast", [])
-    original_len = len(cast_list)
-    state["cast"] = [c for c in cast_list if c.get("cast_id") != cast_id]
-    
-    if len(state["cast"]) == original_len:
+    # v1.8.8: O(1) membership check, then delete in place (cast_ids are unique)
+    if cast_id not in get_cast_index(state):
         return False
+    cast_list = state["cast"]
+    for i, c in enumerate(cast_list):
+        if c.get("cast_id") == cast_id:
+            del cast_list[i]
+            break
+    invalidate_cast_index(state)
     
     # Also remove from character_refs
-    char_refs = state.get("cast_matrix", {}).get("character_refs", {})
+    char_refs = _char_refs(state)
     if cast_id in char_refs:
         del char_refs[cast_id]
     
@@ -290,33 +341,29 @@ def set_character_refs(
     ref_b: Optional[str] = None
 ) -> Dict[str, Any]:
     """Set character ref_a and/or ref_b for a cast member."""
-    char_refs = state.setdefault("cast_matrix", {}).setdefault("character_refs", {})
-    
-    if cast_id not in char_refs:
-        char_refs[cast_id] = {}
+    entry = state.setdefault("cast_matrix", {}).setdefault("character_refs", {}).setdefault(cast_id, {})
     
     if ref_a is not None:
-        char_refs[cast_id]["ref_a"] = ref_a
+        entry["ref_a"] = ref_a
     if ref_b is not None:
-        char_refs[cast_id]["ref_b"] = ref_b
+        entry["ref_b"] = ref_b
     
-    return char_refs[cast_id]
+    return entry
 
 
 def get_character_refs(state: Dict[str, Any], cast_id: str) -> Dict[str, Any]:
     """Get character refs for a cast member."""
-    return state.get("cast_matrix", {}).get("character_refs", {}).get(cast_id, {})
+    return _char_refs(state).get(cast_id, {})
 
 
 # ========= Cast Prompts =========
 
 def build_cast_prompt_tokens(cast: Dict[str, Any]) -> List[str]:
     """Build prompt tokens for a cast member."""
-    tokens = cast.get("text_tokens", []).copy()
+    tokens = cast.get("text_tokens", [])
     extra = cast.get("prompt_extra", "").strip()
-    if extra:
-        tokens.insert(0, extra)
-    return tokens
+    # v1.8.8: One list build either way (no copy + insert(0) shift); result is always a fresh list
+    return [extra, *tokens] if extra else list(tokens)
 
 
 def build_ref_prompt(
@@ -348,15 +395,19 @@ def get_scene_by_id(state: Dict[str, Any], scene_id: str) -> Optional[Dict[str,
     return None
 
 
-def get_scene_for_shot(state: Dict[str, Any], shot: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-    """Get the scene associated with a shot."""
+def _shot_scene_id(shot: Dict[str, Any]) -> Optional[str]:
     scene_id = shot.get("scene_id")
     if not scene_id:
         # Try to derive from sequence
         seq_id = shot.get("sequence_id")
         if seq_id:
             scene_id = f"scene_{seq_id.split('_')[-1]}" if seq_id.startswith("seq_") else None
-    
+    return scene_id
+
+
+def get_scene_for_shot(state: Dict[str, Any], shot: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Get the scene associated with a shot."""
+    scene_id = _shot_scene_id(shot)
     if scene_id:
         return get_scene_by_id(state, scene_id)
     return None
@@ -375,3 +426,62 @@ def get_scene_wardrobe(scene: Dict[str, Any]) -> str:
 def get_scene_wardrobe_ref(scene: Dict[str, Any]) -> Optional[str]:
     """Get wardrobe reference image for a scene."""
     return scene.get("wardrobe_ref") if scene else None
+
+
+# ========= Shot Plan =========
+
+def build_ref_index(state: Dict[str, Any], key: str = "ref_a") -> Dict[str, str]:
+    """v1.8.8: {cast_id: refs[key]} for every cast member that has that ref. Build once per batch."""
+    return {
+        cid: refs[key] for cid, refs in _char_refs(state).items()
+        if isinstance(refs, dict) and refs.get(key)
+    }
+
+
+def build_ref_a_index(state: Dict[str, Any]) -> Dict[str, str]:
+    """v1.8.8: {cast_id: ref_a}, the batch form of get_cast_refs_for_shot/get_lead_cast_ref."""
+    return build_ref_index(state, "ref_a")
+
+
+def build_shot_plan(
+    state: Dict[str, Any],
+    shots: Optional[List[Dict[str, Any]]] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    v1.8.8: Resolve what the shot renderer looks up per shot, for many shots in one pass.
+    Returns {shot_id: {seq_idx, scene, decor_refs, wardrobe, wardrobe_ref, cast_refs,
+    closeup_refs, lead_ref}}: the shot's sequence index, the cast_matrix scene at that
+    index and its decor refs / stripped wardrobe text / wardrobe ref ([], "" and None
+    without a scene), {cast_id: ref_a} and {cast_id: ref_b} for its cast (in shot
+    order, members without the ref omitted), and the first cast member's ref_a.
+    The ref indexes are built once for the batch.
+    
+    Build once per render batch and hand each shot its entry. The plan is not kept
+    in state: scenes and character refs are edited in place by many endpoints.
+    """
+    if shots is None:
+        shots = state.get("storyboard", {}).get("shots", [])
+    scenes = state.get("cast_matrix", {}).get("scenes", [])
+    ref_a_index = build_ref_a_index(state)
+    ref_b_index = build_ref_index(state, "ref_b")
+    seq_index: Dict[str, int] = {}
+    for i, seq in enumerate(state.get("storyboard", {}).get("sequences", [])):
+        seq_index.setdefault(seq.get("sequence_id"), i)
+    
+    plan = {}
+    for shot in shots:
+        seq_id = shot.get("sequence_id")
+        seq_idx = seq_index.get(seq_id) if seq_id else None
+        cast_ids = shot.get("cast") or []
+        scene = scenes[seq_idx] if seq_idx is not None and seq_idx < len(scenes) else None
+        plan[shot.get("shot_id")] = {
+            "seq_idx": seq_idx,
+            "scene": scene,
+            "decor_refs": get_scene_decor_refs(scene) or [],
+            "wardrobe": (get_scene_wardrobe(scene) or "").strip(),
+            "wardrobe_ref": get_scene_wardrobe_ref(scene),
+            "cast_refs": {cid: ref_a_index[cid] for cid in cast_ids if cid in ref_a_index},
+            "closeup_refs": {cid: ref_b_index[cid] for cid in cast_ids if cid in ref_b_index},
+            "lead_ref": ref_a_index.get(cast_ids[0]) if cast_ids else None,
+        }
+    return plan
@@ -4,18 +4,45 @@
 import os
 import re
 import json
+import logging
+import queue
 import time
 import uuid
 import asyncio
+import functools
 import threading
 import requests
 import fal_client
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple, Callable
 
+# v1.8.8: orjson (Rust) for debug log serialization - stdlib json is the fallback
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # ========= Version =========
 VERSION = "1.8.8"
 
+# ========= Logging =========
+# v1.8.8: "frepathe.*" loggers for hot paths. Output matches the "[LEVEL] message"
+# print style used elsewhere; LOG_LEVEL env var (default INFO) controls verbosity.
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").strip().upper() or "INFO"
+
+_root_logger = logging.getLogger("frepathe")
+if not _root_logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("[%(levelname)s] %(message)s"))
+    _root_logger.addHandler(_handler)
+    _root_logger.propagate = False
+_root_logger.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Get a child of the "frepathe" logger (e.g. "frepathe.render")."""
+    return logging.getLogger(name)
+
 # ========= Threading Locks =========
 PROJECT_LOCKS: Dict[str, threading.Lock] = {}
 PROJECT_LOCKS_LOCK = threading.Lock()
@@ -38,11 +65,14 @@ UPLOADS_DIR = DATA / "uploads"
 RENDERS_DIR = DATA / "renders"
 DEBUG_DIR = DATA / "debug"
 
-# Create default directories
-PROJECTS_DIR.mkdir(parents=True, exist_ok=True)
-UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
-RENDERS_DIR.mkdir(parents=True, exist_ok=True)
-DEBUG_DIR.mkdir(parents=True, exist_ok=True)
+# Create default directories (v1.8.8: skip the mkdir syscall when already present)
+def ensure_dirs(*dirs: Path) -> None:
+    """Create any of the given directories that do not exist yet."""
+    for d in dirs:
+        if not d.is_dir():
+            d.mkdir(parents=True, exist_ok=True)
+
+ensure_dirs(PROJECTS_DIR, UPLOADS_DIR, RENDERS_DIR, DEBUG_DIR)
 
 # ========= Path Manager (User-configurable workspace) =========
 def get_path_manager():
@@ -56,17 +86,45 @@ def get_path_manager():
     workspace_root = get_workspace_root()
     return PathManager(workspace_root)
 
-# Global PathManager instance
-PATH_MANAGER = None
+# v1.8.8: Global PathManager is built lazily on first use, not at import
+_PATH_MANAGER = None
+_PATH_MANAGER_LOCK = threading.Lock()
+
+# v1.8.8: Resolved render paths keyed by (url, project_location), filled by
+# render_service.resolve_render_path. Tied to the current workspace root, so
+# init_path_manager() clears it (settings_service.update_workspace_root).
+RENDER_PATH_CACHE: Dict[Tuple[str, str], Path] = {}
+
+def get_pm():
+    """Return the shared PathManager, constructing it on first call."""
+    global _PATH_MANAGER
+    if _PATH_MANAGER is None:
+        with _PATH_MANAGER_LOCK:
+            if _PATH_MANAGER is None:
+                _PATH_MANAGER = get_path_manager()
+    return _PATH_MANAGER
 
 def init_path_manager():
-    """Initialize global PathManager instance."""
-    global PATH_MANAGER
-    PATH_MANAGER = get_path_manager()
-    return PATH_MANAGER
+    """(Re)initialize global PathManager instance, e.g. after the workspace root changes."""
+    global _PATH_MANAGER
+    with _PATH_MANAGER_LOCK:
+        _PATH_MANAGER = get_path_manager()
+        RENDER_PATH_CACHE.clear()
+    return _PATH_MANAGER
 
-# Initialize on module load
-PATH_MANAGER = init_path_manager()
+
+class _LazyPathManager:
+    """Forwards attribute access to get_pm() so `from .config import PATH_MANAGER` stays valid."""
+    __slots__ = ()
+
+    def __getattr__(self, name):
+        return getattr(get_pm(), name)
+
+    def __repr__(self):
+        return f"<lazy {get_pm()!r}>"
+
+
+PATH_MANAGER = _LazyPathManager()
 
 # ========= Export Status (in-memory) =========
 EXPORT_STATUS: Dict[str, Dict[str, Any]] = {}
@@ -86,6 +144,23 @@ FAL_FLUX2_EDIT = f"{FAL_BASE}/fal-ai/flux-2/edit"
 FAL_NANOBANANA_EDIT = f"{FAL_BASE}/fal-ai/nano-banana-pro/edit"
 FAL_SEEDREAM45_EDIT = f"{FAL_BASE}/fal-ai/bytedance/seedream/v4.5/edit"
 
+# v1.8.8: FAL CDN storage (direct streaming upload, see render_service.upload_file_to_fal)
+FAL_STORAGE_INITIATE = "https://rest.alpha.fal.ai/storage/upload/initiate?storage_type=fal-cdn-v3"
+
+# v1.8.8: Pooled HTTP sessions (keep-alive across requests, sized for RENDER_SEMAPHORE + audio tasks)
+HTTP_POOL_SIZE = 16
+
+def _pooled_session() -> requests.Session:
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE)
+    session.mount("https://", adapter)
+    return session
+
+FAL_SESSION = _pooled_session()
+OPENAI_SESSION = _pooled_session()
+CLAUDE_SESSION = _pooled_session()
+OPENAI_TRANSCRIPTIONS = "https://api.openai.com/v1/audio/transcriptions"
+
 # Image-to-Video (img2vid)
 FAL_LTX2_I2V = f"{FAL_BASE}/fal-ai/ltx-2-19b/distilled/image-to-video/lora"
 FAL_KLING_I2V = f"{FAL_BASE}/fal-ai/kling-video/v2.6/pro/image-to-video"
@@ -172,33 +247,45 @@ FAL_SEEDREAM45 = FAL_SEEDREAM45_T2I
 FAL_FLUX2 = FAL_FLUX2_T2I
 
 # ========= Locked Render Models =========
+# v1.8.8: Built once; locked_render_models hands out copies (result is stored in project state)
+_RENDER_MODELS_FLUX2 = {
+    "image_model": "fal-ai/flux-2",
+    "identity_model": None,
+    "img2img_editor": "flux2_edit",
+    "available_editors": ("flux2_edit", "nanobanana_edit", "seedream45_edit"),
+}
+_RENDER_MODELS_SEEDREAM45 = {
+    "image_model": "fal-ai/bytedance/seedream/v4.5/text-to-image",
+    "identity_model": None,
+    "img2img_editor": "seedream45_edit",
+    "available_editors": ("seedream45_edit", "nanobanana_edit", "flux2_edit"),
+}
+_RENDER_MODELS_NANOBANANA = {
+    "image_model": "fal-ai/nano-banana-pro",
+    "identity_model": None,
+    "img2img_editor": "nanobanana_edit",
+    "available_editors": ("nanobanana_edit", "seedream45_edit", "flux2_edit"),
+}
+_RENDER_MODELS_BY_CHOICE = {
+    "flux2": _RENDER_MODELS_FLUX2,
+    "flux_2": _RENDER_MODELS_FLUX2,
+    "seedream45": _RENDER_MODELS_SEEDREAM45,
+    "seedream_45": _RENDER_MODELS_SEEDREAM45,
+    "seedream": _RENDER_MODELS_SEEDREAM45,
+    "seedream4.5": _RENDER_MODELS_SEEDREAM45,
+    "seedream4_5": _RENDER_MODELS_SEEDREAM45,
+}
+
+
 def locked_render_models(image_model_choice: str) -> Dict[str, Any]:
     """
     Hard-lock render models for ALL still images based on project image generator selection.
     UI values: nanobanana | seedream45 | flux2
     """
     m = (image_model_choice or "nanobanana").strip().lower()
-    if m in ("flux2", "flux_2"):
-        return {
-            "image_model": "fal-ai/flux-2",
-            "identity_model": None,
-            "img2img_editor": "flux2_edit",
-            "available_editors": ["flux2_edit", "nanobanana_edit", "seedream45_edit"],
-        }
-    if m in ("seedream45", "seedream_45", "seedream", "seedream4.5", "seedream4_5"):
-        return {
-            "image_model": "fal-ai/bytedance/seedream/v4.5/text-to-image",
-            "identity_model": None,
-            "img2img_editor": "seedream45_edit",
-            "available_editors": ["seedream45_edit", "nanobanana_edit", "flux2_edit"],
-        }
     # default: Nano Banana Pro
-    return {
-        "image_model": "fal-ai/nano-banana-pro",
-        "identity_model": None,
-        "img2img_editor": "nanobanana_edit",
-        "available_editors": ["nanobanana_edit", "seedream45_edit", "flux2_edit"],
-    }
+    models = _RENDER_MODELS_BY_CHOICE.get(m, _RENDER_MODELS_NANOBANANA)
+    return {**models, "available_editors": list(models["available_editors"])}
 
 
 def locked_editor_key(state: Dict[str, Any]) -> str:
@@ -232,14 +319,33 @@ def require_key(name: str, value: str):
     if not value:
         raise HTTPException(500, f"Missing {name}. Put it in env var {name} and restart.")
 
+_FAL_HEADERS: Optional[Dict[str, str]] = None
+
 def fal_headers() -> Dict[str, str]:
-    """Get FAL API headers."""
-    require_key("FAL_KEY", FAL_KEY)
-    return {"Authorization": f"Key {FAL_KEY}", "Content-Type": "application/json"}
+    """
+    Get FAL API headers.
+    v1.8.8: Built once after FAL_KEY validates (env-constant); treat as read-only, .copy() to extend.
+    """
+    global _FAL_HEADERS
+    if _FAL_HEADERS is None:
+        require_key("FAL_KEY", FAL_KEY)
+        _FAL_HEADERS = {"Authorization": f"Key {FAL_KEY}", "Content-Type": "application/json"}
+    return _FAL_HEADERS
+
+_NOW_ISO_CACHE: Tuple[int, str] = (0, "")
 
 def now_iso() -> str:
-    """Current ISO timestamp."""
-    return time.strftime("%Y-%m-%dT%H:%M:%S")
+    """
+    Current ISO timestamp (local time, second resolution).
+    v1.8.8: strftime runs once per second; bursts reuse the cached string.
+    """
+    global _NOW_ISO_CACHE
+    t = int(time.time())
+    cached_t, cached = _NOW_ISO_CACHE
+    if t != cached_t:
+        cached = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(t))
+        _NOW_ISO_CACHE = (t, cached)  # Single tuple swap: racing threads store equal values
+    return cached
 
 def clamp(x: float, lo: float, hi: float) -> float:
     """Clamp value between lo and hi."""
@@ -252,62 +358,77 @@ def safe_float(x, default=0.0) -> float:
     except Exception:
         return float(default)
 
+# v1.8.8: Compiled once (sanitize_filename runs for every saved asset)
+_FILENAME_SEPS_RE = re.compile(r'[\s\-\.]+')
+_FILENAME_INVALID_RE = re.compile(r'[^a-zA-Z0-9_]')
+_FILENAME_UNDERSCORES_RE = re.compile(r'_+')
+
 def sanitize_filename(name: str, max_length: int = 50) -> str:
     """Convert string to safe filename."""
     if not name:
         return "unnamed"
-    safe = re.sub(r'[\s\-\.]+', '_', name)
-    safe = re.sub(r'[^a-zA-Z0-9_]', '', safe)
-    safe = re.sub(r'_+', '_', safe)
+    safe = _FILENAME_SEPS_RE.sub('_', name)
+    safe = _FILENAME_INVALID_RE.sub('', safe)
+    safe = _FILENAME_UNDERSCORES_RE.sub('_', safe)
     safe = safe.strip('_')
     if len(safe) > max_length:
         safe = safe[:max_length].rstrip('_')
     return safe or "unnamed"
 
+_STRUCTURE_TYPE_RE = re.compile(r'^(intro|verse|prechorus|pre[- ]chorus|chorus|bridge|breakdown|outro|instrumental)')
+
 def normalize_structure_type(s: str) -> str:
     """Normalize song structure type."""
     if not s:
         return "verse"
-    t = s.strip().lower()
-    for k in ["intro", "verse", "prechorus", "chorus", "bridge", "breakdown", "outro", "instrumental"]:
-        if t.startswith(k):
-            return k
-    if t.startswith("pre-chorus") or t.startswith("pre chorus"):
-        return "prechorus"
-    return "verse"
+    # v1.8.8: One anchored regex match instead of a startswith loop
+    m = _STRUCTURE_TYPE_RE.match(s.strip().lower())
+    if not m:
+        return "verse"
+    g = m.group(1)
+    return "prechorus" if g.startswith("pre") else g
 
 # ========= Retry Helper =========
-def retry_on_502(func: Callable, max_retries: int = 3, delay: float = 2.0):
-    """Retry function on 5xx errors with exponential backoff."""
+def retry_on_502_call(func: Callable, *args, max_retries: int = 3, delay: float = 2.0, **kwargs):
+    """
+    Call func(*args, **kwargs), retrying on 5xx errors with exponential backoff.
+    v1.8.8: Direct form - no wrapper closure per call.
+    """
     from fastapi import HTTPException
     
-    def wrapper(*args, **kwargs):
-        last_error = None
-        for attempt in range(max_retries):
-            try:
-                return func(*args, **kwargs)
-            except HTTPException as e:
-                if e.status_code >= 500 and attempt < max_retries - 1:
-                    wait = delay * (2 ** attempt)
-                    print(f"[WARN] {e.status_code} error, retry {attempt+1}/{max_retries} in {wait:.1f}s")
-                    time.sleep(wait)
-                    last_error = e
-                else:
-                    raise
-            except requests.exceptions.RequestException as e:
-                if attempt < max_retries - 1:
-                    wait = delay * (2 ** attempt)
-                    print(f"[WARN] Request error, retry {attempt+1}/{max_retries} in {wait:.1f}s")
-                    time.sleep(wait)
-                    last_error = e
-                else:
-                    raise HTTPException(502, f"Request failed after {max_retries} retries: {str(e)[:200]}")
-        raise last_error or HTTPException(502, "Max retries exceeded")
-    return wrapper
+    last_error = None
+    for attempt in range(max_retries):
+        try:
+            return func(*args, **kwargs)
+        except HTTPException as e:
+            if e.status_code >= 500 and attempt < max_retries - 1:
+                wait = delay * (2 ** attempt)
+                print(f"[WARN] {e.status_code} error, retry {attempt+1}/{max_retries} in {wait:.1f}s")
+                time.sleep(wait)
+                last_error = e
+            else:
+                raise
+        except requests.exceptions.RequestException as e:
+            if attempt < max_retries - 1:
+                wait = delay * (2 ** attempt)
+                print(f"[WARN] Request error, retry {attempt+1}/{max_retries} in {wait:.1f}s")
+                time.sleep(wait)
+                last_error = e
+            else:
+                raise HTTPException(502, f"Request failed after {max_retries} retries: {str(e)[:200]}")
+    raise last_error or HTTPException(502, "Max retries exceeded")
+
+
+def retry_on_502(func: Callable, max_retries: int = 3, delay: float = 2.0):
+    """Retry function on 5xx errors with exponential backoff (decorator form of retry_on_502_call)."""
+    return functools.update_wrapper(
+        functools.partial(retry_on_502_call, func, max_retries=max_retries, delay=delay),
+        func,
+    )
 
 # ========= Cost Tracking =========
-def track_cost(model: str, count: int = 1, project_id: str = None, state: Dict = None, note: str = None):
-    """Track API costs. Optional note for identifying the call type."""
+def _resolve_cost(model: str) -> Tuple[str, float]:
+    """Resolve a model alias to (endpoint, unit cost) from MODEL_TO_ENDPOINT/API_COSTS."""
     resolved_model = model
     if model.startswith("fal-ai/"):
         key = model.replace("fal-ai/", "")
@@ -315,22 +436,70 @@ def track_cost(model: str, count: int = 1, project_id: str = None, state: Dict =
             resolved_model = MODEL_TO_ENDPOINT[key]
     elif model in MODEL_TO_ENDPOINT:
         resolved_model = MODEL_TO_ENDPOINT[model]
+    return resolved_model, API_COSTS.get(resolved_model, API_COSTS.get(model, API_COSTS.get("default", 0.03)))
+
+
+# v1.8.8: Flat {model: (endpoint, unit cost)} map; rebuilt whenever API_COSTS changes
+RESOLVED_COSTS: Dict[str, Tuple[str, float]] = {}
+
+
+def rebuild_resolved_costs() -> None:
+    """Precompute cost resolution for every alias, fal-ai/ alias and endpoint id."""
+    RESOLVED_COSTS.clear()
+    for key in MODEL_TO_ENDPOINT:
+        RESOLVED_COSTS[key] = _resolve_cost(key)
+        RESOLVED_COSTS[f"fal-ai/{key}"] = _resolve_cost(f"fal-ai/{key}")
+    for name in API_COSTS:
+        RESOLVED_COSTS.setdefault(name, _resolve_cost(name))
+
+
+rebuild_resolved_costs()
+
+
+COST_CALLS_KEEP = 100
+COST_CALLS_HIGH_WATERMARK = 150
+
+# v1.8.8: Shots render concurrently on one shared state; cost ledger updates
+# (session and project) are serialized here. Never held while taking a project lock.
+COST_LOCK = threading.Lock()
+
+
+def add_state_cost(state: Dict, call_entry: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    v1.8.8: Append a call to state["costs"] and bump its total under COST_LOCK.
+    Returns a shallow copy of the ledger that is safe to serialize (e.g. costs_patch).
+    """
+    with COST_LOCK:
+        if "costs" not in state:
+            state["costs"] = {"total": 0.0, "calls": []}
+        costs = state["costs"]
+        costs["total"] = round(costs.get("total", 0.0) + call_entry["cost"], 4)
+        calls = costs.setdefault("calls", [])
+        calls.append(dict(call_entry))
+        # v1.8.8: Trim back to COST_CALLS_KEEP only past the high-watermark (amortized copy)
+        if len(calls) > COST_CALLS_HIGH_WATERMARK:
+            costs["calls"] = calls[-COST_CALLS_KEEP:]
+        return {**costs, "calls": list(costs["calls"])}
+
+
+def track_cost(model: str, count: int = 1, project_id: str = None, state: Dict = None, note: str = None):
+    """Track API costs. Optional note for identifying the call type."""
+    resolved = RESOLVED_COSTS.get(model)
+    if resolved is None:
+        resolved = RESOLVED_COSTS[model] = _resolve_cost(model)
+    resolved_model, unit_cost = resolved
     
-    cost = API_COSTS.get(resolved_model, API_COSTS.get(model, API_COSTS.get("default", 0.03))) * count
+    cost = unit_cost * count
     call_entry = {"model": resolved_model, "cost": round(cost, 4), "ts": time.time()}
     if note:
         call_entry["note"] = note
     
-    SESSION_COST["total"] += cost
-    SESSION_COST["calls"].append(call_entry.copy())
+    with COST_LOCK:
+        SESSION_COST["total"] += cost
+        SESSION_COST["calls"].append(call_entry)
     
     if state is not None:
-        if "costs" not in state:
-            state["costs"] = {"total": 0.0, "calls": []}
-        state["costs"]["total"] = round(state["costs"].get("total", 0.0) + cost, 4)
-        state["costs"]["calls"].append(call_entry.copy())
-        if len(state["costs"]["calls"]) > 100:
-            state["costs"]["calls"] = state["costs"]["calls"][-100:]
+        add_state_cost(state, call_entry)
 
 def fetch_live_pricing():
     """Fetch live pricing from fal.ai API."""
@@ -352,22 +521,64 @@ def fetch_live_pricing():
                 if endpoint_id and unit_price:
                     API_COSTS[endpoint_id] = unit_price
             PRICING_LOADED = True
+            rebuild_resolved_costs()
             print(f"[INFO] Loaded {len(data.get('prices', []))} prices from fal.ai")
     except Exception as e:
         print(f"[WARN] Failed to fetch live pricing: {e}")
 
 # ========= Logging =========
+# v1.8.8: Debug logs are serialized and written by one daemon thread, off the request path
+_LOG_QUEUE: "queue.Queue[Tuple[Path, Any]]" = queue.Queue(maxsize=512)
+_LOG_WRITER: Optional[threading.Thread] = None
+_LOG_WRITER_LOCK = threading.Lock()
+
+
+def dump_debug_json(payload: Any) -> bytes:
+    """Indented UTF-8 JSON for debug logs (orjson when available)."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(payload, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass  # Values orjson rejects (e.g. int > 64 bit) - stdlib handles them
+    return json.dumps(payload, indent=2, ensure_ascii=False).encode("utf-8")
+
+
+def _log_writer() -> None:
+    while True:
+        log_file, payload = _LOG_QUEUE.get()
+        try:
+            data = payload.encode("utf-8") if isinstance(payload, str) else dump_debug_json(payload)
+            log_file.write_bytes(data)
+        except Exception as e:
+            print(f"[WARN] Failed to write debug log {log_file.name}: {e}")
+        finally:
+            _LOG_QUEUE.task_done()
+
+
+def enqueue_debug_log(log_file: Path, payload: Any) -> None:
+    """
+    Queue a debug log for the background writer (dropped if the queue is full).
+    Strings are written as-is, anything else as indented JSON.
+    """
+    global _LOG_WRITER
+    if _LOG_WRITER is None:
+        with _LOG_WRITER_LOCK:
+            if _LOG_WRITER is None:
+                _LOG_WRITER = threading.Thread(target=_log_writer, name="debug-log-writer", daemon=True)
+                _LOG_WRITER.start()
+    try:
+        _LOG_QUEUE.put_nowait((log_file, payload))
+    except queue.Full:
+        print(f"[WARN] Debug log queue full, dropping {log_file.name}")
+
+
 def log_llm_call(endpoint: str, system: str, user: str, response: Any, project_id: str = "unknown"):
     """Log LLM prompts and responses for debugging."""
-    try:
-        ts = int(time.time())
-        log_file = DEBUG_DIR / f"{project_id}_llm_{ts}.json"
-        log_file.write_text(json.dumps({
-            "timestamp": ts,
-            "endpoint": endpoint,
-            "system_prompt": system,
-            "user_prompt": user,
-            "response": response,
-        }, indent=2, ensure_ascii=False), encoding="utf-8")
-    except Exception as e:
-        print(f"[WARN] Failed to log LLM call: {e}")
+    ts = int(time.time())
+    enqueue_debug_log(DEBUG_DIR / f"{project_id}_llm_{ts}.json", {
+        "timestamp": ts,
+        "endpoint": endpoint,
+        "system_prompt": system,
+        "user_prompt": user,
+        "response": response,
+    })
@@ -2,25 +2,46 @@
 Fré Pathé v1.8.0 - Export Service
 Handles video export with FFmpeg and img2vid AI.
 """
+import hashlib
+import os
 import subprocess
 import shutil
+import threading
 import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from itertools import repeat
+from operator import itemgetter
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from fastapi import HTTPException
 
-from .config import PATH_MANAGER, DATA
+from .config import PATH_MANAGER, DATA, EXPORT_STATUS, get_logger
 from .project_service import (
     sanitize_filename,
     get_project_video_dir,
     download_image_locally,
 )
+from .render_service import resolve_render_path
+
+log = get_logger("frepathe.export")
 
 
 # ========= Export Status Tracking =========
+# v1.8.8: Status lives in config.EXPORT_STATUS so the polling endpoint and both
+# export paths (stills + img2vid) share one dict. Each project has one status dict
+# that is updated in place under EXPORT_STATUS_LOCK; readers get a copy taken under
+# the same lock, so pollers never see a torn status.
+
+EXPORT_STATUS_LOCK = threading.Lock()
+# Monotonic time of each project's last status update, for throttling only
+# (the polled "updated_at" field stays wall-clock)
+_EXPORT_STATUS_MONOTONIC: Dict[str, float] = {}
 
-EXPORT_STATUS: Dict[str, Dict[str, Any]] = {}
+# Minimum seconds between throttled progress updates (see update_export_status)
+EXPORT_STATUS_MIN_INTERVAL = 0.25
 
 
 def update_export_status(
@@ -28,33 +49,358 @@ def update_export_status(
     status: str, 
     current: int = 0, 
     total: int = 0, 
-    message: str = ""
+    message: str = "",
+    throttle: bool = False
 ) -> None:
-    """Update export status for polling."""
-    EXPORT_STATUS[project_id] = {
-        "status": status,  # "idle", "processing", "done", "error"
-        "current": current,
-        "total": total,
-        "message": message,
-        "updated_at": time.time()
-    }
+    """
+    Update export status for polling.
+    
+    v1.8.8: throttle=True (per-shot progress in loops) skips the update if the
+    last one was under EXPORT_STATUS_MIN_INTERVAL ago, except for the final step.
+    """
+    now = time.monotonic()
+    with EXPORT_STATUS_LOCK:
+        d = EXPORT_STATUS.get(project_id)
+        if d is None:
+            d = EXPORT_STATUS[project_id] = {}
+        elif throttle and current < total and now - _EXPORT_STATUS_MONOTONIC.get(project_id, 0) < EXPORT_STATUS_MIN_INTERVAL:
+            return
+        d["status"] = status  # "idle", "processing", "done", "error"
+        d["current"] = current
+        d["total"] = total
+        d["message"] = message
+        d.pop("percent", None)  # Set only during a step, by update_export_progress
+        d["updated_at"] = time.time()
+        _EXPORT_STATUS_MONOTONIC[project_id] = now
+
+
+def update_export_progress(project_id: str, percent: int, message: str) -> None:
+    """
+    v1.8.8: Report progress within the current export step (e.g. the final
+    encode) as "percent", leaving current/total as step counts. Throttled like
+    update_export_status(throttle=True); 100% is always written.
+    """
+    now = time.monotonic()
+    with EXPORT_STATUS_LOCK:
+        d = EXPORT_STATUS.get(project_id)
+        if d is None:
+            d = EXPORT_STATUS[project_id] = {"status": "processing", "current": 0, "total": 0}
+        elif percent < 100 and now - _EXPORT_STATUS_MONOTONIC.get(project_id, 0) < EXPORT_STATUS_MIN_INTERVAL:
+            return
+        d["percent"] = percent
+        d["message"] = message
+        d["updated_at"] = time.time()
+        _EXPORT_STATUS_MONOTONIC[project_id] = now
 
 
 def get_export_status(project_id: str) -> Dict[str, Any]:
     """Get export status for polling."""
-    return EXPORT_STATUS.get(project_id, {
+    with EXPORT_STATUS_LOCK:
+        status = EXPORT_STATUS.get(project_id)
+        if status:
+            return dict(status)
+    return {
         "status": "idle", 
         "current": 0, 
         "total": 0, 
         "message": ""
-    })
+    }
 
 
 # ========= FFmpeg Helpers =========
 
+# v1.8.8: Resolve the FFmpeg executable once; every command uses the absolute path
+_FFMPEG_PATH = shutil.which("ffmpeg")
+FFMPEG_BIN = _FFMPEG_PATH or "ffmpeg"
+
+
+FFPROBE_BIN = shutil.which("ffprobe")
+
+
 def check_ffmpeg() -> bool:
-    """Check if FFmpeg is available."""
-    return shutil.which("ffmpeg") is not None
+    """
+    Check if FFmpeg is available.
+    v1.8.8: A found binary is remembered, so export entry points don't walk PATH
+    again. A miss is re-checked on the next call, so FFmpeg installed while the
+    server runs is picked up without a restart.
+    """
+    global _FFMPEG_PATH, FFMPEG_BIN
+    if _FFMPEG_PATH is None:
+        _FFMPEG_PATH = shutil.which("ffmpeg")
+        if _FFMPEG_PATH is None:
+            return False
+        FFMPEG_BIN = _FFMPEG_PATH
+    return True
+
+
+def run_ffmpeg(
+    args: List[str],
+    on_progress: Optional[Callable[[float], None]] = None
+) -> Tuple[bool, str]:
+    """
+    v1.8.8: Run FFmpeg quietly (errors only, no banner/stats) with stdout discarded.
+    stderr is empty on the happy path and only decoded on failure.
+    
+    With on_progress, FFmpeg writes `-progress pipe:1` key=value lines to stdout
+    and on_progress(seconds_encoded) is called for every out_time_us update.
+    Returns (success, error_text).
+    """
+    cmd = [FFMPEG_BIN, "-hide_banner", "-loglevel", "error", "-nostats"]
+    if on_progress is None:
+        result = subprocess.run(
+            [*cmd, *args],
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+        )
+        returncode, stderr = result.returncode, result.stderr
+    else:
+        proc = subprocess.Popen(
+            [*cmd, "-progress", "pipe:1", *args],
+            stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        # Drain stderr on a side thread so a chatty failure can't block the pipe
+        err_chunks: List[bytes] = []
+        err_reader = threading.Thread(target=lambda: err_chunks.append(proc.stderr.read()), daemon=True)
+        err_reader.start()
+        for line in proc.stdout:
+            key, _, value = line.partition(b"=")
+            if key == b"out_time_us" and value.strip().isdigit():
+                on_progress(int(value) / 1_000_000)
+        returncode = proc.wait()
+        err_reader.join()
+        stderr = b"".join(err_chunks)
+    if returncode == 0:
+        return True, ""
+    return False, stderr.decode("utf-8", "replace")
+
+
+# v1.8.8: libx264 preset for exports. veryfast is several times faster than medium
+# at the same CRF; pass preset="medium"/"slow" to export_video for delivery quality.
+X264_PRESET = "veryfast"
+X264_PRESETS = ("ultrafast", "superfast", "veryfast", "faster", "fast", "medium", "slow", "slower", "veryslow")
+# v1.8.8: Hardware H.264 encoding when the FFmpeg build and a GPU support it
+NVENC_ARGS: Tuple[str, ...] = (
+    "-c:v", "h264_nvenc", "-preset", "p4", "-tune", "hq",
+    "-rc", "vbr", "-cq", "23", "-b:v", "0",
+)
+AMF_ARGS: Tuple[str, ...] = (
+    "-c:v", "h264_amf", "-quality", "balanced",
+    "-rc", "cqp", "-qp_i", "23", "-qp_p", "23",
+)
+# Img2vid clip trims favour speed; they are re-encoded again in the final concat
+# and run several at a time, so each gets 2 encoder threads to avoid oversubscription
+X264_FAST_ARGS: Tuple[str, ...] = ("-c:v", "libx264", "-preset", "fast", "-crf", "23", "-threads", "2")
+
+
+@lru_cache(maxsize=1)
+def _ffmpeg_encoders() -> str:
+    """`ffmpeg -encoders` output, read once per process ("" if FFmpeg can't run)."""
+    try:
+        return subprocess.run(
+            [FFMPEG_BIN, "-hide_banner", "-encoders"],
+            capture_output=True, text=True, timeout=10
+        ).stdout
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def _hw_encoder_usable(encoder: str) -> bool:
+    """
+    v1.8.8: True if the hardware encoder is usable. Builds often list hardware
+    encoders without the GPU/driver present, so a tiny test encode is run as well.
+    """
+    if encoder not in _ffmpeg_encoders():
+        return False
+    try:
+        probe = subprocess.run(
+            [FFMPEG_BIN, "-hide_banner", "-loglevel", "error",
+             "-f", "lavfi", "-i", "color=black:s=256x256:d=0.1",
+             "-c:v", encoder, "-f", "null", "-"],
+            capture_output=True, timeout=20
+        )
+    except (OSError, subprocess.SubprocessError):
+        return False
+    available = probe.returncode == 0
+    log.info("%s %s", encoder, "available" if available else "listed but not usable")
+    return available
+
+
+@lru_cache(maxsize=1)
+def detect_nvenc() -> bool:
+    """v1.8.8: True if h264_nvenc (NVIDIA) is usable. Probed once per process."""
+    return _hw_encoder_usable("h264_nvenc")
+
+
+@lru_cache(maxsize=1)
+def detect_amf() -> bool:
+    """v1.8.8: True if h264_amf (AMD) is usable and NVENC is not. Probed once per process."""
+    return not detect_nvenc() and _hw_encoder_usable("h264_amf")
+
+
+def has_hw_encoder() -> bool:
+    """v1.8.8: True if exports encode on a GPU (NVENC or AMF)."""
+    return detect_nvenc() or detect_amf()
+
+
+@lru_cache(maxsize=16)
+def video_codec_args(preset: str = X264_PRESET, tune: Optional[str] = None) -> Tuple[str, ...]:
+    """
+    v1.8.8: H.264 encoder args for export encodes: NVENC, then AMF, else libx264
+    with the given preset/tune. Hardware encoders keep their own quality settings.
+    """
+    if detect_nvenc():
+        return NVENC_ARGS
+    if detect_amf():
+        return AMF_ARGS
+    args = ("-c:v", "libx264", "-preset", preset, "-crf", "23")
+    return (*args, "-tune", tune) if tune else args
+
+
+def transcode_args(input_path: Path) -> Tuple[List[str], List[str]]:
+    """
+    v1.8.8: (input args, encoder args) for re-encoding an existing video clip.
+    With NVENC, decoding also runs on the GPU and frames stay in device memory
+    (-hwaccel_output_format cuda) through to the encoder, so there is no
+    per-frame copy between CPU and GPU.
+    """
+    if detect_nvenc():
+        return ["-hwaccel", "cuda", "-hwaccel_output_format", "cuda", "-i", str(input_path)], list(NVENC_ARGS)
+    return ["-i", str(input_path)], list(X264_FAST_ARGS)
+
+
+def scale_pad_filter(width: int, height: int) -> str:
+    """Letterbox filter: fit inside width x height, pad black, square pixels."""
+    return (
+        f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+        f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2:black,setsar=1"
+    )
+
+
+@lru_cache(maxsize=16)
+def still_frame_filter(width: int, height: int) -> str:
+    """
+    v1.8.8: Filter for a single decoded still: letterbox and convert to yuv420p
+    once, then clone that frame (tpad) instead of re-reading and re-scaling the
+    image for every output frame as `-loop 1` does. The clip length comes from -t.
+    """
+    return f"{scale_pad_filter(width, height)},format=yuv420p,tpad=stop=-1:stop_mode=clone"
+
+
+@lru_cache(maxsize=16)
+def still_input_args(fps: int) -> Tuple[str, ...]:
+    """v1.8.8: Input args preceding each still image path (read as one frame at the clip rate)."""
+    return ("-framerate", str(fps), "-i")
+
+
+@lru_cache(maxsize=16)
+def clip_encode_args(width: int, height: int, fps: int, preset: str = X264_PRESET) -> Tuple[str, ...]:
+    """
+    v1.8.8: Output args shared by every still clip of an export.
+    Built once per (resolution, fps, preset) instead of per shot.
+    """
+    return ("-vf", still_frame_filter(width, height), *clip_output_args(fps, preset))
+
+
+@lru_cache(maxsize=16)
+def clip_output_args(fps: int, preset: str = X264_PRESET) -> Tuple[str, ...]:
+    """
+    v1.8.8: Encoder/muxer args of a still clip, without the scale/pad filter.
+    tune=stillimage: x264 psy tuning for motion is wasted on held frames.
+    """
+    return (
+        *video_codec_args(preset, "stillimage"),
+        "-pix_fmt", "yuv420p",
+        "-r", str(fps),
+        "-threads", "2",  # Several clip encoders run side by side (see encode_clip_batch)
+        "-an",
+        "-bsf:v", "h264_mp4toannexb",
+        "-f", "mpegts",
+    )
+
+
+# ========= v1.8.8: Clip Cache =========
+# Still clips are content-addressed by (image identity, duration, resolution, fps,
+# encode args). The concat list points straight at the cached segments, so a
+# re-export after a single-shot edit only encodes that shot and no clip is copied
+# or linked per export. Oldest entries are evicted past the cap.
+
+CLIP_CACHE_MAX_BYTES = 4 * 1024 ** 3
+
+
+def clip_cache_dir() -> Path:
+    """Global clip cache: workspace_root/cache/clips"""
+    cache = PATH_MANAGER.cache_dir / "clips"
+    cache.mkdir(exist_ok=True)
+    return cache
+
+
+def clip_cache_key(
+    image_path: Path,
+    duration: float,
+    width: int,
+    height: int,
+    fps: int,
+    preset: str = X264_PRESET
+) -> str:
+    """Cache key for a still clip; changes when the image file or encode settings change."""
+    st = image_path.stat()
+    signature = "|".join([
+        str(image_path), str(st.st_mtime_ns), str(st.st_size),
+        f"{duration:.3f}", f"{width}x{height}", str(fps),
+        " ".join(clip_encode_args(width, height, fps, preset)),
+    ])
+    return hashlib.sha1(signature.encode("utf-8")).hexdigest()
+
+
+def cached_clip_path(cache_key: str) -> Path:
+    """Final location of a cached clip."""
+    return clip_cache_dir() / f"{cache_key}.ts"
+
+
+def lookup_cached_clip(cache_key: str) -> Optional[Path]:
+    """Return the cached clip for cache_key (marking it recently used), or None on a miss."""
+    cached = cached_clip_path(cache_key)
+    try:
+        os.utime(cached)  # LRU: mark as recently used; raises if missing
+    except OSError:
+        return None
+    return cached
+
+
+def commit_cached_clip(partial_path: Path, cache_key: str) -> Optional[Path]:
+    """
+    Move a freshly encoded clip into place. Clips are encoded to a .part file
+    next to their final name, so an interrupted encode is never served as a hit.
+    """
+    cached = cached_clip_path(cache_key)
+    try:
+        os.replace(partial_path, cached)
+    except OSError as e:
+        log.warning("Clip cache store failed (%s): %s", cache_key[:8], e)
+        return None
+    return cached
+
+
+def evict_clip_cache(max_bytes: int = CLIP_CACHE_MAX_BYTES) -> int:
+    """Delete least recently used clips until the cache fits max_bytes. Returns files removed."""
+    entries = []
+    total = 0
+    with os.scandir(clip_cache_dir()) as it:
+        for entry in it:
+            if entry.is_file():
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.unlink(path)
+            total -= size
+            removed += 1
+        except OSError:
+            pass
+    return removed
 
 
 def create_video_clip(
@@ -63,106 +409,392 @@ def create_video_clip(
     duration: float,
     width: int = 1920,
     height: int = 1080,
-    fps: int = 30
+    fps: int = 30,
+    preset: str = X264_PRESET
 ) -> bool:
     """
     Create a video clip from a single image.
+    
+    v1.8.8: This is the only video encode (crf 23 at the given preset, default
+    veryfast), with identical stream parameters for every clip, so the concat
+    step can stream-copy the video instead of running a second libx264 pass. Clips are MPEG-TS segments
+    (Annex B, in-band SPS/PPS) so they join cleanly without re-encoding.
     Returns True on success.
     """
-    cmd = [
-        "ffmpeg", "-y",
-        "-loop", "1",
-        "-i", str(image_path),
-        "-t", str(duration),
-        "-vf", f"scale={width}:{height}:force_original_aspect_ratio=decrease,pad={width}:{height}:(ow-iw)/2:(oh-ih)/2:black",
-        "-c:v", "libx264",
-        "-pix_fmt", "yuv420p",
-        "-r", str(fps),
+    ok, err = run_ffmpeg([
+        "-y",
+        *still_input_args(fps), str(image_path),
+        "-t", f"{duration:.3f}",
+        *clip_encode_args(width, height, fps, preset),
         str(output_path)
-    ]
-    
+    ])
+    if not ok:
+        log.error("FFmpeg clip creation failed: %s", err[:200])
+    return ok
+
+
+# v1.8.8: Max clips encoded by one FFmpeg process (bounds open inputs per process)
+CLIP_BATCH_SIZE = 16
+# v1.8.8: Concurrent FFmpeg processes for clip encoding (2 encoder threads each).
+# Defaults to half the vCPUs so workers x 2 threads fills the machine; the
+# EXPORT_WORKERS env var overrides it (e.g. to leave cores free for rendering).
+def _export_workers() -> int:
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        return True
-    except subprocess.CalledProcessError as e:
-        print(f"[ERROR] FFmpeg clip creation failed: {e.stderr[:200] if e.stderr else str(e)}")
-        return False
+        configured = int(os.environ.get("EXPORT_WORKERS", "0"))
+    except ValueError:
+        configured = 0
+    return configured if configured > 0 else max(1, (os.cpu_count() or 2) // 2)
+
+
+CLIP_ENCODE_WORKERS = _export_workers()
+# Consumer GPUs cap concurrent hardware encode sessions; one encoder per clip output
+NVENC_MAX_SESSIONS = 3
+
+
+def create_video_clips(
+    jobs: List[Tuple[Path, Path, float]],
+    width: int = 1920,
+    height: int = 1080,
+    fps: int = 30,
+    preset: str = X264_PRESET
+) -> bool:
+    """
+    v1.8.8: Create several still clips with a single FFmpeg process.
+    
+    jobs is a list of (image_path, output_path, duration). Every image is its own
+    input and every clip its own MPEG-TS output, so clips stay individually
+    cacheable while process startup and probing are paid once per batch.
+    Output is identical to create_video_clip. Returns True if all clips were written.
+    """
+    # Loop-invariant argv pieces are built once; only paths/durations vary per clip
+    vf = still_frame_filter(width, height)
+    in_args = still_input_args(fps)
+    out_args = clip_output_args(fps, preset)
+    
+    cmd = ["-y"]
+    for image_path, _, _ in jobs:
+        cmd.extend(in_args)
+        cmd.append(str(image_path))
+    cmd += ["-filter_complex", ";".join(f"[{i}:v]{vf}[v{i}]" for i in range(len(jobs)))]
+    for i, (_, output_path, duration) in enumerate(jobs):
+        cmd += ["-map", f"[v{i}]", "-t", f"{duration:.3f}"]
+        cmd.extend(out_args)
+        cmd.append(str(output_path))
+    
+    ok, err = run_ffmpeg(cmd)
+    if not ok:
+        log.error("FFmpeg batch clip creation failed (%d clips): %s", len(jobs), err[-200:])
+    return ok
+
+
+def encode_clip_batch(
+    jobs: List[Tuple[Path, Path, float]],
+    width: int,
+    height: int,
+    fps: int,
+    preset: str = X264_PRESET
+) -> List[bool]:
+    """
+    v1.8.8: Encode one batch of clips, falling back to one clip at a time if
+    the batch fails so a bad image only loses its own shot. Returns per-job success.
+    """
+    if create_video_clips(jobs, width, height, fps, preset):
+        return [True] * len(jobs)
+    return [create_video_clip(*job, width=width, height=height, fps=fps, preset=preset) for job in jobs]
+
+
+# v1.8.8: Longest "concat:a.ts|b.ts|..." input before falling back to a concat list
+# (keeps the command line well under the Windows 32K limit)
+CONCAT_PROTOCOL_MAX_CHARS = 8000
 
 
 def concat_clips_with_audio(
     concat_file: Path,
     audio_path: Path,
-    output_path: Path
+    output_path: Path,
+    copy_video: bool = False,
+    project_id: Optional[str] = None,
+    total_duration: float = 0.0,
+    clip_paths: Optional[List[Path]] = None,
+    preset: str = X264_PRESET
 ) -> bool:
     """
     Concatenate video clips and add audio using FFmpeg.
+    
+    v1.8.8: copy_video=True stream-copies the video (clips must share codec,
+    resolution, fps and pix_fmt, as create_video_clip guarantees). Img2vid clips
+    come from different models, so that path keeps the re-encode.
+    With project_id and total_duration, encode progress (from FFmpeg's -progress
+    output) is reported through update_export_progress as a percent.
+    
+    v1.8.8: When copying MPEG-TS clips (clip_paths given), they are joined with the
+    concat: protocol - plain byte concatenation, no per-file demuxer open/probe.
+    Long lists fall back to the concat demuxer reading concat_file.
     Returns True on success.
     """
+    video_input = ["-f", "concat", "-safe", "0", "-i", str(concat_file)]
+    if copy_video and clip_paths:
+        posix_paths = [p.as_posix() for p in clip_paths]
+        joined = "|".join(posix_paths)
+        if len(joined) <= CONCAT_PROTOCOL_MAX_CHARS and not any("|" in p for p in posix_paths):
+            video_input = ["-i", f"concat:{joined}"]
+    
+    if copy_video:
+        video_args = ["-c:v", "copy", "-movflags", "+faststart", "-f", "mp4"]
+    else:
+        video_args = [*video_codec_args(preset), "-pix_fmt", "yuv420p", "-threads", "0", "-movflags", "+faststart"]
+        if detect_nvenc():
+            # v1.8.8: NVDEC decode of the model clips. Frames are not pinned to CUDA
+            # memory here: clips from different models may need CPU format conversion.
+            video_input = ["-hwaccel", "cuda", *video_input]
+    
+    # v1.8.8: AAC sources are muxed as-is instead of being re-encoded
+    if probe_audio_codec(audio_path) == "aac":
+        audio_args = ["-c:a", "copy"]
+    else:
+        audio_args = ["-c:a", "aac", "-b:a", "192k"]
+    
     cmd = [
-        "ffmpeg", "-y",
-        "-f", "concat",
-        "-safe", "0",
-        "-i", str(concat_file),
+        "-y",
+        *video_input,
         "-i", str(audio_path),
-        "-c:v", "libx264",
-        "-preset", "medium",
-        "-crf", "23",
-        "-c:a", "aac",
-        "-b:a", "192k",
+        *video_args,
+        *audio_args,
         "-map", "0:v",
         "-map", "1:a",
         "-shortest",
         str(output_path)
     ]
     
-    result = subprocess.run(cmd, capture_output=True, text=True)
+    on_progress = None
+    if project_id and total_duration > 0:
+        def on_progress(seconds: float) -> None:
+            seconds = min(seconds, total_duration)
+            update_export_progress(
+                project_id, int(seconds * 100 // total_duration),
+                f"Encoding video {seconds * 100 / total_duration:.0f}% ({seconds:.1f}/{total_duration:.1f}s)"
+            )
+    
+    ok, err = run_ffmpeg(cmd, on_progress)
     
-    if result.returncode != 0:
-        print(f"[ERROR] FFmpeg concat failed: {result.stderr}")
+    if not ok:
+        log.error("FFmpeg concat failed: %s", err)
         return False
     
     return True
 
 
+@lru_cache(maxsize=64)
+def _probe_audio_codec(path_str: str, mtime_ns: int) -> str:
+    """Cached ffprobe of the first audio stream's codec (keyed on path + mtime)."""
+    try:
+        out = subprocess.run(
+            [FFPROBE_BIN, "-v", "error", "-select_streams", "a:0",
+             "-show_entries", "stream=codec_name", "-of", "default=nw=1:nk=1", path_str],
+            stdin=subprocess.DEVNULL, capture_output=True, timeout=30
+        )
+    except (OSError, subprocess.SubprocessError):
+        return ""
+    return out.stdout.decode("utf-8", "replace").strip() if out.returncode == 0 else ""
+
+
+def probe_audio_codec(audio_path: Path) -> str:
+    """
+    v1.8.8: Codec name of the first audio stream ("aac", "mp3", ...), or "" if
+    unknown (no ffprobe, unreadable file). Probed once per file version.
+    """
+    if not FFPROBE_BIN:
+        return ""
+    try:
+        mtime_ns = audio_path.stat().st_mtime_ns
+    except OSError:
+        return ""
+    return _probe_audio_codec(str(audio_path), mtime_ns)
+
+
+def probe_duration(path: Path) -> float:
+    """v1.8.8: Container duration in seconds via ffprobe (0.0 if unknown)."""
+    if not FFPROBE_BIN:
+        return 0.0
+    try:
+        out = subprocess.run(
+            [FFPROBE_BIN, "-v", "error", "-show_entries", "format=duration",
+             "-of", "default=nw=1:nk=1", str(path)],
+            stdin=subprocess.DEVNULL, capture_output=True, timeout=30
+        )
+        return float(out.stdout.decode("utf-8", "replace").strip() or 0)
+    except (OSError, subprocess.SubprocessError, ValueError):
+        return 0.0
+
+
+def trim_stream_copy(src: Path, dst: Path, target_dur: float, tolerance: float = 0.1) -> bool:
+    """
+    v1.8.8: Cut src to its first target_dur seconds without re-encoding.
+    The cut starts at 0 (a keyframe), so only the end is packet-accurate; the
+    result is accepted only if ffprobe puts it within tolerance of the target.
+    """
+    ok, _ = run_ffmpeg([
+        "-y", "-i", str(src),
+        "-t", f"{target_dur:.3f}",
+        "-c", "copy", "-an",
+        "-avoid_negative_ts", "make_zero",
+        str(dst)
+    ])
+    if ok and abs(probe_duration(dst) - target_dur) <= tolerance:
+        return True
+    dst.unlink(missing_ok=True)
+    return False
+
+
+def write_concat_file(concat_file: Path, clip_paths: List[Path]) -> None:
+    """
+    v1.8.8: Write an FFmpeg concat demuxer list in one write.
+    as_posix() gives the forward slashes the concat format requires on Windows;
+    a ' in a path (e.g. a project titled "Don't Stop") is closed, escaped and
+    reopened as '\\'' so the quoted entry stays intact.
+    """
+    lines = [
+        "file '" + p.as_posix().replace("'", "'\\''") + "'\n"
+        for p in clip_paths
+    ]
+    concat_file.write_text("".join(lines), encoding="utf-8")
+
+
 # ========= Video Export =========
 
-def resolve_image_path(img_url: str, state: Optional[Dict[str, Any]] = None) -> Optional[Path]:
+def export_paths(state: Dict[str, Any]) -> Tuple[Path, str]:
+    """
+    v1.8.8: (project video dir, sanitized title) for export output.
+    Memoized on the transient state["_export_paths"] and keyed on everything the
+    paths derive from, so repeated exports skip the folder resolution/mkdir chain
+    but pick up a renamed or moved project.
+    """
+    project = state.get("project", {})
+    title = project.get("title", "video")
+    signature = (
+        str(PATH_MANAGER.workspace_root), project.get("project_location"),
+        title, project.get("created_version"), project.get("id"),
+    )
+    cached = state.get("_export_paths")
+    if cached and cached[0] == signature and cached[1].is_dir():
+        return cached[1], cached[2]
+    video_dir = get_project_video_dir(state)
+    project_title = sanitize_filename(title, 30)
+    state["_export_paths"] = (signature, video_dir, project_title)
+    return video_dir, project_title
+
+
+def rendered_shots_by_start(shots: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    v1.8.8: Shots with a rendered image, sorted by start time.
+    Each start is converted to float once and sorted on with itemgetter
+    (stable, so equal starts keep storyboard order).
+    """
+    keyed = [(float(s.get("start", 0)), s) for s in shots if s.get("render", {}).get("image_url")]
+    keyed.sort(key=itemgetter(0))
+    return [s for _, s in keyed]
+
+
+def image_candidate_path(img_url: str, state: Optional[Dict[str, Any]] = None) -> Path:
     """
     v1.8.5: Resolve render URL to file path using PATH_MANAGER.
     Now accepts state for migrated project path resolution.
+    v1.8.8: Split out of resolve_image_path; does not check that the file exists.
     """
-    if img_url.startswith("/"):
+    if img_url.startswith("/files/") or img_url.startswith("/renders/"):
         # URL path - convert using PATH_MANAGER with state for project folder lookup
-        img_path = PATH_MANAGER.from_url(img_url, state)
+        return resolve_render_path(img_url, state)
+    elif Path(img_url).is_absolute():
+        return Path(img_url)
     else:
-        # Absolute path
-        img_path = Path(img_url)
-    
+        # Relative path - resolve from workspace root
+        return PATH_MANAGER.workspace_root / img_url
+
+
+def resolve_image_path(img_url: str, state: Optional[Dict[str, Any]] = None) -> Optional[Path]:
+    """Resolve render URL to an existing file path, or None."""
+    img_path = image_candidate_path(img_url, state)
     return img_path if img_path.exists() else None
 
 
+def video_candidate_path(video_url: str, state: Dict[str, Any], project_id: str) -> Path:
+    """Local path for a shot's video URL (/files/ or /renders/ URL, absolute, or project-relative)."""
+    if video_url.startswith("/files/") or video_url.startswith("/renders/"):
+        # v1.8.5: Pass state for migrated project path resolution
+        return PATH_MANAGER.from_url(video_url, state)
+    if Path(video_url).is_absolute():
+        return Path(video_url)
+    # Relative path - resolve from project dir
+    return get_project_video_dir(project_id) / video_url
+
+
+def list_existing_files(dirs) -> Dict[Path, set]:
+    """
+    v1.8.8: {dir: {file names}} with one os.scandir per directory (missing dirs map
+    to empty). Names are os.path.normcase'd to match case-insensitive filesystems.
+    """
+    listing: Dict[Path, set] = {}
+    for d in dirs:
+        try:
+            with os.scandir(d) as it:
+                listing[d] = {os.path.normcase(entry.name) for entry in it if entry.is_file()}
+        except OSError:
+            listing[d] = set()
+    return listing
+
+
+def discard_temp_dir(temp_dir: Path) -> None:
+    """
+    v1.8.8: Delete an export temp dir without holding up the response.
+    The dir is renamed aside first (one syscall), so the next export can reuse
+    its fixed name right away, and the copy is removed on a daemon thread.
+    """
+    trash = temp_dir.with_name(f"{temp_dir.name}.trash-{uuid.uuid4().hex[:8]}")
+    try:
+        os.replace(temp_dir, trash)
+    except OSError:
+        # Missing, or locked (Windows) - remove in place, best effort
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        return
+    threading.Thread(
+        target=shutil.rmtree, args=(trash,), kwargs={"ignore_errors": True},
+        name="export-temp-cleanup", daemon=True
+    ).start()
+
+
 def export_video(
     state: Dict[str, Any],
     project_id: str,
     fade_duration: float = 0.5,
     fps: int = 30,
-    resolution: str = "1920x1080"
+    resolution: str = "1920x1080",
+    preset: str = X264_PRESET
 ) -> Dict[str, Any]:
     """
     Export storyboard as video with FFmpeg.
     
+    v1.8.8: Every frame is encoded exactly once. Runs of shots on the same image
+    become one MPEG-TS clip each (cached across exports, batched and parallel
+    FFmpeg processes for misses); the final step only stream-copies the clips
+    and muxes the audio, so there is no second video encode pass.
+    
     Args:
         state: Project state
         project_id: Project ID
         fade_duration: Fade duration between scenes (currently unused with concat)
         fps: Frames per second
         resolution: Output resolution (e.g., "1920x1080")
+        preset: libx264 preset (ignored with hardware encoders). Output quality
+            follows it: the veryfast default trades some quality per bitrate
+            for speed; pass "medium" or "slow" for delivery exports.
     
     Returns:
         Dict with video_url, shots_exported, duration_sec, scene_transitions
     """
     if not check_ffmpeg():
         raise HTTPException(500, "FFmpeg not found. Install FFmpeg and add to PATH.")
+    if preset not in X264_PRESETS:
+        raise HTTPException(400, f"Unknown preset '{preset}'. Use one of: {', '.join(X264_PRESETS)}")
     
     shots = state.get("storyboard", {}).get("shots", [])
     sequences = state.get("storyboard", {}).get("sequences", [])
@@ -170,14 +802,11 @@ def export_video(
     if not shots:
         raise HTTPException(400, "No shots to export")
     
-    # Get rendered shots only
-    rendered_shots = [s for s in shots if s.get("render", {}).get("image_url")]
+    # Get rendered shots only, sorted by start time
+    rendered_shots = rendered_shots_by_start(shots)
     if not rendered_shots:
         raise HTTPException(400, "No rendered shots. Render shots first.")
     
-    # Sort by start time
-    rendered_shots.sort(key=lambda s: float(s.get("start", 0)))
-    
     # Get audio file
     audio_path = state.get("audio_file_path")
     if not audio_path or not Path(audio_path).exists():
@@ -189,62 +818,120 @@ def export_video(
     height = int(res_parts[1]) if len(res_parts) > 1 else width
     
     # Setup directories
-    video_dir = get_project_video_dir(state)
+    video_dir, project_title = export_paths(state)
     temp_dir = video_dir / "temp"
     temp_dir.mkdir(exist_ok=True)
     
     # Output path
-    project_title = sanitize_filename(state.get("project", {}).get("title", "video"), 30)
     output_path = video_dir / f"{project_title}_export.mp4"
     
     try:
         # Step 1: Create video clip for each shot
-        clip_paths = []
         skipped = []
+        reused = 0
         total_shots = len(rendered_shots)
         
-        print(f"[INFO] Processing {total_shots} rendered shots...")
+        log.info("Processing %d rendered shots...", total_shots)
         update_export_status(project_id, "processing", 0, total_shots, f"Starting export of {total_shots} shots...")
         
+        # v1.8.8: Pass 1 resolves shots and groups consecutive shots on the same image
+        # into runs (one clip per run, so a held frame is decoded/scaled/encoded once).
+        # Pass 2 restores cached runs; cache misses are encoded in batches in pass 3.
+        entries = []
+        runs: List[List[Dict[str, Any]]] = []
+        # v1.8.8: One directory listing per render folder instead of a stat per shot
+        candidates = [image_candidate_path(s["render"]["image_url"], state) for s in rendered_shots]
+        existing = list_existing_files({p.parent for p in candidates})
         for i, shot in enumerate(rendered_shots):
             img_url = shot["render"]["image_url"]
-            img_path = resolve_image_path(img_url)
+            img_path = candidates[i]
             
-            if not img_path:
-                print(f"[WARN] Shot {shot.get('shot_id')} image not found: {img_url}")
+            if os.path.normcase(img_path.name) not in existing[img_path.parent]:
+                log.warning("Shot %s image not found: %s", shot.get("shot_id"), img_url)
                 skipped.append(shot.get('shot_id', f'idx_{i}'))
                 continue
             
             duration = float(shot.get("end", 0)) - float(shot.get("start", 0))
             if duration <= 0:
-                print(f"[WARN] Shot {shot.get('shot_id')} has invalid duration: {duration}")
+                log.warning("Shot %s has invalid duration: %s", shot.get("shot_id"), duration)
                 skipped.append(shot.get('shot_id', f'idx_{i}'))
                 continue
             
-            clip_path = temp_dir / f"clip_{i:03d}.mp4"
-            
-            success = create_video_clip(
-                image_path=img_path,
-                output_path=clip_path,
-                duration=duration,
-                width=width,
-                height=height,
-                fps=fps
-            )
+            entry = {
+                "path": None,
+                "shot": shot,
+                "duration": duration,
+                "seq_id": shot.get("sequence_id", ""),
+                "ok": True,
+                "image": img_path,
+            }
+            entries.append(entry)
+            if runs and runs[-1][0]["image"] == img_path:
+                runs[-1].append(entry)
+            else:
+                runs.append([entry])
+        
+        pending = []
+        duplicates: Dict[str, List[List[Dict[str, Any]]]] = {}  # cache_key -> later runs sharing a pending clip
+        for run in runs:
+            lead = run[0]  # The run's clip path lives on its first entry
+            run_duration = sum(e["duration"] for e in run)
             
-            if success:
-                clip_paths.append({
-                    "path": clip_path,
-                    "shot": shot,
-                    "duration": duration,
-                    "seq_id": shot.get("sequence_id", "")
-                })
-                print(f"[INFO] Created clip {i+1}/{total_shots}: {shot.get('shot_id')} ({duration:.1f}s)")
-                update_export_status(project_id, "processing", i+1, total_shots, f"Created clip {i+1}/{total_shots}: {shot.get('shot_id')}")
+            # v1.8.8: Reuse an identical clip from a previous export when possible
+            cache_key = clip_cache_key(lead["image"], run_duration, width, height, fps, preset)
+            lead["path"] = lookup_cached_clip(cache_key)
+            if lead["path"]:
+                reused += len(run)
+            elif cache_key in duplicates:
+                duplicates[cache_key].append(run)  # Same image + duration already queued
             else:
-                skipped.append(shot.get('shot_id', f'idx_{i}'))
+                lead["path"] = cached_clip_path(cache_key).with_suffix(".ts.part")
+                duplicates[cache_key] = []
+                pending.append((run, run_duration, cache_key))
+        
+        done = reused
+        log.info("%d shots from cache, encoding %d clips (%d runs for %d shots)", reused, len(pending), len(runs), len(entries))
+        update_export_status(project_id, "processing", done, total_shots, f"Reused {reused} clips, encoding {len(pending)}...")
+        
+        # v1.8.8: Batches run in parallel FFmpeg processes. Hardware encode sessions are
+        # a GPU-wide limit, so on a GPU a single process encodes a few clips at a time.
+        if has_hw_encoder():
+            workers, batch_size = 1, NVENC_MAX_SESSIONS
+        else:
+            workers = CLIP_ENCODE_WORKERS
+            batch_size = min(CLIP_BATCH_SIZE, max(1, -(-len(pending) // workers)))
+        batches = [pending[b:b + batch_size] for b in range(0, len(pending), batch_size)]
+        
+        if batches:
+            with ThreadPoolExecutor(max_workers=min(workers, len(batches))) as pool:
+                futures = {
+                    pool.submit(
+                        encode_clip_batch,
+                        [(run[0]["image"], run[0]["path"], run_duration) for run, run_duration, _ in batch],
+                        width, height, fps, preset
+                    ): batch
+                    for batch in batches
+                }
+                for future in as_completed(futures):
+                    batch = futures[future]
+                    for (run, _, cache_key), ok in zip(batch, future.result()):
+                        final_path = commit_cached_clip(run[0]["path"], cache_key) if ok else None
+                        if not final_path:
+                            run[0]["path"].unlink(missing_ok=True)
+                        for r in (run, *duplicates[cache_key]):
+                            r[0]["path"] = final_path
+                            done += len(r)
+                            if not final_path:
+                                for e in r:
+                                    e["ok"] = False
+                                    skipped.append(e["shot"].get("shot_id"))
+                    
+                    log.info("Created clips %d/%d", done, total_shots)
+                    update_export_status(project_id, "processing", done, total_shots, f"Created clip {done}/{total_shots}", throttle=True)
+        
+        clip_paths = [e for e in entries if e["ok"]]
         
-        print(f"[INFO] Created {len(clip_paths)} clips, skipped {len(skipped)}")
+        log.info("Created %d clips (%d from cache), skipped %d", len(clip_paths), reused, len(skipped))
         
         if not clip_paths:
             update_export_status(project_id, "error", 0, 0, "No clips created")
@@ -252,21 +939,22 @@ def export_video(
         
         # Step 2: Create concat file
         total_duration = sum(c["duration"] for c in clip_paths)
-        print(f"[INFO] Expected video duration: {total_duration:.1f}s from {len(clip_paths)} clips")
+        log.info("Expected video duration: %.1fs from %d clips", total_duration, len(clip_paths))
         update_export_status(project_id, "processing", total_shots, total_shots, f"Concatenating {len(clip_paths)} clips...")
         
         concat_file = temp_dir / "concat.txt"
-        with open(concat_file, "w") as f:
-            for clip in clip_paths:
-                # FFmpeg concat format requires forward slashes
-                clip_path_str = str(clip["path"]).replace("\\", "/")
-                f.write(f"file '{clip_path_str}'\n")
+        run_paths = [run[0]["path"] for run in runs if run[0]["ok"]]
+        write_concat_file(concat_file, run_paths)
         
-        # Step 3: Concat and add audio
+        # Step 3: Concat cached clips and add audio (video stream-copied, the clip encode is the only one)
         success = concat_clips_with_audio(
             concat_file=concat_file,
             audio_path=Path(audio_path),
-            output_path=output_path
+            output_path=output_path,
+            copy_video=True,
+            project_id=project_id,
+            total_duration=total_duration,
+            clip_paths=run_paths
         )
         
         if not success:
@@ -279,20 +967,13 @@ def export_video(
             if clip_paths[i-1]["seq_id"] != clip_paths[i]["seq_id"]
         )
         
-        # Cleanup temp files
-        for clip in clip_paths:
-            try:
-                clip["path"].unlink()
-            except:
-                pass
-        try:
-            concat_file.unlink()
-        except:
-            pass
+        # v1.8.8: Keep the clip cache bounded
         try:
-            temp_dir.rmdir()
-        except:
-            pass
+            evicted = evict_clip_cache()
+            if evicted:
+                log.info("Evicted %d old clips from cache", evicted)
+        except OSError as e:
+            log.warning("Clip cache eviction failed: %s", e)
         
         # Return video URL relative to DATA
         rel_path = output_path.relative_to(DATA)
@@ -320,16 +1001,77 @@ def export_video(
     except Exception as e:
         update_export_status(project_id, "error", 0, 0, f"Export failed: {str(e)[:100]}")
         raise HTTPException(500, f"Export failed: {str(e)}")
+    finally:
+        # v1.8.8: One tree removal for all temp files, also after failed exports
+        # (still clips live in the clip cache, not in temp_dir)
+        discard_temp_dir(temp_dir)
 
 
 # ========= Img2Vid Export =========
 
+def adjust_img2vid_clip(index: int, clip: Dict[str, Any], temp_dir: Path) -> Path:
+    """
+    v1.8.8: Fit one img2vid clip to its storyboard duration and return the path
+    to concat (the original clip if no adjustment is needed or all attempts fail).
+    """
+    video_data = clip["shot"].get("render", {}).get("video", {})
+    actual_dur = float(video_data.get("duration", 0) or 0)
+    target_dur = float(video_data.get("target_duration") or clip["duration"] or 0)
+    
+    # Adjust if durations don't match (tolerance 0.1s)
+    if not (actual_dur > 0 and target_dur > 0 and abs(actual_dur - target_dur) > 0.1):
+        return clip["path"]
+    
+    # CASE A: Model output LONGER than target -> TRIM (no speed change, natural motion)
+    if actual_dur > target_dur:
+        trimmed_path = temp_dir / f"trimmed_{index:03d}.mp4"
+        # Cutting the tail needs no re-encode; the final concat encodes anyway
+        if trim_stream_copy(clip["path"], trimmed_path, target_dur):
+            log.info("[IMG2VID] %s trimmed (stream copy): %.1fs → %.1fs", clip["shot"].get("shot_id"), actual_dur, target_dur)
+            return trimmed_path
+        input_args, encode_args = transcode_args(clip["path"])
+        trim_cmd = [
+            "-y",
+            *input_args,
+            "-t", f"{target_dur:.3f}",
+            *encode_args,
+            "-an",  # No audio in individual clips
+            str(trimmed_path)
+        ]
+        if run_ffmpeg(trim_cmd)[0]:
+            log.info("[IMG2VID] %s trimmed: %.1fs → %.1fs", clip["shot"].get("shot_id"), actual_dur, target_dur)
+            return trimmed_path
+        log.warning("Trim failed for %s, falling back to speed adjust", clip["shot"].get("shot_id"))
+    
+    # CASE B: Model output SHORTER than target OR trim failed -> speed adjust
+    speed_factor = actual_dur / target_dur  # >1 = speedup, <1 = slowdown
+    adjusted_path = temp_dir / f"adjusted_{index:03d}.mp4"
+    
+    # Use setpts for video speed
+    input_args, encode_args = transcode_args(clip["path"])
+    speed_cmd = [
+        "-y",
+        *input_args,
+        "-filter:v", f"setpts=PTS/{speed_factor}",
+        *encode_args,
+        "-an",  # No audio in individual clips
+        str(adjusted_path)
+    ]
+    if run_ffmpeg(speed_cmd)[0]:
+        action = "sped up" if speed_factor > 1 else "slowed down"
+        log.info("[IMG2VID] %s %s %.2fx: %.1fs → %.1fs", clip["shot"].get("shot_id"), action, speed_factor, actual_dur, target_dur)
+        return adjusted_path
+    log.warning("Speed adjust failed for %s, using original", clip["shot"].get("shot_id"))
+    return clip["path"]
+
+
 def export_video_with_img2vid(
     state: Dict[str, Any],
     project_id: str,
     video_model: Optional[str] = None,
     fps: int = 30,
-    resolution: str = "1920x1080"
+    resolution: str = "1920x1080",
+    preset: str = X264_PRESET
 ) -> Dict[str, Any]:
     """
     Export storyboard using img2vid AI instead of static stills.
@@ -342,6 +1084,7 @@ def export_video_with_img2vid(
         video_model: Video model to use (None = use project setting)
         fps: Frames per second (for concat)
         resolution: Output resolution
+        preset: libx264 preset for the final encode (ignored with NVENC)
     
     Returns:
         Dict with video_url, shots_exported, duration_sec, generation_time
@@ -350,20 +1093,19 @@ def export_video_with_img2vid(
     
     if not check_ffmpeg():
         raise HTTPException(500, "FFmpeg not found. Install FFmpeg and add to PATH.")
+    if preset not in X264_PRESETS:
+        raise HTTPException(400, f"Unknown preset '{preset}'. Use one of: {', '.join(X264_PRESETS)}")
     
     shots = state.get("storyboard", {}).get("shots", [])
     
     if not shots:
         raise HTTPException(400, "No shots to export")
     
-    # Get rendered shots only
-    rendered_shots = [s for s in shots if s.get("render", {}).get("image_url")]
+    # Get rendered shots only, sorted by start time
+    rendered_shots = rendered_shots_by_start(shots)
     if not rendered_shots:
         raise HTTPException(400, "No rendered shots. Render shots first.")
     
-    # Sort by start time
-    rendered_shots.sort(key=lambda s: float(s.get("start", 0)))
-    
     # Get audio file
     audio_path = state.get("audio_file_path")
     if not audio_path or not Path(audio_path).exists():
@@ -376,12 +1118,11 @@ def export_video_with_img2vid(
             raise HTTPException(400, "No video model selected. Please select a video model in project settings.")
     
     # Setup directories
-    video_dir = get_project_video_dir(state)
+    video_dir, project_title = export_paths(state)
     temp_dir = video_dir / "temp_img2vid"
     temp_dir.mkdir(exist_ok=True)
     
     # Output path
-    project_title = sanitize_filename(state.get("project", {}).get("title", "video"), 30)
     output_path = video_dir / f"{project_title}_img2vid_export.mp4"
     
     try:
@@ -391,7 +1132,7 @@ def export_video_with_img2vid(
         total_shots = len(rendered_shots)
         generation_start = time.time()
         
-        print(f"[IMG2VID] Processing {total_shots} shots with {video_model} (concurrency=8)...")
+        log.info("[IMG2VID] Processing %d shots with %s (concurrency=8)...", total_shots, video_model)
         update_export_status(project_id, "processing", 0, total_shots, f"Generating videos with {video_model}...")
         
         # Generate all videos concurrently
@@ -401,33 +1142,37 @@ def export_video_with_img2vid(
         shot_ids_to_generate = [s.get("shot_id") for s in rendered_shots if not s.get("render", {}).get("video", {}).get("video_url")]
         
         if shot_ids_to_generate:
-            print(f"[IMG2VID] Generating {len(shot_ids_to_generate)} new videos...")
+            log.info("[IMG2VID] Generating %d new videos...", len(shot_ids_to_generate))
             batch_results = asyncio.run(generate_videos_for_shots(state, shot_ids_to_generate, video_model))
-            print(f"[IMG2VID] Batch complete: {batch_results['success']} success, {batch_results['failed']} failed, {batch_results['skipped']} skipped")
+            log.info("[IMG2VID] Batch complete: %s success, %s failed, %s skipped",
+                     batch_results["success"], batch_results["failed"], batch_results["skipped"])
         
         # Now collect all video clips
+        # v1.8.8: One directory listing per video folder instead of a stat per shot
+        video_urls = [shot.get("render", {}).get("video", {}).get("video_url") for shot in rendered_shots]
+        video_paths: List[Optional[Path]] = []
+        for video_url in video_urls:
+            try:
+                video_paths.append(video_candidate_path(video_url, state, project_id) if video_url else None)
+            except Exception:
+                video_paths.append(None)
+        existing = list_existing_files({p.parent for p in video_paths if p is not None})
+        
         for i, shot in enumerate(rendered_shots):
             shot_id = shot.get("shot_id", f"shot_{i}")
             
             try:
                 # All shots should now have video (either existing or just generated)
-                video_url = shot.get("render", {}).get("video", {}).get("video_url")
+                video_url = video_urls[i]
                 if not video_url:
                     raise Exception(f"No video URL for {shot_id}")
                 
-                print(f"[IMG2VID] Collecting video for {shot_id}")
-                
-                # Resolve to local path - handle both /files/ URLs and absolute paths
-                if video_url.startswith("/files/") or video_url.startswith("/renders/"):
-                    # v1.8.5: Pass state for migrated project path resolution
-                    video_path = PATH_MANAGER.from_url(video_url, state)
-                elif Path(video_url).is_absolute():
-                    video_path = Path(video_url)
-                else:
-                    # Relative path - resolve from project dir
-                    video_path = get_project_video_dir(project_id) / video_url
+                log.debug("[IMG2VID] Collecting video for %s", shot_id)
                 
-                if not video_path.exists():
+                video_path = video_paths[i]
+                if video_path is None:
+                    raise Exception(f"Cannot resolve video URL: {video_url}")
+                if os.path.normcase(video_path.name) not in existing[video_path.parent]:
                     raise Exception(f"Video file not found: {video_path}")
                 
                 duration = float(shot.get("end", 0)) - float(shot.get("start", 0))
@@ -439,15 +1184,15 @@ def export_video_with_img2vid(
                     "seq_id": shot.get("sequence_id", ""),
                 })
                 
-                print(f"[IMG2VID] Processed {i+1}/{total_shots}: {shot_id}")
-                update_export_status(project_id, "processing", i+1, total_shots, f"Generated video {i+1}/{total_shots}: {shot_id}")
+                log.info("[IMG2VID] Processed %d/%d: %s", i + 1, total_shots, shot_id)
+                update_export_status(project_id, "processing", i+1, total_shots, f"Generated video {i+1}/{total_shots}: {shot_id}", throttle=True)
                 
             except Exception as e:
-                print(f"[IMG2VID] Failed {shot_id}: {str(e)}")
+                log.warning("[IMG2VID] Failed %s: %s", shot_id, e)
                 skipped.append(shot_id)
         
         generation_time = time.time() - generation_start
-        print(f"[IMG2VID] Generated {len(video_clips)} videos in {generation_time:.1f}s")
+        log.info("[IMG2VID] Generated %d videos in %.1fs", len(video_clips), generation_time)
         
         if not video_clips:
             update_export_status(project_id, "error", 0, 0, "No video clips generated")
@@ -455,75 +1200,29 @@ def export_video_with_img2vid(
         
         # Step 2: Create concat file
         total_duration = sum(c["duration"] for c in video_clips)
-        print(f"[IMG2VID] Concatenating {len(video_clips)} clips (total {total_duration:.1f}s)...")
+        log.info("[IMG2VID] Concatenating %d clips (total %.1fs)...", len(video_clips), total_duration)
         update_export_status(project_id, "processing", total_shots, total_shots, f"Concatenating {len(video_clips)} video clips...")
         
         # v1.8.7: Trim/speed-adjust clips to match storyboard duration for audio sync
         # TRIM-FIRST: If model outputs 5s but target is 3.2s, TRIM don't speed up (preserves natural motion)
         # SPEED-UP: Only if trim failed or actual < target (rare)
-        adjusted_clips = []
-        for i, clip in enumerate(video_clips):
-            video_data = clip["shot"].get("render", {}).get("video", {})
-            actual_dur = float(video_data.get("duration", 0) or 0)
-            target_dur = float(video_data.get("target_duration") or clip["duration"] or 0)
-            
-            # Adjust if durations don't match (tolerance 0.1s)
-            if actual_dur > 0 and target_dur > 0 and abs(actual_dur - target_dur) > 0.1:
-                
-                # CASE A: Model output LONGER than target -> TRIM (no speed change, natural motion)
-                if actual_dur > target_dur:
-                    trimmed_path = temp_dir / f"trimmed_{i:03d}.mp4"
-                    trim_cmd = [
-                        "ffmpeg", "-y",
-                        "-i", str(clip["path"]),
-                        "-t", f"{target_dur:.3f}",
-                        "-c:v", "libx264", "-preset", "fast", "-crf", "23",
-                        "-an",  # No audio in individual clips
-                        str(trimmed_path)
-                    ]
-                    result = subprocess.run(trim_cmd, capture_output=True)
-                    if result.returncode == 0:
-                        print(f"[IMG2VID] {clip['shot'].get('shot_id')} trimmed: {actual_dur:.1f}s → {target_dur:.1f}s")
-                        adjusted_clips.append(trimmed_path)
-                        continue
-                    else:
-                        print(f"[WARN] Trim failed for {clip['shot'].get('shot_id')}, falling back to speed adjust")
-                
-                # CASE B: Model output SHORTER than target OR trim failed -> speed adjust
-                speed_factor = actual_dur / target_dur  # >1 = speedup, <1 = slowdown
-                adjusted_path = temp_dir / f"adjusted_{i:03d}.mp4"
-                
-                # Use setpts for video speed
-                speed_cmd = [
-                    "ffmpeg", "-y",
-                    "-i", str(clip["path"]),
-                    "-filter:v", f"setpts=PTS/{speed_factor}",
-                    "-c:v", "libx264", "-preset", "fast", "-crf", "23",
-                    "-an",  # No audio in individual clips
-                    str(adjusted_path)
-                ]
-                result = subprocess.run(speed_cmd, capture_output=True)
-                if result.returncode == 0:
-                    action = "sped up" if speed_factor > 1 else "slowed down"
-                    print(f"[IMG2VID] {clip['shot'].get('shot_id')} {action} {speed_factor:.2f}x: {actual_dur:.1f}s → {target_dur:.1f}s")
-                    adjusted_clips.append(adjusted_path)
-                else:
-                    print(f"[WARN] Speed adjust failed for {clip['shot'].get('shot_id')}, using original")
-                    adjusted_clips.append(clip["path"])
-            else:
-                adjusted_clips.append(clip["path"])
+        # v1.8.8: Clips are adjusted in parallel FFmpeg processes; map() keeps shot order.
+        # Hardware encode sessions are GPU-wide, so NVENC caps the pool.
+        workers = NVENC_MAX_SESSIONS if detect_nvenc() else CLIP_ENCODE_WORKERS
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(video_clips)))) as pool:
+            adjusted_clips = list(pool.map(adjust_img2vid_clip, range(len(video_clips)), video_clips, repeat(temp_dir)))
         
         concat_file = temp_dir / "concat.txt"
-        with open(concat_file, "w") as f:
-            for clip_path in adjusted_clips:
-                clip_path_str = str(clip_path).replace("\\", "/")
-                f.write(f"file '{clip_path_str}'\n")
+        write_concat_file(concat_file, adjusted_clips)
         
         # Step 3: Concat videos and add/mix audio
         success = concat_clips_with_audio(
             concat_file=concat_file,
             audio_path=Path(audio_path),
-            output_path=output_path
+            output_path=output_path,
+            project_id=project_id,
+            total_duration=total_duration,
+            preset=preset
         )
         
         if not success:
@@ -536,16 +1235,6 @@ def export_video_with_img2vid(
             if video_clips[i-1]["seq_id"] != video_clips[i]["seq_id"]
         )
         
-        # Cleanup temp files
-        try:
-            concat_file.unlink()
-        except:
-            pass
-        try:
-            temp_dir.rmdir()
-        except:
-            pass
-        
         # Return video URL relative to DATA
         rel_path = output_path.relative_to(DATA)
         video_url = f"/renders/{rel_path.as_posix()}"
@@ -574,3 +1263,7 @@ def export_video_with_img2vid(
     except Exception as e:
         update_export_status(project_id, "error", 0, 0, f"Export failed: {str(e)[:100]}")
         raise HTTPException(500, f"Export failed: {str(e)}")
+    finally:
+        # v1.8.8: One tree removal for all temp files, also after failed exports
+        # (still clips live in the clip cache, not in temp_dir)
+        discard_temp_dir(temp_dir)
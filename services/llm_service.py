@@ -3,43 +3,101 @@ LLM Service - v1.6.9
 Handles all LLM API calls (Claude, OpenAI) with cascade fallback.
 """
 
+import itertools
 import json
+import os
+import threading
 import time
-import requests
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from functools import partial
 from typing import Dict, Any, Optional
 from pathlib import Path
 from fastapi import HTTPException
 
 from .config import (
     CLAUDE_KEY, OPENAI_KEY, PATH_MANAGER,
-    require_key, track_cost
+    CLAUDE_SESSION, OPENAI_SESSION,
+    require_key, track_cost, enqueue_debug_log, log_llm_call
 )
 
+# v1.8.8: Endpoints are called through the pooled sessions in config, so cascade
+# retries and repair calls reuse one kept-alive TLS connection per host
+OPENAI_CHAT_COMPLETIONS = "https://api.openai.com/v1/chat/completions"
+CLAUDE_MESSAGES = "https://api.anthropic.com/v1/messages"
+
 
 # ========= JSON Extraction/Repair =========
 
+_JSON_DECODER = json.JSONDecoder()
+
+
+def parse_json_object(text: str) -> Optional[Dict[str, Any]]:
+    """
+    v1.8.8: Parse the first valid JSON object embedded in text.
+    raw_decode parses in C and reports where the object ends, so finding and
+    parsing the object is a single pass. Returns None if no object parses.
+    """
+    if not text:
+        return None
+    start = text.find("{")
+    while start != -1:
+        try:
+            return _JSON_DECODER.raw_decode(text, start)[0]
+        except json.JSONDecodeError:
+            start = text.find("{", start + 1)
+    return None
+
+
 def extract_json_object(text: str) -> str:
     """Extract first valid JSON object from text."""
     if not text:
         return ""
-    s = text.strip()
-    if s.startswith("{") and s.endswith("}"):
-        return s
-    start = s.find("{")
-    if start == -1:
-        return ""
-    depth = 0
-    for i in range(start, len(s)):
-        ch = s[i]
-        if ch == "{":
-            depth += 1
-        elif ch == "}":
-            depth -= 1
-            if depth == 0:
-                return s[start:i+1]
+    start = text.find("{")
+    while start != -1:
+        try:
+            end = _JSON_DECODER.raw_decode(text, start)[1]
+            return text[start:end]
+        except json.JSONDecodeError:
+            start = text.find("{", start + 1)
     return ""
 
 
+class JsonObjectScanner:
+    """
+    v1.8.8: Incremental brace-depth tracker for streamed text.
+    feed() returns True once the first top-level JSON object has closed.
+    Braces inside JSON strings are ignored.
+    """
+    
+    def __init__(self):
+        self.depth = 0
+        self.started = False
+        self.in_string = False
+        self.escaped = False
+    
+    def feed(self, chunk: str) -> bool:
+        for ch in chunk:
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == "{":
+                self.depth += 1
+                self.started = True
+            elif not self.started:
+                continue
+            elif ch == '"':
+                self.in_string = True
+            elif ch == "}":
+                self.depth -= 1
+                if self.depth == 0:
+                    return True
+        return False
+
+
 # ========= OpenAI API =========
 
 def call_openai_json(
@@ -50,7 +108,6 @@ def call_openai_json(
 ) -> Dict[str, Any]:
     """Call OpenAI API and return parsed JSON response."""
     require_key("OPENAI_KEY", OPENAI_KEY)
-    url = "https://api.openai.com/v1/chat/completions"
     headers = {
         "Authorization": f"Bearer {OPENAI_KEY}",
         "Content-Type": "application/json"
@@ -64,7 +121,7 @@ def call_openai_json(
             {"role": "user", "content": user}
         ],
     }
-    r = requests.post(url, headers=headers, json=payload, timeout=180)
+    r = OPENAI_SESSION.post(OPENAI_CHAT_COMPLETIONS, headers=headers, json=payload, timeout=180)
     if r.status_code >= 300:
         raise HTTPException(502, f"OpenAI failed: {r.status_code} {r.text}")
     txt = r.json()["choices"][0]["message"]["content"]
@@ -73,20 +130,25 @@ def call_openai_json(
 
 # ========= Claude API =========
 
+# v1.8.8: Number of claude_last_raw_*.txt dumps kept (oldest slot is overwritten)
+CLAUDE_RAW_DUMPS = 20
+_RAW_DUMP_SEQ = itertools.count()
+
 def call_claude_json(
     system: str, 
     user: str, 
     model: str = "claude-sonnet-4-5-20250929", 
     max_tokens: int = 5000,
-    temperature: float = 0.7
+    temperature: float = 0.7,
+    first_event: Optional[threading.Event] = None
 ) -> Dict[str, Any]:
     """Call Claude API and return parsed JSON response.
     
     Args:
         temperature: 0.7 default. Use 0.85-0.95 for regeneration variety.
+        first_event: Set when the first streamed event arrives (used for hedging).
     """
     require_key("CLAUDE_KEY", CLAUDE_KEY)
-    url = "https://api.anthropic.com/v1/messages"
     headers = {
         "x-api-key": CLAUDE_KEY,
         "anthropic-version": "2023-06-01",
@@ -98,29 +160,43 @@ def call_claude_json(
         "temperature": temperature,
         "system": system,
         "messages": [{"role": "user", "content": user}],
+        "stream": True,
     }
-    r = requests.post(url, headers=headers, json=payload, timeout=240)
-    if r.status_code >= 300:
-        raise HTTPException(502, f"Claude failed: {r.status_code} {r.text}")
-    
-    data = r.json()
-    blocks = data.get("content", [])
-    txt = "".join([b.get("text", "") for b in blocks if b.get("type") == "text"]).strip()
+    # v1.8.8: Stream the reply and hang up once the first JSON object is complete,
+    # so trailing commentary after the JSON is neither waited for nor generated
+    parts = []
+    scanner = JsonObjectScanner()
+    with CLAUDE_SESSION.post(CLAUDE_MESSAGES, headers=headers, json=payload, timeout=240, stream=True) as r:
+        if r.status_code >= 300:
+            raise HTTPException(502, f"Claude failed: {r.status_code} {r.text}")
+        for line in r.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            if first_event is not None:
+                first_event.set()
+            event = json.loads(line[5:])
+            if event.get("type") == "error":
+                raise HTTPException(502, f"Claude failed: {event.get('error')}")
+            if event.get("type") != "content_block_delta":
+                continue
+            text = event.get("delta", {}).get("text", "")
+            parts.append(text)
+            if scanner.feed(text):
+                break
+    txt = "".join(parts).strip()
     
     # Debug: save raw response to temp
-    try:
-        debug_file = PATH_MANAGER.create_temp_file(f"claude_last_raw_{int(time.time())}", ".txt")
-        debug_file.write_text(txt or "<EMPTY>", encoding="utf-8")
-    except Exception:
-        pass
+    # v1.8.8: Written by the background debug writer into a fixed ring of
+    # CLAUDE_RAW_DUMPS files, so the temp dir doesn't grow with every call
+    enqueue_debug_log(
+        PATH_MANAGER.temp_dir / f"claude_last_raw_{next(_RAW_DUMP_SEQ) % CLAUDE_RAW_DUMPS:02d}.txt",
+        txt or "<EMPTY>"
+    )
     
     # Try to extract JSON
-    js_txt = extract_json_object(txt)
-    if js_txt:
-        try:
-            return json.loads(js_txt)
-        except Exception:
-            pass
+    parsed = parse_json_object(txt)
+    if parsed is not None:
+        return parsed
     
     # Fallback: use OpenAI to repair JSON
     if OPENAI_KEY and txt:
@@ -142,6 +218,108 @@ CLAUDE_MODEL_CASCADE = [
     "claude-3-haiku-20240307",         # Fast fallback
 ]
 
+# v1.8.8: If a cascade model hasn't streamed its first event after this many
+# seconds, the next model is started alongside it and whichever returns JSON
+# first wins. A model that is streaming is never hedged, however long it runs.
+CLAUDE_HEDGE_SECONDS = float(os.environ.get("CLAUDE_HEDGE_SECONDS", "30"))
+
+
+def _track_hedge_loser(model: str, state: Optional[Dict], future) -> None:
+    """Record the cost of a hedged call that finished after another model won."""
+    if not future.cancelled() and future.exception() is None:
+        track_cost(model, 1, state=state, note="hedge_loser")
+        print(f"[INFO] Hedged {model} call finished after the race, cost tracked")
+
+
+def call_claude_cascade(
+    system: str,
+    user: str,
+    max_tokens: int = 5000,
+    state: Dict = None,
+    temperature: float = 0.7
+) -> Dict[str, Any]:
+    """
+    v1.8.8: Walk CLAUDE_MODEL_CASCADE with hedged requests.
+    
+    A failed model starts the next one immediately, and a model that has not
+    streamed anything after CLAUDE_HEDGE_SECONDS gets the next one started next
+    to it, so an overloaded model no longer holds the request for the full 240s
+    timeout. Once any running model is streaming, no further hedge is started.
+    Models are not all raced up front, as every started call is billed. A 400
+    (bad request) stops further models from starting, but calls already in
+    flight may still win. Raises the last error if every model fails.
+    
+    Calls that lose the race can't be aborted mid-request, so they run to
+    completion in the background; each one that completes successfully is
+    still recorded with track_cost (note "hedge_loser") so the ledger matches
+    what was billed. Failed calls are not tracked, as in the serial cascade.
+    """
+    models = iter(CLAUDE_MODEL_CASCADE)
+    running: Dict[Any, str] = {}
+    started: Dict[Any, float] = {}
+    streaming: Dict[Any, threading.Event] = {}
+    last_error = None
+    stop = False
+    pool = ThreadPoolExecutor(max_workers=len(CLAUDE_MODEL_CASCADE))
+    
+    def start_next() -> bool:
+        nonlocal stop
+        model = next(models, None)
+        if model is None:
+            stop = True  # Cascade exhausted, nothing left to hedge with
+            return False
+        print(f"[INFO] Calling Claude API with {model}...")
+        first_event = threading.Event()
+        future = pool.submit(call_claude_json, system, user, model=model, max_tokens=max_tokens,
+                             temperature=temperature, first_event=first_event)
+        running[future] = model
+        started[future] = time.monotonic()
+        streaming[future] = first_event
+        return True
+    
+    try:
+        start_next()
+        while running:
+            # Hedge window runs from the newest start; none while anything streams
+            if stop or any(streaming[f].is_set() for f in running):
+                timeout = None
+            else:
+                newest = max(started[f] for f in running)
+                timeout = max(0.0, newest + CLAUDE_HEDGE_SECONDS - time.monotonic())
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                if any(streaming[f].is_set() for f in running):
+                    continue
+                slow = ", ".join(running.values())
+                if start_next():
+                    print(f"[INFO] No response from {slow} after {CLAUDE_HEDGE_SECONDS:.0f}s, hedging with next model")
+                continue
+            for future in done:
+                model = running.pop(future)
+                try:
+                    result = future.result()
+                except HTTPException as e:
+                    last_error = e
+                    print(f"[WARN] {model} failed ({e.status_code}): {str(e.detail)[:100]}")
+                    if e.status_code == 400:
+                        stop = True
+                except Exception as e:
+                    last_error = HTTPException(502, str(e))
+                    print(f"[WARN] {model} failed: {str(e)[:100]}")
+                else:
+                    track_cost(model, 1, state=state)
+                    return result
+                if not stop:
+                    start_next()
+    finally:
+        # Don't block on hedged calls that lost the race; they finish in the
+        # background and are cost-tracked when they complete
+        for future, model in running.items():
+            future.add_done_callback(partial(_track_hedge_loser, model, state))
+        pool.shutdown(wait=False)
+    
+    raise last_error or HTTPException(502, "All Claude models failed")
+
 
 def call_llm_json(
     system: str, 
@@ -177,20 +355,10 @@ def call_llm_json(
     
     # Try Claude (either as primary or fallback)
     if CLAUDE_KEY:
-        for model in CLAUDE_MODEL_CASCADE:
-            try:
-                print(f"[INFO] Calling Claude API with {model}...")
-                result = call_claude_json(system, user, model=model, max_tokens=max_tokens, temperature=temperature)
-                track_cost(model, 1, state=state)
-                return result
-            except HTTPException as e:
-                last_error = e
-                print(f"[WARN] {model} failed ({e.status_code}): {str(e.detail)[:100]}")
-                if e.status_code == 400:
-                    break
-            except Exception as e:
-                last_error = HTTPException(502, str(e))
-                print(f"[WARN] {model} failed: {str(e)[:100]}")
+        try:
+            return call_claude_cascade(system, user, max_tokens=max_tokens, state=state, temperature=temperature)
+        except HTTPException as e:
+            last_error = e
     
     # Last resort: try OpenAI if we haven't already
     if preferred.lower() not in ["openai", "gpt"] and OPENAI_KEY:
@@ -226,17 +394,5 @@ def save_llm_debug(
     response: Any, 
     project_id: str = "unknown"
 ) -> None:
-    """Save LLM call for debugging."""
-    from .config import DEBUG_DIR
-    try:
-        ts = int(time.time())
-        log_file = DEBUG_DIR / f"{project_id}_llm_{ts}.json"
-        log_file.write_text(json.dumps({
-            "timestamp": ts,
-            "endpoint": endpoint,
-            "system_prompt": system,
-            "user_prompt": user,
-            "response": response,
-        }, indent=2, ensure_ascii=False), encoding="utf-8")
-    except Exception as e:
-        print(f"[WARN] Failed to log LLM call: {e}")
+    """Save LLM call for debugging (written in the background, see config.log_llm_call)."""
+    log_llm_call(endpoint, system, user, response, project_id=project_id)
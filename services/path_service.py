@@ -19,13 +19,17 @@ from typing import Any, Dict, Optional
 from .config import DATA, VERSION
 
 
+_FILENAME_INVALID_RE = re.compile(r'[^\w\s\-_.]')
+_FILENAME_SPACES_RE = re.compile(r'[\s]+')
+
+
 def sanitize_filename(name: str, max_length: int = 100) -> str:
     """
     Sanitize a string for use as a filename.
     Duplicated here to avoid circular import with project_service.
     """
-    safe = re.sub(r'[^\w\s\-_.]', '', name)
-    safe = re.sub(r'[\s]+', '_', safe)
+    safe = _FILENAME_INVALID_RE.sub('', name)
+    safe = _FILENAME_SPACES_RE.sub('_', safe)
     safe = safe.strip('_')
     if len(safe) > max_length:
         safe = safe[:max_length].rstrip('_')
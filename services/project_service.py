@@ -3,7 +3,9 @@ Fré Pathé v1.7 - Project Service
 Handles project CRUD, folder structure, and schema validation.
 """
 import json
+import os
 import re
+import threading
 import time
 import uuid
 from pathlib import Path
@@ -14,6 +16,12 @@ from fastapi import HTTPException
 from jsonschema import validate, ValidationError
 from PIL import Image
 
+# v1.8.8: orjson (Rust) for project.json - stdlib json is the fallback
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 from .config import (
     VERSION,
     PATH_MANAGER,
@@ -44,16 +52,21 @@ def create_thumbnail(image_path: Path, size=(400, 400)):
 
 # ========= Filename Sanitization =========
 
+# v1.8.8: Compiled once (sanitize_filename runs for every saved asset)
+_FILENAME_SEPS_RE = re.compile(r'[\s\-\.]+')
+_FILENAME_INVALID_RE = re.compile(r'[^a-zA-Z0-9_]')
+_FILENAME_UNDERSCORES_RE = re.compile(r'_+')
+
 def sanitize_filename(name: str, max_length: int = 50) -> str:
     """Convert string to safe filename: ASCII alphanumeric + underscore only."""
     if not name:
         return "unnamed"
     # Replace spaces and common separators with underscore
-    safe = re.sub(r'[\s\-\.]+', '_', name)
+    safe = _FILENAME_SEPS_RE.sub('_', name)
     # Keep only alphanumeric and underscore
-    safe = re.sub(r'[^a-zA-Z0-9_]', '', safe)
+    safe = _FILENAME_INVALID_RE.sub('', safe)
     # Remove consecutive underscores
-    safe = re.sub(r'_+', '_', safe)
+    safe = _FILENAME_UNDERSCORES_RE.sub('_', safe)
     # Strip leading/trailing underscores
     safe = safe.strip('_')
     # Truncate
@@ -331,6 +344,46 @@ def validate_project_state(state: Dict[str, Any], strict: bool = False) -> Tuple
 
 # ========= Project Persistence =========
 
+def strip_transient_keys(state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    v1.8.8: Shallow copy of state without "_" keys (in-memory caches/indices),
+    at the top level and on cast members.
+    """
+    state = {k: v for k, v in state.items() if not k.startswith("_")}
+    if isinstance(state.get("cast"), list):
+        state["cast"] = [
+            {k: v for k, v in c.items() if not k.startswith("_")} if isinstance(c, dict) else c
+            for c in state["cast"]
+        ]
+    return state
+
+
+def dump_project_json(state: Dict[str, Any]) -> bytes:
+    """
+    v1.8.8: Serialize project state to indented UTF-8 JSON.
+    Uses orjson when available; falls back to stdlib for values orjson rejects.
+    Transient "_" keys are skipped (see strip_transient_keys).
+    """
+    state = strip_transient_keys(state)
+    if orjson is not None:
+        try:
+            return orjson.dumps(state, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+        except TypeError as e:
+            print(f"[WARN] orjson could not serialize project, using json: {e}")
+    return json.dumps(state, indent=2, ensure_ascii=False).encode("utf-8")
+
+
+def load_project_json(path: Path) -> Dict[str, Any]:
+    """v1.8.8: Read a project JSON file (orjson when available)."""
+    raw = path.read_bytes()
+    if orjson is not None:
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            pass  # e.g. NaN written by older stdlib saves
+    return json.loads(raw.decode("utf-8"))
+
+
 def project_path(pid: str) -> Path:
     """
     LEGACY v1.8.0: Get path to loose UUID JSON file.
@@ -362,7 +415,7 @@ def load_project(pid: str) -> Dict[str, Any]:
     state = None
     
     if legacy_path.exists():
-        state = json.loads(legacy_path.read_text(encoding="utf-8"))
+        state = load_project_json(legacy_path)
         
         # Check if this project has a project_location with newer data
         project_location = state.get("project", {}).get("project_location")
@@ -370,7 +423,7 @@ def load_project(pid: str) -> Dict[str, Any]:
             project_json = Path(project_location) / "project.json"
             if project_json.exists():
                 # Load from project_location - it's the source of truth
-                location_state = json.loads(project_json.read_text(encoding="utf-8"))
+                location_state = load_project_json(project_json)
                 # Use the one with newer updated_at
                 state_updated = state.get("project", {}).get("updated_at", "")
                 loc_updated = location_state.get("project", {}).get("updated_at", "")
@@ -386,6 +439,9 @@ def load_project(pid: str) -> Dict[str, Any]:
     if not is_valid:
         print(f"[WARN] Project {pid} has validation errors: {errors}")
     
+    # v1.8.8: Replay shot render/edit patches not yet folded into project.json
+    replay_project_patches(state)
+    
     # Recover orphaned render files
     state = recover_orphaned_renders(state, pid)
     
@@ -525,14 +581,45 @@ def migrate_fal_to_local(state: Dict[str, Any]) -> Dict[str, Any]:
     return state
 
 
-def save_project(state: Dict[str, Any], validate: bool = True, force: bool = False) -> None:
+# v1.8.8: Versioned commits. Mutations happen under get_project_lock(pid) and end
+# with snapshot_project(), which bumps the revision and serializes.
+# The disk write then runs OUTSIDE the project lock via write_project_snapshot(),
+# which drops snapshots older than what is already on disk. Concurrent shot
+# renders only contend for the (tiny) patch + serialize window.
+# Revisions are allocated under the project's write lock, in the same critical
+# section that serializes the snapshot or appends the patch line, so a snapshot
+# at revision R contains every patch numbered <= R even for callers that don't
+# hold the project lock. The snapshot's revision is stored in project.json.
+PROJECT_REVISIONS: Dict[str, int] = {}
+WRITTEN_REVISIONS: Dict[str, int] = {}
+PROJECT_WRITE_LOCKS: Dict[str, threading.Lock] = {}
+PROJECT_WRITE_LOCKS_LOCK = threading.Lock()
+
+
+def get_project_write_lock(project_id: str) -> threading.Lock:
+    """Get or create the disk-write lock for a specific project."""
+    with PROJECT_WRITE_LOCKS_LOCK:
+        if project_id not in PROJECT_WRITE_LOCKS:
+            PROJECT_WRITE_LOCKS[project_id] = threading.Lock()
+        return PROJECT_WRITE_LOCKS[project_id]
+
+
+def next_project_revision(project_id: str) -> int:
     """
-    v1.8.5: Save project state to SINGLE location.
+    v1.8.8: Allocate the next revision (shared by full snapshots and patch log entries).
+    Caller holds get_project_write_lock(project_id).
+    """
+    revision = PROJECT_REVISIONS.get(project_id, 0) + 1
+    PROJECT_REVISIONS[project_id] = revision
+    return revision
+
+
+def snapshot_project(state: Dict[str, Any], validate: bool = True) -> Tuple[int, bytes]:
+    """
+    v1.8.8: Stamp, validate and serialize project state.
     
-    NEW BEHAVIOR:
-    - If project has project_location: save ONLY to {project_location}/project.json
-    - Legacy fallback: save to workspace/projects/{pid}.json (for old projects)
-    - NO MORE duplicate JSONs
+    Call while holding get_project_lock(pid) so the snapshot is consistent.
+    Returns (revision, serialized_json) for write_project_snapshot().
     """
     pid = state["project"]["id"]
     
@@ -550,23 +637,190 @@ def save_project(state: Dict[str, Any], validate: bool = True, force: bool = Fal
         if not is_valid:
             print(f"[WARN] Saving project {pid} with validation errors: {errors}")
     
+    with get_project_write_lock(pid):
+        revision = next_project_revision(pid)
+        state["project"]["revision"] = revision
+        if not state["project"].get("project_location"):
+            return revision, b""  # In-memory project, nothing to write yet
+        return revision, dump_project_json(state)
+
+
+def write_project_snapshot(state: Dict[str, Any], revision: int, payload: bytes) -> bool:
+    """
+    v1.8.8: Write a snapshot from snapshot_project() to disk.
+    
+    Safe to call without the project lock. A snapshot older than the one already
+    written is skipped (the newer one contains its changes). Returns True if written.
+    """
+    pid = state["project"]["id"]
     project_location = state.get("project", {}).get("project_location")
     
-    if project_location:
+    if not project_location:
+        # No project_location yet - project exists only in memory
+        # User must SAVE to set a location
+        print(f"[INFO] Project {pid} has no location yet - waiting for user to SAVE")
+        return False
+    
+    with get_project_write_lock(pid):
+        if revision <= WRITTEN_REVISIONS.get(pid, 0):
+            print(f"[SAVE] Skipped stale snapshot r{revision} for {pid} (r{WRITTEN_REVISIONS[pid]} on disk)")
+            return False
         # v1.8.5: Save ONLY to project_location/project.json - NOTHING in data/
         project_folder = Path(project_location)
         project_folder.mkdir(parents=True, exist_ok=True)
         project_json_path = project_folder / "project.json"
-        project_json_path.write_text(
-            json.dumps(state, indent=2, ensure_ascii=False), 
-            encoding="utf-8"
-        )
-        print(f"[SAVE] Project saved to: {project_json_path}")
-        # NO stub file - clean save to user location only
-    else:
-        # No project_location yet - project exists only in memory
-        # User must SAVE to set a location
-        print(f"[INFO] Project {pid} has no location yet - waiting for user to SAVE")
+        project_json_path.write_bytes(payload)
+        WRITTEN_REVISIONS[pid] = revision
+        _compact_patch_log(project_folder / PATCH_LOG_NAME, pid, revision)
+    
+    print(f"[SAVE] Project saved to: {project_json_path}")
+    return True
+
+
+# ========= v1.8.8: Append-only Patch Log =========
+# Shot render/edit commits append small "replace" ops to {project_location}/patches.jsonl
+# instead of rewriting project.json. load_project replays the log; every full
+# write folds it back in by dropping entries the snapshot already contains.
+# Replay skips entries at or below the revision stored in project.json; replace
+# ops are idempotent, so re-applying one that the snapshot also has is harmless.
+
+PATCH_LOG_NAME = "patches.jsonl"
+PATCH_COMPACT_THRESHOLD = 100
+PATCH_COUNTS: Dict[str, int] = {}
+
+
+def shot_render_patch(shot_id: str, render: Dict[str, Any]) -> Dict[str, Any]:
+    """Patch op replacing a shot's render object."""
+    return {"op": "replace", "path": f"/shots/{shot_id}/render", "value": render}
+
+
+def costs_patch(costs: Dict[str, Any]) -> Dict[str, Any]:
+    """Patch op replacing the project cost ledger."""
+    return {"op": "replace", "path": "/costs", "value": costs}
+
+
+def apply_project_patch(state: Dict[str, Any], patch: Dict[str, Any]) -> bool:
+    """Apply one patch op to state in place. Returns False for unknown ops/paths."""
+    if patch.get("op") != "replace":
+        return False
+    parts = (patch.get("path") or "").strip("/").split("/")
+    value = patch.get("value")
+    
+    if parts == ["costs"]:
+        state["costs"] = value
+        return True
+    if len(parts) == 3 and parts[0] == "shots" and parts[2] == "render":
+        for shot in state.get("storyboard", {}).get("shots", []):
+            if shot.get("shot_id") == parts[1]:
+                shot["render"] = value
+                return True
+    return False
+
+
+def append_project_patches(state: Dict[str, Any], patches: List[Dict[str, Any]]) -> bool:
+    """
+    v1.8.8: Persist patch ops (already applied to state in memory) to the log.
+    
+    Call while holding get_project_lock(pid). Each line is fsync'd.
+    Returns True when the log has grown past PATCH_COMPACT_THRESHOLD and the
+    caller should do a full snapshot_project() + write_project_snapshot().
+    """
+    pid = state["project"]["id"]
+    project_location = state.get("project", {}).get("project_location")
+    if not project_location:
+        return False  # In-memory project, nothing to write yet
+    
+    log_path = Path(project_location) / PATCH_LOG_NAME
+    with get_project_write_lock(pid):
+        lines = [
+            json.dumps(dict(patch, rev=next_project_revision(pid)), ensure_ascii=False) + "\n"
+            for patch in patches
+        ]
+        with open(log_path, "a", encoding="utf-8") as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        PATCH_COUNTS[pid] = PATCH_COUNTS.get(pid, 0) + len(lines)
+        return PATCH_COUNTS[pid] >= PATCH_COMPACT_THRESHOLD
+
+
+def replay_project_patches(state: Dict[str, Any]) -> int:
+    """
+    v1.8.8: Replay the patch log on top of a freshly loaded project.json.
+    Entries at or below the snapshot's stored revision are already in it and skipped.
+    """
+    pid = state.get("project", {}).get("id")
+    project_location = state.get("project", {}).get("project_location")
+    if not pid or not project_location:
+        return 0
+    snapshot_rev = int(state["project"].get("revision") or 0)
+    log_path = Path(project_location) / PATCH_LOG_NAME
+    
+    entries = 0
+    replayed = 0
+    max_rev = snapshot_rev
+    lines = log_path.read_text(encoding="utf-8").splitlines() if log_path.exists() else []
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            patch = json.loads(line)
+        except json.JSONDecodeError:
+            print(f"[WARN] Skipping corrupt patch log line for {pid}")
+            continue
+        rev = int(patch.get("rev", 0))
+        if rev <= snapshot_rev:
+            continue
+        entries += 1
+        if apply_project_patch(state, patch):
+            replayed += 1
+        max_rev = max(max_rev, rev)
+    
+    # Continue numbering after the snapshot and the replayed log
+    with get_project_write_lock(pid):
+        PROJECT_REVISIONS[pid] = max(PROJECT_REVISIONS.get(pid, 0), max_rev)
+        WRITTEN_REVISIONS[pid] = max(WRITTEN_REVISIONS.get(pid, 0), snapshot_rev)
+        PATCH_COUNTS[pid] = entries
+    if replayed:
+        print(f"[INFO] Replayed {replayed} patches for project {pid}")
+    return replayed
+
+
+def _compact_patch_log(log_path: Path, pid: str, revision: int) -> None:
+    """Drop log entries already contained in the snapshot written at `revision`. Caller holds write lock."""
+    if not log_path.exists():
+        PATCH_COUNTS[pid] = 0
+        return
+    try:
+        kept = []
+        for line in log_path.read_text(encoding="utf-8").splitlines():
+            try:
+                if int(json.loads(line).get("rev", 0)) > revision:
+                    kept.append(line + "\n")
+            except (json.JSONDecodeError, ValueError):
+                continue
+        if kept:
+            log_path.write_text("".join(kept), encoding="utf-8")
+        else:
+            log_path.unlink()
+        PATCH_COUNTS[pid] = len(kept)
+    except OSError as e:
+        print(f"[WARN] Patch log compaction failed for {pid}: {e}")
+
+
+def save_project(state: Dict[str, Any], validate: bool = True, force: bool = False) -> None:
+    """
+    v1.8.5: Save project state to SINGLE location.
+    
+    NEW BEHAVIOR:
+    - If project has project_location: save ONLY to {project_location}/project.json
+    - Legacy fallback: save to workspace/projects/{pid}.json (for old projects)
+    - NO MORE duplicate JSONs
+    
+    v1.8.8: Thin wrapper over snapshot_project() + write_project_snapshot().
+    """
+    revision, payload = snapshot_project(state, validate=validate)
+    write_project_snapshot(state, revision, payload)
 
 
 def new_project(
@@ -715,17 +969,18 @@ def safe_float(x, default=0.0) -> float:
         return float(default)
 
 
+_STRUCTURE_TYPE_RE = re.compile(r'^(intro|verse|prechorus|pre[- ]chorus|chorus|bridge|breakdown|outro|instrumental)')
+
 def normalize_structure_type(s: str) -> str:
     """Normalize structure type to standard values."""
     if not s:
         return "verse"
-    t = s.strip().lower()
-    for k in ["intro", "verse", "prechorus", "chorus", "bridge", "breakdown", "outro", "instrumental"]:
-        if t.startswith(k):
-            return k
-    if t.startswith("pre-chorus") or t.startswith("pre chorus"):
-        return "prechorus"
-    return "verse"
+    # v1.8.8: One anchored regex match instead of a startswith loop
+    m = _STRUCTURE_TYPE_RE.match(s.strip().lower())
+    if not m:
+        return "verse"
+    g = m.group(1)
+    return "prechorus" if g.startswith("pre") else g
 
 
 # ========= v1.8.5 Migration =========
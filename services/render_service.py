@@ -4,10 +4,11 @@ Handles image generation (txt2img, img2img), FAL API calls, and render managemen
 """
 import requests
 import json
+import mimetypes
 import time
 import fal_client
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 from fastapi import HTTPException
 
@@ -20,15 +21,19 @@ from .config import (
     FAL_SEEDREAM45_EDIT,
     FAL_FLUX2,
     FAL_FLUX2_EDIT,
+    FAL_STORAGE_INITIATE,
+    FAL_SESSION,
     MODEL_TO_ENDPOINT,
     fal_headers,
     require_key,
-    retry_on_502,
+    retry_on_502_call,
     track_cost,
     PATH_MANAGER,
+    RENDER_PATH_CACHE,
     locked_model_key,
     locked_editor_key,
 )
+from .cast_service import get_cast_refs_for_shot
 
 
 # ========= Debug Logging =========
@@ -157,7 +162,7 @@ def call_txt2img(
             raise HTTPException(r.status_code, f"txt2img failed: {r.status_code} {r.text[:500]}")
         return r
     
-    r = retry_on_502(do_request)()
+    r = retry_on_502_call(do_request)
     out = r.json()
     
     # Extract image URL from response
@@ -273,7 +278,7 @@ def call_img2img_editor(
             raise HTTPException(r.status_code, f"img2img editor failed: {r.status_code} {r.text[:500]}")
         return r
     
-    r = retry_on_502(do_request)()
+    r = retry_on_502_call(do_request)
     out = r.json()
     
     img_url = None
@@ -291,15 +296,32 @@ def call_img2img_editor(
 
 # ========= Render Path Resolution =========
 
+# v1.8.8: Only paths that exist are cached (RENDER_PATH_CACHE lives in config so
+# init_path_manager can clear it); a miss may resolve elsewhere once the file is written.
+RENDER_PATH_CACHE_MAX = 4096
+
+
 def resolve_render_path(url_or_path: str, state: Optional[Dict[str, Any]] = None) -> Path:
     """Resolve /renders/ URL or path to actual file path."""
+    project_location = ((state or {}).get("project") or {}).get("project_location") or ""
+    key = (url_or_path, project_location)
+    cached = RENDER_PATH_CACHE.get(key)
+    if cached is not None:
+        return cached  # Callers stat the result themselves
+    
     # v1.8.5: Use PATH_MANAGER with state for migrated project paths
     if url_or_path.startswith("/"):
         # It's a URL path - use PATH_MANAGER to convert
-        return PATH_MANAGER.from_url(url_or_path, state)
+        path = PATH_MANAGER.from_url(url_or_path, state)
     else:
         # It's a relative path - resolve relative to workspace root
-        return PATH_MANAGER.workspace_root / url_or_path
+        path = PATH_MANAGER.workspace_root / url_or_path
+    
+    if path.exists():
+        if len(RENDER_PATH_CACHE) >= RENDER_PATH_CACHE_MAX:
+            RENDER_PATH_CACHE.clear()
+        RENDER_PATH_CACHE[key] = path
+    return path
 
 
 # ========= Shot Render Helpers =========
@@ -358,6 +380,35 @@ def build_shot_prompt(
     return prompt
 
 
+def upload_file_to_fal(path) -> str:
+    """
+    v1.8.8: Upload a local file to the FAL CDN, streaming it from disk.
+    
+    fal_client.upload_file reads the whole file into memory before POSTing; here
+    the open file handle is passed as the request body so requests streams it
+    (Content-Length from fstat). Falls back to fal_client on any failure.
+    """
+    path = Path(path)
+    content_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+    try:
+        require_key("FAL_KEY", FAL_KEY)
+        r = FAL_SESSION.post(
+            FAL_STORAGE_INITIATE,
+            headers={"Authorization": f"Key {FAL_KEY}"},
+            json={"content_type": content_type, "file_name": path.name},
+            timeout=30,
+        )
+        r.raise_for_status()
+        target = r.json()
+        with open(path, "rb") as f:
+            put = FAL_SESSION.put(target["upload_url"], data=f, headers={"Content-Type": content_type}, timeout=300)
+        put.raise_for_status()
+        return target["file_url"]
+    except Exception as e:
+        print(f"[WARN] Streaming FAL upload failed for {path.name}, using fal_client: {e}")
+        return fal_client.upload_file(str(path))
+
+
 def upload_local_ref_to_fal(url: str, state: Optional[Dict[str, Any]] = None) -> str:
     """
     Upload local /files/ URL to FAL if needed. Returns FAL URL or original.
@@ -398,7 +449,7 @@ def upload_local_ref_to_fal(url: str, state: Optional[Dict[str, Any]] = None) ->
                 return url
             
             print(f"[INFO] Uploading ref to FAL: {local_path.name}")
-            fal_url = fal_client.upload_file(str(local_path))
+            fal_url = upload_file_to_fal(local_path)
             
             # Cache the result persistently in project state
             if state:
@@ -473,11 +524,8 @@ def get_shot_ref_images(
     # Note: Style lock is NOT included - it's only for cast ref generation
     
     # 1. Cast refs (ref_a for each cast member)
-    cast_ids = shot.get("cast", [])
-    char_refs = state.get("cast_matrix", {}).get("character_refs", {})
-    for cid in cast_ids:
-        ref_a = char_refs.get(cid, {}).get("ref_a")
-        if ref_a and ref_a not in refs:
+    for ref_a in get_cast_refs_for_shot(state, shot):
+        if ref_a not in refs:
             refs.append(ref_a)
     
     # 3. Scene decor
@@ -586,7 +634,7 @@ def call_t2i_with_retry(state: Dict[str, Any], prompt: str, image_size: str) ->
             return out["images"][0]["url"]
         raise HTTPException(502, "T2I returned no image url")
     
-    url = retry_on_502(do_request)()
+    url = retry_on_502_call(do_request)
     
     # Log the call
     project_id = (state or {}).get("project", {}).get("id", "unknown")
@@ -5,7 +5,7 @@ import json
 from pathlib import Path
 from typing import Any, Dict, Optional
 
-from .config import BASE, VERSION
+from .config import BASE, VERSION, init_path_manager
 
 # ========= Settings File =========
 SETTINGS_FILE = BASE / "settings.json"
@@ -109,7 +109,11 @@ def update_workspace_root(new_path: str) -> bool:
     settings = load_settings()
     settings["workspace_root"] = str(path)
     
-    return save_settings(settings)
+    if not save_settings(settings):
+        return False
+    # v1.8.8: Rebuild PATH_MANAGER for the new root (also drops cached render paths)
+    init_path_manager()
+    return True
 
 
 def validate_workspace_path(path: str) -> Dict[str, Any]:
@@ -156,12 +156,25 @@ def create_shot(
     }
 
 
+def get_shot_index(state: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    v1.8.8: {shot_id: shot} index, cached on the state under "_shots_by_id".
+    
+    Rebuilt when the shots list is replaced (storyboard rebuild, delete_shot)
+    or changes length. Underscore keys are transient and stripped on save.
+    """
+    shots = state.get("storyboard", {}).get("shots", [])
+    cached = state.get("_shots_by_id")
+    if cached and cached[0] is shots and cached[1] == len(shots):
+        return cached[2]
+    index = {s.get("shot_id"): s for s in shots}
+    state["_shots_by_id"] = (shots, len(shots), index)
+    return index
+
+
 def find_shot(state: Dict[str, Any], shot_id: str) -> Optional[Dict[str, Any]]:
     """Find a shot by ID."""
-    for shot in state.get("storyboard", {}).get("shots", []):
-        if shot.get("shot_id") == shot_id:
-            return shot
-    return None
+    return get_shot_index(state).get(shot_id)
 
 
 def update_shot(
@@ -15,6 +15,7 @@ from .config import (
 from .project_service import (
     get_project_video_dir, download_image_locally,
 )
+from .render_service import upload_file_to_fal
 
 
 # ========= Video Model Constants =========
@@ -113,7 +114,7 @@ def upload_image_to_fal(image_url: str, state: Optional[Dict[str, Any]] = None)
     # Upload to FAL
     try:
         print(f"[VIDEO] Uploading {image_url} to FAL...")
-        fal_url = fal_client.upload_file(image_url)
+        fal_url = upload_file_to_fal(image_url)
         
         # Store in cache (use /files/ URL format as key for consistency)
         if state: